@@ -1,126 +1,313 @@
 """
 Flask web application for Reservoir Dog
 """
-from flask import Flask, render_template, jsonify, send_from_directory, request
+from flask import Blueprint, Flask, Response, render_template, jsonify, send_from_directory, request
 from sqlalchemy import desc
 from datetime import datetime, timedelta
-from database import ReservoirData, Deployment, SessionLocal, init_db
+from database import Deployment, SessionLocal, dispose_engine, get_data_version, init_db
+from cache import ResponseCache, cached_view
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, instrument_app
+from downsample import DOWNSAMPLE_METHODS, downsample_series
+from serializers import BINARY_MIMETYPE, SERIES_FORMATS, compress_response, pack_series, series_columns, series_rows
+from rollups import ROLLUP_MODELS, choose_resolution, query_series, query_series_many, range_stats
+from stats import reservoir_stats
+from storage import get_store
+from stream import broadcaster, event_stream
 import config
 import os
 import subprocess
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+bp = Blueprint('main', __name__)
 
-# Disable template caching in development
-if config.ENVIRONMENT == 'dev':
-    app.config['TEMPLATES_AUTO_RELOAD'] = True
-    app.jinja_env.auto_reload = True
+# Cache for reservoir API responses; entries are dropped when the collector stores new data
+api_cache = ResponseCache(
+    max_entries=config.API_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.API_CACHE_TTL_SECONDS,
+)
+cached_api = cached_view(api_cache, get_data_version)
 
+REGISTRY.callback(
+    'rdog_api_cache_lookups_total', 'API response cache lookups by result',
+    lambda: [({'result': 'hit'}, api_cache.hits), ({'result': 'miss'}, api_cache.misses)],
+    kind='counter', labelnames=('result',),
+)
+REGISTRY.callback('rdog_api_cache_entries', 'API response cache entries', lambda: [({}, api_cache.stats()['entries'])])
+REGISTRY.callback('rdog_stream_clients', 'Open /api/stream connections', lambda: [({}, broadcaster.stats()['subscribers'])])
 
-@app.route('/')
+
+@bp.after_request
+def compress(response):
+    """Negotiate gzip/brotli for API responses"""
+    return compress_response(response, request.headers.get('Accept-Encoding'),
+                             config.RESPONSE_COMPRESSION_MIN_BYTES)
+
+
+@bp.route('/')
 def index():
     """Main dashboard page"""
     return render_template('index.html', reservoirs=config.RESERVOIRS)
 
 
-@app.route('/api/reservoirs')
+@bp.route('/api/reservoirs')
 def get_reservoirs():
     """API endpoint to get list of reservoirs"""
     return jsonify(config.RESERVOIRS)
 
 
-@app.route('/api/reservoir/<reservoir_code>/latest')
+def _latest_payload(latest):
+    """JSON payload for a single latest reading"""
+    return {
+        'reservoir_code': latest.reservoir_code,
+        'timestamp': latest.timestamp.isoformat(),
+        'reservoir_elevation': latest.reservoir_elevation,
+        'storage': latest.storage,
+        'storage_percent': latest.storage_percent,
+        'data_source': latest.data_source
+    }
+
+
+def _parse_cursor(value):
+    """A since cursor: an ISO timestamp, or epoch seconds as in columnar/binary timestamps"""
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except (ValueError, OverflowError, OSError):  # OSError: epoch out of the platform's range
+        return datetime.fromisoformat(value)
+
+
+def _series_params():
+    """
+    Parse the query parameters shared by the time-series endpoints
+    Returns: (params, error_response); exactly one of them is None
+    """
+    days = int(request.args.get('days', 30))
+    resolution = request.args.get('resolution', 'auto')
+    if resolution == 'auto':
+        resolution = choose_resolution(days)
+    elif resolution not in ('raw',) + tuple(ROLLUP_MODELS):
+        return None, (jsonify({'error': f'Unknown resolution: {resolution}'}), 400)
+    method = request.args.get('downsample', 'lttb')
+    if method not in DOWNSAMPLE_METHODS:
+        return None, (jsonify({'error': f'Unknown downsampling method: {method}'}), 400)
+    series_format = request.args.get('format', 'rows')
+    if series_format not in SERIES_FORMATS:
+        return None, (jsonify({'error': f'Unknown format: {series_format}'}), 400)
+    since = request.args.get('since')
+    if since:
+        try:
+            since = _parse_cursor(since)
+        except ValueError:
+            return None, (jsonify({'error': f'Invalid since cursor: {since}'}), 400)
+    
+    start_date = datetime.utcnow() - timedelta(days=days)
+    return {
+        'start_date': max(start_date, since) if since else start_date,
+        'since': since or None,
+        'resolution': resolution,
+        'max_points': request.args.get('max_points', type=int),
+        'method': method,
+        'format': series_format,
+    }, None
+
+
+def _next_cursor(data_points, params):
+    """
+    Cursor for the next incremental request: the newest point's timestamp
+    Deltas include points at the cursor itself, so a rollup bucket that was still filling
+    is sent again; clients replace points with the same timestamp.
+    """
+    if data_points:
+        return data_points[-1][0].isoformat()
+    return params['since'].isoformat() if params['since'] else None
+
+
+def _prepare_series(data_points, params):
+    """Apply downsampling to a queried series"""
+    if params['max_points']:
+        return downsample_series(data_points, max(params['max_points'], 3), params['method'])
+    return data_points
+
+
+def _requested_codes():
+    """Reservoir codes from ?codes=A,B (default: all configured reservoirs)"""
+    codes = request.args.get('codes')
+    if not codes:
+        return list(config.RESERVOIRS.keys())
+    return [code.strip().upper() for code in codes.split(',') if code.strip()]
+
+
+@bp.route('/api/reservoir/<reservoir_code>/latest')
+@cached_api
 def get_latest_data(reservoir_code):
     """Get latest data for a reservoir"""
     db = SessionLocal()
     try:
-        latest = db.query(ReservoirData).filter(
-            ReservoirData.reservoir_code == reservoir_code
-        ).order_by(desc(ReservoirData.timestamp)).first()
+        latest = get_store().latest(db, [reservoir_code])[reservoir_code]
         
         if not latest:
             return jsonify({'error': 'No data found'}), 404
         
-        return jsonify({
-            'reservoir_code': latest.reservoir_code,
-            'timestamp': latest.timestamp.isoformat(),
-            'reservoir_elevation': latest.reservoir_elevation,
-            'storage': latest.storage,
-            'storage_percent': latest.storage_percent,
-            'data_source': latest.data_source
-        })
+        return jsonify(_latest_payload(latest))
     finally:
         db.close()
 
 
-@app.route('/api/reservoir/<reservoir_code>/data')
+@bp.route('/api/reservoir/<reservoir_code>/data')
+@cached_api
 def get_reservoir_data(reservoir_code):
-    """Get time-series data for a reservoir"""
+    """
+    Get time-series data for a reservoir
+    Long ranges are served from rollup tables; pass resolution=raw|hour|day|month to override.
+    max_points caps the number of points returned (downsample=lttb|minmax picks the method).
+    since=<next_cursor of an earlier response> returns only points from that timestamp on.
+    format=columnar returns parallel arrays with epoch-second timestamps; format=binary returns
+    packed float64 arrays (layout in serializers.py).
+    """
+    params, error = _series_params()
+    if error:
+        return error
+    
     db = SessionLocal()
     try:
-        # Get query parameters
-        days = int(request.args.get('days', 30))
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        data_points = db.query(ReservoirData).filter(
-            ReservoirData.reservoir_code == reservoir_code,
-            ReservoirData.timestamp >= start_date
-        ).order_by(ReservoirData.timestamp).all()
+        data_points = query_series(db, reservoir_code, params['start_date'], params['resolution'])
+        next_cursor = _next_cursor(data_points, params)
+        data_points = _prepare_series(data_points, params)
         
+        if params['format'] == 'binary':
+            response = Response(pack_series(data_points), mimetype=BINARY_MIMETYPE)
+            response.headers['X-Resolution'] = params['resolution']
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return response
+        if params['format'] == 'columnar':
+            return jsonify({
+                'reservoir_code': reservoir_code,
+                'resolution': params['resolution'],
+                'format': 'columnar',
+                'columns': series_columns(data_points),
+                'next_cursor': next_cursor
+            })
         return jsonify({
             'reservoir_code': reservoir_code,
-            'data': [{
-                'timestamp': d.timestamp.isoformat(),
-                'reservoir_elevation': d.reservoir_elevation,
-                'storage': d.storage,
-                'storage_percent': d.storage_percent
-            } for d in data_points]
+            'resolution': params['resolution'],
+            'data': series_rows(data_points),
+            'next_cursor': next_cursor
         })
     finally:
         db.close()
 
 
-@app.route('/api/reservoir/<reservoir_code>/stats')
-def get_reservoir_stats(reservoir_code):
-    """Get statistics for a reservoir"""
+@bp.route('/api/reservoirs/latest')
+@cached_api
+def get_latest_data_batch():
+    """Latest data for several reservoirs (?codes=BER,ORO; default all) in one query"""
+    codes = _requested_codes()
+    db = SessionLocal()
+    try:
+        latest = get_store().latest(db, codes)
+        return jsonify({
+            'reservoirs': {
+                code: _latest_payload(row) if row else None
+                for code, row in latest.items()
+            }
+        })
+    finally:
+        db.close()
+
+
+@bp.route('/api/stream')
+def stream_readings():
+    """Server-Sent Events stream of newly stored readings (?codes=BER,ORO; default all)"""
+    subscriber = broadcaster.subscribe(_requested_codes())
+    if subscriber is None:
+        # Clients fall back to polling the JSON endpoints
+        return jsonify({'error': 'Too many open streams'}), 503
+    response = Response(event_stream(broadcaster, subscriber), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # don't let nginx buffer the stream
+    })
+    response.call_on_close(lambda: broadcaster.unsubscribe(subscriber))
+    return response
+
+
+@bp.route('/api/reservoirs/data')
+@cached_api
+def get_reservoir_data_batch():
+    """
+    Time-series data for several reservoirs (?codes=BER,ORO&days=N; default all) in one query
+    Accepts the same resolution, max_points, downsample and format (rows|columnar) options as
+    /api/reservoir/<code>/data; max_points applies to each reservoir. With since, every
+    reservoir's delta starts at that cursor and carries its own next_cursor.
+    """
+    params, error = _series_params()
+    if error:
+        return error
+    if params['format'] == 'binary':
+        return jsonify({'error': 'format=binary is only available per reservoir'}), 400
+    
+    codes = _requested_codes()
     db = SessionLocal()
     try:
-        # Get last 365 days of data
-        start_date = datetime.utcnow() - timedelta(days=365)
-        data_points = db.query(ReservoirData).filter(
-            ReservoirData.reservoir_code == reservoir_code,
-            ReservoirData.timestamp >= start_date
-        ).all()
+        series = query_series_many(db, codes, params['start_date'], params['resolution'])
+        reservoirs = {}
+        for code, data_points in series.items():
+            next_cursor = _next_cursor(data_points, params)
+            data_points = _prepare_series(data_points, params)
+            if params['format'] == 'columnar':
+                reservoirs[code] = {'format': 'columnar', 'columns': series_columns(data_points)}
+            else:
+                reservoirs[code] = {'data': series_rows(data_points)}
+            reservoirs[code]['next_cursor'] = next_cursor
         
-        if not data_points:
+        return jsonify({
+            'resolution': params['resolution'],
+            'reservoirs': reservoirs
+        })
+    finally:
+        db.close()
+
+
+@bp.route('/api/reservoir/<reservoir_code>/stats')
+@cached_api
+def get_reservoir_stats(reservoir_code):
+    """Get statistics for a reservoir: last-year range, percentiles, historical norms and year-over-year change"""
+    db = SessionLocal()
+    try:
+        latest = get_store().latest(db, [reservoir_code])[reservoir_code]
+        if not latest:
             return jsonify({'error': 'No data found'}), 404
         
-        storages = [d.storage for d in data_points if d.storage]
-        elevations = [d.reservoir_elevation for d in data_points if d.reservoir_elevation]
+        # The year up to the latest reading, aggregated from daily rollups
+        stats = range_stats(db, reservoir_code, latest.timestamp - timedelta(days=365))
+        data_points = stats.pop('data_points')
         
         return jsonify({
             'reservoir_code': reservoir_code,
             'current': {
-                'storage': data_points[-1].storage if data_points else None,
-                'elevation': data_points[-1].reservoir_elevation if data_points else None,
-                'timestamp': data_points[-1].timestamp.isoformat() if data_points else None
-            },
-            'stats': {
-                'min_storage': min(storages) if storages else None,
-                'max_storage': max(storages) if storages else None,
-                'avg_storage': sum(storages) / len(storages) if storages else None,
-                'min_elevation': min(elevations) if elevations else None,
-                'max_elevation': max(elevations) if elevations else None,
-                'avg_elevation': sum(elevations) / len(elevations) if elevations else None,
+                'storage': latest.storage,
+                'elevation': latest.reservoir_elevation,
+                'timestamp': latest.timestamp.isoformat()
             },
-            'data_points': len(data_points)
+            'stats': stats,
+            **reservoir_stats(db, reservoir_code, latest.storage, latest.timestamp.date()),
+            'data_points': data_points
         })
     finally:
         db.close()
 
 
-@app.route('/images/<path:filename>')
+@bp.route('/api/cache/stats')
+def get_cache_stats():
+    """API endpoint exposing response cache hit/miss counters"""
+    return jsonify(api_cache.stats())
+
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@bp.route('/images/<path:filename>')
 def serve_image(filename):
     """Serve images from references/images directory"""
     return send_from_directory(
@@ -171,7 +358,7 @@ def record_deployment(environment, commit_sha=None, commit_message=None, branch=
         return None
 
 
-@app.route('/deployments')
+@bp.route('/deployments')
 def deployments():
     """Deployments page showing deployment history"""
     db = SessionLocal()
@@ -191,7 +378,7 @@ def deployments():
         db.close()
 
 
-@app.route('/api/deployments')
+@bp.route('/api/deployments')
 def get_deployments():
     """API endpoint to get deployment history"""
     db = SessionLocal()
@@ -221,11 +408,34 @@ def get_deployments():
         db.close()
 
 
+def create_app():
+    """
+    Application factory
+    Each WSGI worker builds its own app and starts with an empty connection pool,
+    so no database connections are shared across fork (see gunicorn.conf.py).
+    """
+    dispose_engine()
+    
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    
+    # Disable template caching in development
+    if config.ENVIRONMENT == 'dev':
+        app.config['TEMPLATES_AUTO_RELOAD'] = True
+        app.jinja_env.auto_reload = True
+    
+    app.register_blueprint(bp)
+    if config.METRICS_ENABLED:
+        instrument_app(app)
+    return app
+
+
 if __name__ == '__main__':
     # Initialize database
     init_db()
     
-    # Run the app
+    # Run the development server (production uses gunicorn, see gunicorn.conf.py)
+    app = create_app()
     app.run(
         host=config.FLASK_HOST,
         port=config.FLASK_PORT,
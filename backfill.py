@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Historical backfill for reservoir data from the CDEC CSV data service
+
+Splits the requested date range into windows per reservoir, fetches windows in
+parallel and stores each one as soon as it arrives. Finished windows are
+checkpointed in the backfill_checkpoints table, so an interrupted run picks up
+where it stopped and never re-downloads a window it already has.
+
+Usage:
+    python backfill.py                      # all reservoirs from BACKFILL_START_DATE
+    python backfill.py --codes BER --start 1997-01-01 --workers 8
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+import logging
+import sys
+
+from collector import ReservoirCollector
+from database import BackfillCheckpoint, SessionLocal, configure_engine, init_db
+import config
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def plan_windows(start, end, window_days):
+    """
+    Split [start, end] into consecutive day-aligned windows
+    Returns: list of (window_start, window_end) with inclusive end dates
+    """
+    windows = []
+    window_start = datetime(start.year, start.month, start.day)
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=window_days - 1), end)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
+
+
+def completed_windows(codes):
+    """Load checkpointed windows as a set of (reservoir_code, window_start, window_end)"""
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            BackfillCheckpoint.reservoir_code,
+            BackfillCheckpoint.window_start,
+            BackfillCheckpoint.window_end,
+        ).filter(BackfillCheckpoint.reservoir_code.in_(codes)).all()
+        return {tuple(row) for row in rows}
+    finally:
+        db.close()
+
+
+def record_checkpoint(code, window_start, window_end, rows_fetched):
+    """Mark a window as fetched and stored"""
+    db = SessionLocal()
+    try:
+        db.add(BackfillCheckpoint(
+            reservoir_code=code,
+            window_start=window_start,
+            window_end=window_end,
+            rows_fetched=rows_fetched,
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_backfill(codes=None, start=None, end=None, window_days=None, workers=None, collector=None):
+    """
+    Backfill daily history for reservoirs
+    At most `workers` windows are in flight at once and each window is written
+    before its readings are released, so memory stays bounded however long the range.
+    Returns: dict with counts of windows planned, skipped, stored and failed, and rows inserted
+    """
+    codes = codes or list(config.RESERVOIRS.keys())
+    start = start or datetime.strptime(config.BACKFILL_START_DATE, '%Y-%m-%d')
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    end = end or today
+    window_days = window_days or config.BACKFILL_WINDOW_DAYS
+    workers = workers or config.BACKFILL_WORKERS
+    collector = collector or ReservoirCollector(max_workers=workers)
+    
+    done = completed_windows(codes)
+    pending = []
+    summary = {'planned': 0, 'skipped': 0, 'stored': 0, 'failed': 0, 'rows_inserted': 0}
+    for code in codes:
+        for window_start, window_end in plan_windows(start, end, window_days):
+            summary['planned'] += 1
+            if (code, window_start, window_end) in done:
+                summary['skipped'] += 1
+            else:
+                pending.append((code, window_start, window_end))
+    
+    logger.info(f"Backfill: {summary['planned']} window(s) planned, "
+                f"{summary['skipped']} already stored, {len(pending)} to fetch")
+    
+    def fetch(task):
+        code, window_start, window_end = task
+        return collector.collect_cdec_historical(code, window_start, window_end)
+    
+    tasks = iter(pending)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill') as executor:
+        in_flight = {}
+        for task in tasks:
+            in_flight[executor.submit(fetch, task)] = task
+            if len(in_flight) >= workers:
+                break
+        
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                code, window_start, window_end = in_flight.pop(future)
+                readings = future.result()
+                if readings is None:
+                    summary['failed'] += 1
+                    logger.warning(f"Backfill window {code} {window_start:%Y-%m-%d}..{window_end:%Y-%m-%d} failed")
+                else:
+                    inserted = collector.save_batch(
+                        [(code, timestamp, res_ele, storage) for timestamp, res_ele, storage in readings]
+                    )
+                    if inserted is None:
+                        summary['failed'] += 1
+                    else:
+                        summary['rows_inserted'] += inserted
+                        summary['stored'] += 1
+                        # The window containing today is still filling in; fetch it again next time
+                        if window_end < today:
+                            record_checkpoint(code, window_start, window_end, len(readings))
+                
+                next_task = next(tasks, None)
+                if next_task is not None:
+                    in_flight[executor.submit(fetch, next_task)] = next_task
+    
+    logger.info(f"Backfill finished: {summary}")
+    return summary
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backfill historical reservoir data from CDEC')
+    parser.add_argument('--codes', nargs='+', choices=sorted(config.RESERVOIRS.keys()),
+                        help='Reservoir codes to backfill (default: all)')
+    parser.add_argument('--start', type=_parse_date, help=f'Start date YYYY-MM-DD (default: {config.BACKFILL_START_DATE})')
+    parser.add_argument('--end', type=_parse_date, help='End date YYYY-MM-DD (default: today)')
+    parser.add_argument('--window-days', type=int, help=f'Days per request (default: {config.BACKFILL_WINDOW_DAYS})')
+    parser.add_argument('--workers', type=int, help=f'Windows fetched in parallel (default: {config.BACKFILL_WORKERS})')
+    args = parser.parse_args(argv)
+    
+    configure_engine('cli')
+    init_db()
+    summary = run_backfill(args.codes, args.start, args.end, args.window_days, args.workers)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
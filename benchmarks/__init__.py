@@ -0,0 +1,4 @@
+"""
+Performance benchmarks for Reservoir Dog
+Run from the repository root, e.g. `python -m benchmarks.bench_cdec_parser`
+"""
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+API latency under load on synthetic history
+
+Fills a throwaway database with synthetic.py (N reservoirs x M years plus
+deployment records), starts the web server on it, and drives the reservoir
+endpoints and /api/deployments from concurrent keep-alive clients. Reports
+p50/p95/p99/max latency per endpoint and the server's memory (resident set of
+the server process and its workers, before load and at its peak during load,
+read from /proc so Linux only).
+
+The API response cache is disabled (API_CACHE_TTL_SECONDS=0) unless --cache is
+given, so every request runs its queries. Results can be written as JSON, tagged
+with the current commit, for comparing runs across commits.
+
+Usage:
+    python -m benchmarks.bench_api --reservoirs 4 --years 20 --json api-$(git rev-parse --short HEAD).json
+    python -m benchmarks.bench_api --database /tmp/history.db --server dev --concurrency 4
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+from benchmarks.bench_http_load import ROOT, _free_port, _wait_for_port
+
+# (label, path) pairs; {code} is filled in round-robin from the synthetic reservoirs
+ENDPOINTS = [
+    ('latest', '/api/reservoir/{code}/latest'),
+    ('data_7d', '/api/reservoir/{code}/data?days=7'),
+    ('data_365d', '/api/reservoir/{code}/data?days=365'),
+    ('data_3650d', '/api/reservoir/{code}/data?days=3650&max_points=1000'),
+    ('stats', '/api/reservoir/{code}/stats'),
+    ('deployments', '/api/deployments'),
+]
+
+
+def reservoir_codes(count):
+    """Codes synthetic.py generates for `count` reservoirs (read in a subprocess so no engine is opened here)"""
+    output = subprocess.check_output(
+        [sys.executable, '-c', f'from synthetic import reservoir_codes; print(",".join(reservoir_codes({count})))'],
+        cwd=ROOT, text=True)
+    return output.strip().split(',')
+
+
+def generate(database_url, args):
+    """Run synthetic.py against database_url; returns seconds taken"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, 'synthetic.py', '--reservoirs', str(args.reservoirs), '--years', str(args.years),
+                    '--interval-hours', str(args.interval_hours), '--deployments', str(args.deployments)],
+                   cwd=ROOT, env=dict(os.environ, DATABASE_URL=database_url), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def process_tree_rss(pid):
+    """Resident set size in MB of pid and its descendants (None where /proc is unavailable)"""
+    try:
+        parents = {}
+        for entry in Path('/proc').iterdir():
+            if entry.name.isdigit():
+                try:
+                    stat = (entry / 'stat').read_text()
+                except OSError:
+                    continue
+                parents[int(entry.name)] = int(stat.rsplit(')', 1)[1].split()[1])
+        tree, frontier = {pid}, [pid]
+        while frontier:
+            children = [child for child, parent in parents.items() if parent in frontier]
+            tree.update(children)
+            frontier = children
+        total_kb = 0
+        for member in tree:
+            try:
+                for line in Path(f'/proc/{member}/status').read_text().splitlines():
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+            except OSError:
+                continue
+        return total_kb / 1024
+    except OSError:
+        return None
+
+
+def run_load(base_url, codes, concurrency, duration):
+    """
+    Request every endpoint for every code round-robin from `concurrency` threads
+    Returns: dict mapping endpoint label to {requests, errors, p50_ms, p95_ms, p99_ms, max_ms}
+    """
+    targets = [(label, path.format(code=code)) for code in codes for label, path in ENDPOINTS
+               if '{code}' in path or code == codes[0]]
+    latencies = {label: [] for label, _ in ENDPOINTS}
+    errors = {label: 0 for label, _ in ENDPOINTS}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    
+    def client(offset):
+        session = requests.Session()
+        local = {label: [] for label in latencies}
+        local_errors = {label: 0 for label in errors}
+        i = offset
+        while time.monotonic() < deadline:
+            label, path = targets[i % len(targets)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                response = session.get(base_url + path, timeout=60)
+                if response.status_code >= 400:
+                    local_errors[label] += 1
+            except requests.RequestException:
+                local_errors[label] += 1
+                continue
+            local[label].append(time.perf_counter() - started)
+        with lock:
+            for label in latencies:
+                latencies[label].extend(local[label])
+                errors[label] += local_errors[label]
+    
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    results = {}
+    for label, samples in latencies.items():
+        samples = np.array(samples) * 1000 if samples else np.zeros(1)
+        results[label] = {
+            'requests': len(latencies[label]),
+            'errors': errors[label],
+            'p50_ms': float(np.percentile(samples, 50)),
+            'p95_ms': float(np.percentile(samples, 95)),
+            'p99_ms': float(np.percentile(samples, 99)),
+            'max_ms': float(samples.max()),
+        }
+    return results
+
+
+def serve_and_load(database_url, codes, args):
+    """Start the server on database_url, warm it up, load it, and sample its memory"""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, FLASK_HOST='127.0.0.1', FLASK_PORT=str(port),
+               FLASK_DEBUG='False', WEB_WORKERS=str(args.workers), METRICS_ENABLED='False')
+    if not args.cache:
+        env['API_CACHE_TTL_SECONDS'] = '0'
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    else:
+        command = [sys.executable, 'app.py']
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        try:
+            _wait_for_port(port)
+        except RuntimeError:
+            log.seek(0)
+            sys.stderr.write(log.read().decode(errors='replace'))
+            raise
+        base_url = f'http://127.0.0.1:{port}'
+        run_load(base_url, codes, args.concurrency, 1)  # warm up connections and per-process caches
+        memory = {'rss_mb_idle': process_tree_rss(process.pid), 'rss_mb_peak': None}
+        
+        stop = threading.Event()
+        
+        def sample_memory():
+            while not stop.wait(0.5):
+                rss = process_tree_rss(process.pid)
+                if rss is not None:
+                    memory['rss_mb_peak'] = max(memory['rss_mb_peak'] or 0, rss)
+        
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+        try:
+            results = run_load(base_url, codes, args.concurrency, args.duration)
+        finally:
+            stop.set()
+            sampler.join()
+        return results, memory
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        log.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API latency and memory on synthetic history')
+    parser.add_argument('--reservoirs', type=int, default=4, help='Synthetic reservoirs')
+    parser.add_argument('--years', type=float, default=10, help='Years of history per reservoir')
+    parser.add_argument('--interval-hours', type=float, default=1, help='Hours between synthetic readings')
+    parser.add_argument('--deployments', type=int, default=200, help='Synthetic deployment records')
+    parser.add_argument('--database', help='Reuse (or create once) this SQLite file instead of a temporary one')
+    parser.add_argument('--server', choices=['gunicorn', 'dev'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load')
+    parser.add_argument('--cache', action='store_true', help='Keep the API response cache enabled')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory(prefix='reservoirdog-bench-') as directory:
+        path = Path(args.database) if args.database else Path(directory) / 'history.db'
+        database_url = f'sqlite:///{path.resolve()}'
+        generate_seconds = None
+        if not path.exists():
+            print(f"Generating {args.reservoirs} reservoirs x {args.years:g} years into {path}...")
+            generate_seconds = generate(database_url, args)
+        codes = reservoir_codes(args.reservoirs)
+        results, memory = serve_and_load(database_url, codes, args)
+        database_mb = path.stat().st_size / 1024 / 1024
+    
+    print(f"{'endpoint':<12} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, r in results.items():
+        print(f"{label:<12} {r['requests']:>8} {r['errors']:>6} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+    print(f"server RSS: {memory['rss_mb_idle'] or 0:.1f} MB idle, {memory['rss_mb_peak'] or 0:.1f} MB peak under load; "
+          f"database {database_mb:.1f} MB")
+    
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            'commit': _git_commit(),
+            'run_at': datetime.utcnow().isoformat(),
+            'parameters': {name: value for name, value in vars(args).items() if name != 'json'},
+            'generate_seconds': generate_seconds,
+            'database_mb': database_mb,
+            'memory': memory,
+            'endpoints': results,
+        }, indent=2) + '\n')
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: CDEC QueryF parsing
+
+Compares the lxml tail-scan parser in parsers.py with the BeautifulSoup
+html.parser approach the collector used before, on the saved fixture pages.
+
+Usage:
+    python -m benchmarks.bench_cdec_parser [--repeat 50]
+"""
+import argparse
+from pathlib import Path
+import timeit
+
+from bs4 import BeautifulSoup
+
+from parsers import parse_cdec_query_table, parse_cdec_timestamp
+
+FIXTURE_DIR = Path(__file__).resolve().parent.parent / 'fixtures' / 'cdec'
+
+
+def legacy_parse_cdec_query_table(text):
+    """The previous collector implementation: full BeautifulSoup tree, reverse row walk"""
+    soup = BeautifulSoup(text, 'html.parser')
+    tables = soup.find_all('table')
+    if not tables:
+        return None
+    
+    rows = tables[-1].find_all('tr')
+    for row in reversed(rows):
+        cells = row.find_all('td')
+        if len(cells) >= 3:
+            timestamp_str = cells[0].get_text(strip=True)
+            elevation_str = cells[1].get_text(strip=True)
+            storage_str = cells[2].get_text(strip=True)
+            if elevation_str == '--' or storage_str == '--':
+                continue
+            try:
+                return (parse_cdec_timestamp(timestamp_str),
+                        float(elevation_str.replace(',', '')),
+                        float(storage_str.replace(',', '')))
+            except ValueError:
+                continue
+    return None
+
+
+def run(repeat):
+    pages = sorted(FIXTURE_DIR.glob('QueryF_*.html'))
+    if not pages:
+        raise SystemExit(f"No fixture pages found in {FIXTURE_DIR}")
+    
+    print(f"{'page':<20} {'size':>9} {'bs4 (ms)':>10} {'lxml (ms)':>10} {'speedup':>8}")
+    for page in pages:
+        content = page.read_bytes()
+        text = content.decode('utf-8')
+        
+        expected = legacy_parse_cdec_query_table(text)
+        actual = parse_cdec_query_table(content)
+        if expected != actual:
+            raise SystemExit(f"Parser mismatch on {page.name}: {expected} != {actual}")
+        
+        legacy = min(timeit.repeat(lambda: legacy_parse_cdec_query_table(text), number=1, repeat=repeat))
+        current = min(timeit.repeat(lambda: parse_cdec_query_table(content), number=1, repeat=repeat))
+        print(f"{page.name:<20} {len(content):>9,} {legacy * 1000:>10.2f} {current * 1000:>10.3f} "
+              f"{legacy / current:>7.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CDEC QueryF parsers')
+    parser.add_argument('--repeat', type=int, default=50, help='Timing repetitions per page (best is reported)')
+    args = parser.parse_args()
+    run(args.repeat)
+
+
+if __name__ == '__main__':
+    main()
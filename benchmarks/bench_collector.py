@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Collector throughput on a local replay server
+
+Runs ReservoirCollector.collect_all against replay.ReplayServer for 2, 100 and
+1,000 simulated stations, with each collection source. Every station's QueryF
+page is the recorded BER page (fixtures/cdec), and bulk CSV responses repeat
+the recorded rows under each requested station id, so parsing and storing cost
+what they would for real pages. The server can add latency per request and
+fail a share of requests to see how retries and breakers change the numbers.
+
+Reported per run:
+    stations/s   stations collected per second of collect_all wall time
+    requests     HTTP requests the server answered
+    parse ms     mean parse time per page (QueryF) or per bulk response
+    save ms      total time writing readings, rollups and the data version
+    rows         readings stored
+
+A throwaway SQLite database is used; the configured one is never touched.
+
+Usage:
+    python -m benchmarks.bench_collector [--stations 2 100 1000] [--sources cdec_query cdec_csv]
+                                         [--latency 0.02] [--failure-rate 0] [--json results.json]
+"""
+import os
+import tempfile
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='reservoirdog-bench-'), 'bench.db')}"
+
+import argparse
+import json
+import logging
+from pathlib import Path
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import config
+from collector import ReservoirCollector
+from database import Base, engine, init_db
+from metrics import collector_stage_duration
+from replay import ReplayServer, redirect_config
+
+FIXTURE_DIR = Path(__file__).resolve().parent.parent / 'fixtures' / 'cdec'
+QUERY_PAGE = (FIXTURE_DIR / 'QueryF_BER.html').read_bytes()
+CSV_HEADER, *CSV_ROWS = (FIXTURE_DIR / 'CSVDataServlet_BER_ORO.csv').read_text().splitlines()
+CSV_ROWS = [row.split(',', 1)[1] for row in CSV_ROWS if row.startswith('BER,')]
+
+
+def simulated_response(key):
+    """QueryF page or bulk CSV for any simulated station"""
+    parts = urlsplit(key)
+    if parts.path.endswith('/QueryF'):
+        return 200, 'text/html;charset=UTF-8', QUERY_PAGE
+    if parts.path.endswith('/CSVDataServlet'):
+        stations = parse_qs(parts.query)['Stations'][0].split(',')
+        lines = [CSV_HEADER] + [f'{station},{row}' for station in stations for row in CSV_ROWS]
+        return 200, 'text/csv', ('\r\n'.join(lines) + '\r\n').encode()
+    return None
+
+
+def run(stations, source, server, per_host_limit):
+    """One collect_all over `stations` simulated reservoirs from `source`"""
+    Base.metadata.drop_all(engine)
+    init_db()
+    config.RESERVOIRS = {f'S{i:04d}': {'name': f'Station {i}', 'station_id': f'S{i:04d}'} for i in range(stations)}
+    config.COLLECTION_SOURCES = [source]
+    collector_stage_duration.clear()
+    
+    with redirect_config(server):
+        collector = ReservoirCollector(per_host_limit=per_host_limit)
+        requests_before = server.requests
+        started = time.perf_counter()
+        results = collector.collect_all(concurrent=True)
+        elapsed = time.perf_counter() - started
+    
+    parse_seconds, pages = collector_stage_duration.total(stage='parse')
+    save_seconds, _ = collector_stage_duration.total(stage='save')
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql('SELECT COUNT(*) FROM reservoir_data').scalar()
+    return {
+        'stations': stations,
+        'source': source,
+        'seconds': elapsed,
+        'stations_per_second': stations / elapsed,
+        'collected': sum(1 for reading in results.values() if reading),
+        'requests': server.requests - requests_before,
+        'parse_ms_per_page': parse_seconds / pages * 1000 if pages else 0.0,
+        'save_ms': save_seconds * 1000,
+        'rows': rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collector throughput on a local replay server')
+    parser.add_argument('--stations', type=int, nargs='+', default=[2, 100, 1000], help='Simulated station counts')
+    parser.add_argument('--sources', nargs='+', default=['cdec_query', 'cdec_csv'], help='Collection sources to compare')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds the server adds to each response')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--per-host-limit', type=int, default=config.COLLECTION_PER_HOST_LIMIT,
+                        help='Concurrent requests per host')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+    
+    print(f"{'stations':>8} {'source':<11} {'seconds':>8} {'stations/s':>10} {'ok':>5} {'requests':>8} "
+          f"{'parse ms':>9} {'save ms':>8} {'rows':>7}")
+    results = []
+    with ReplayServer(resolver=simulated_response, latency=args.latency, failure_rate=args.failure_rate, seed=1) as server:
+        for stations in args.stations:
+            for source in args.sources:
+                r = run(stations, source, server, args.per_host_limit)
+                results.append(r)
+                print(f"{r['stations']:>8} {r['source']:<11} {r['seconds']:>8.2f} {r['stations_per_second']:>10.1f} "
+                      f"{r['collected']:>5} {r['requests']:>8} {r['parse_ms_per_page']:>9.2f} {r['save_ms']:>8.1f} "
+                      f"{r['rows']:>7}")
+    
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            'latency': args.latency, 'failure_rate': args.failure_rate, 'per_host_limit': args.per_host_limit,
+            'results': results,
+        }, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
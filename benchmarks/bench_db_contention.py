@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Concurrent read/write benchmark for the SQLite engine profile
+
+A writer process stores batches of readings the way the collector does (bulk
+upsert, rollup update and data-version bump in one transaction) while reader
+threads run the API's queries, like a threaded web worker. The writer fills in
+older history, so the rows the readers fetch stay the same throughout. Each profile gets
+its own database file:
+
+    default  create_engine() defaults: rollback journal, synchronous=FULL
+    tuned    database.create_database_engine(): WAL, synchronous=NORMAL, mmap,
+             page cache and busy timeout from config.SQLITE_PRAGMAS
+
+With a rollback journal the writer has to wait until no reader holds the file,
+so under read load the collector falls behind (rows/s) or fails outright with
+"database is locked" (w-err). Under WAL the two proceed independently. On a
+machine with few cores the writes WAL lets through also take CPU from readers,
+so compare both sides of the table.
+
+Usage:
+    python -m benchmarks.bench_db_contention [--readers 8] [--duration 10] [--batch 2000] [--pause 0.1]
+"""
+import argparse
+import multiprocessing
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, bump_data_version, create_database_engine
+from rollups import query_series, update_rollups
+from storage import get_store
+
+CODES = ['BER', 'ORO']
+PROFILES = ('default', 'tuned')
+SEED_DAYS = 30
+READING_INTERVAL = timedelta(minutes=15)
+
+
+def _build_engine(url, profile, role):
+    if profile == 'default':
+        return create_engine(url)
+    return create_database_engine(url, role=role)
+
+
+def _readings(code, start, count):
+    return [{
+        'reservoir_code': code,
+        'timestamp': start + READING_INTERVAL * i,
+        'reservoir_elevation': 400.0 + (i % 500) * 0.1,
+        'storage': 1_000_000.0 + i,
+        'storage_percent': None,
+        'data_source': 'BENCH',
+    } for i in range(count)]
+
+
+def _store(session, rows):
+    get_store().write(session, rows)
+    update_rollups(session, [(row['reservoir_code'], row['timestamp']) for row in rows])
+    bump_data_version(session)
+    session.commit()
+
+
+def seed(url, profile, now):
+    engine = _build_engine(url, profile, 'cli')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        count = int(timedelta(days=SEED_DAYS) / READING_INTERVAL)
+        for code in CODES:
+            _store(session, _readings(code, now - timedelta(days=SEED_DAYS), count))
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def writer(url, profile, now, batch, pause, stop, stats):
+    """Writer process: store batches of older readings, `pause` seconds apart, until stop is set"""
+    engine = _build_engine(url, profile, 'collector')
+    session = sessionmaker(bind=engine)()
+    commits = errors = 0
+    durations = []
+    per_code = batch // len(CODES)
+    next_start = now - timedelta(days=SEED_DAYS) - READING_INTERVAL * per_code
+    while not stop.is_set():
+        rows = [row for code in CODES for row in _readings(code, next_start, per_code)]
+        started = time.perf_counter()
+        try:
+            _store(session, rows)
+            commits += 1
+            durations.append(time.perf_counter() - started)
+            next_start -= READING_INTERVAL * per_code
+        except OperationalError:
+            session.rollback()
+            errors += 1
+        stop.wait(pause)
+    session.close()
+    engine.dispose()
+    stats.update(commits=commits, errors=errors, rows=commits * batch,
+                 commit_ms=float(np.median(durations) * 1000) if durations else 0.0)
+
+
+def reader(Session, now, deadline, latencies, errors, lock):
+    """Reader thread: the /api/reservoirs/latest and 7-day /data queries, back to back"""
+    local_latencies = []
+    local_errors = 0
+    while time.monotonic() < deadline:
+        session = Session()
+        started = time.perf_counter()
+        try:
+            get_store().latest(session, CODES)
+            for code in CODES:
+                query_series(session, code, now - timedelta(days=7), 'raw')
+            local_latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            local_errors += 1
+        finally:
+            session.close()
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def run_profile(profile, directory, readers, duration, batch, pause):
+    url = f'sqlite:///{Path(directory) / f"{profile}.db"}'
+    now = datetime(2025, 1, 1)
+    seed(url, profile, now)
+    
+    manager = multiprocessing.Manager()
+    stats = manager.dict()
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(target=writer, args=(url, profile, now, batch, pause, stop, stats))
+    process.start()
+    
+    engine = _build_engine(url, profile, 'web')
+    Session = sessionmaker(bind=engine)
+    latencies, errors, lock = [], [0], threading.Lock()
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [threading.Thread(target=reader, args=(Session, now, deadline, latencies, errors, lock))
+               for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    stop.set()
+    process.join()
+    engine.dispose()
+    
+    samples = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    result = {
+        'reads_per_second': len(latencies) / elapsed,
+        'read_p50_ms': float(np.percentile(samples, 50)),
+        'read_p99_ms': float(np.percentile(samples, 99)),
+        'read_max_ms': float(samples.max()),
+        'read_errors': errors[0],
+        'writes_per_second': stats.get('rows', 0) / elapsed,
+        'commit_ms': stats.get('commit_ms', 0.0),
+        'write_errors': stats.get('errors', 0),
+    }
+    manager.shutdown()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite read/write contention: default vs tuned profile')
+    parser.add_argument('--readers', type=int, default=8, help='Concurrent reader threads')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per profile')
+    parser.add_argument('--batch', type=int, default=2000, help='Readings stored per writer transaction')
+    parser.add_argument('--pause', type=float, default=0.1, help='Seconds between writer transactions')
+    args = parser.parse_args()
+    
+    print(f"{'profile':<8} {'reads/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'r-err':>6} "
+          f"{'rows/s':>8} {'commit ms':>10} {'w-err':>6}")
+    with tempfile.TemporaryDirectory(prefix='reservoirdog-bench-') as directory:
+        for profile in PROFILES:
+            r = run_profile(profile, directory, args.readers, args.duration, args.batch, args.pause)
+            print(f"{profile:<8} {r['reads_per_second']:>8.1f} {r['read_p50_ms']:>8.1f} {r['read_p99_ms']:>8.1f} "
+                  f"{r['read_max_ms']:>8.1f} {r['read_errors']:>6} {r['writes_per_second']:>8.0f} "
+                  f"{r['commit_ms']:>10.1f} {r['write_errors']:>6}")
+
+
+if __name__ == '__main__':
+    main()
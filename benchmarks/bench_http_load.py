@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the web application
+
+Drives a set of API paths from concurrent keep-alive clients and reports
+requests/sec and latency percentiles. With --compare it starts the Flask
+development server and gunicorn (gunicorn.conf.py) one after the other on a
+free port and runs the same load against each.
+
+Usage:
+    python -m benchmarks.bench_http_load --url http://127.0.0.1:5000
+    python -m benchmarks.bench_http_load --compare --concurrency 32 --duration 10
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import requests
+
+import config
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_PATHS = [
+    '/api/reservoirs/latest',
+    '/api/reservoir/BER/latest',
+    '/api/reservoir/ORO/data?days=30&max_points=800&format=columnar',
+    '/api/reservoir/BER/stats',
+]
+
+
+def run_load(base_url, paths, concurrency, duration):
+    """
+    Hit paths round-robin from `concurrency` threads for `duration` seconds
+    Returns: dict with requests, errors, requests_per_second and latency percentiles (ms)
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    
+    def client(offset):
+        session = requests.Session()
+        local_latencies = []
+        local_errors = 0
+        i = offset
+        while time.monotonic() < deadline:
+            url = base_url + paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                response = session.get(url, timeout=30)
+                if response.status_code >= 500:
+                    local_errors += 1
+            except requests.RequestException:
+                local_errors += 1
+                continue
+            local_latencies.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+    
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    
+    samples = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'p99_ms': float(np.percentile(samples, 99)),
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start listening on port {port}")
+
+
+def _serve_and_load(name, command, args):
+    port = _free_port()
+    env = dict(os.environ, FLASK_HOST='127.0.0.1', FLASK_PORT=str(port), FLASK_DEBUG='False')
+    if args.workers:
+        env['WEB_WORKERS'] = str(args.workers)
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    try:
+        try:
+            _wait_for_port(port)
+        except RuntimeError:
+            log.seek(0)
+            sys.stderr.write(log.read().decode(errors='replace'))
+            raise
+        base_url = f'http://127.0.0.1:{port}'
+        run_load(base_url, args.paths, args.concurrency, 1)  # warm up caches and connections
+        return name, run_load(base_url, args.paths, args.concurrency, args.duration)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        log.close()
+
+
+def _print_results(results):
+    print(f"{'server':<12} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, result in results:
+        print(f"{name:<12} {result['requests_per_second']:>9.1f} {result['p50_ms']:>8.1f} "
+              f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the Reservoir Dog web server')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{config.FLASK_PORT}', help='Server to load')
+    parser.add_argument('--compare', action='store_true', help='Start and compare dev server vs gunicorn')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server')
+    parser.add_argument('--workers', type=int, help='gunicorn worker processes (default: WEB_WORKERS)')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS, help='Paths to request round-robin')
+    args = parser.parse_args()
+    
+    if not args.compare:
+        _print_results([(args.url, run_load(args.url, args.paths, args.concurrency, args.duration))])
+        return
+    
+    results = [
+        _serve_and_load('flask-dev', [sys.executable, 'app.py'], args),
+        _serve_and_load('gunicorn', [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'], args),
+    ]
+    _print_results(results)
+    dev, prod = results[0][1], results[1][1]
+    if dev['requests_per_second']:
+        print(f"\ngunicorn serves {prod['requests_per_second'] / dev['requests_per_second']:.1f}x the requests/sec")
+
+
+if __name__ == '__main__':
+    main()
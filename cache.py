@@ -0,0 +1,112 @@
+"""
+In-process response cache for the JSON API
+"""
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import threading
+import time
+
+from flask import Response, make_response, request
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache with a TTL and a data version.
+    Entries remember the data version they were built from; once the version moves on
+    (the collector stored new readings) they are treated as misses and dropped.
+    """
+    
+    def __init__(self, max_entries=512, ttl_seconds=900):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, version, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key, version=None):
+        """Return the cached value for key, or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_version, value = entry
+                if expires_at > now and entry_version == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def set(self, key, value, version=None):
+        """Store value under key, evicting the least recently used entries if full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+    
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+def cached_view(cache, version_fn):
+    """
+    Decorator caching a Flask view's response body by endpoint, URL arguments and query string.
+    version_fn is called on every request; a changed version invalidates older entries.
+    Only 200 and 404 responses are cached.
+    200 responses carry a weak ETag of their body and are revalidated (Cache-Control: no-cache),
+    so a client that already has an unchanged body gets a 304 back.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            version = version_fn()
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+            )
+            cached = cache.get(key, version)
+            if cached is not None:
+                body, status, headers = cached
+                response = Response(body, status=status, headers=headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response.make_conditional(request)
+            
+            response = make_response(view(**kwargs))
+            if response.status_code == 200:
+                # Weak: the body may still be compressed differently per request
+                response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+                response.headers['Cache-Control'] = 'no-cache'
+            if response.status_code in (200, 404):
+                headers = [(name, value) for name, value in response.headers.items()
+                           if name.lower() != 'content-length']
+                cache.set(key, (response.get_data(), response.status_code, headers), version)
+            response.headers['X-Cache'] = 'MISS'
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -2,25 +2,166 @@
 Data collector for reservoir levels from CDEC and USBR
 """
 import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-import re
+import hashlib
+from urllib.parse import urlparse
 import logging
-from database import ReservoirData, SessionLocal
+import threading
+import time
+from database import SessionLocal, bump_data_version
+from httpcache import HTTPCache
+from metadata import storage_percent
+from metrics import REGISTRY, collector_fetches, collector_stage_duration
+from resilience import CircuitBreakers, CircuitOpenError, ResilientAdapter, ResilientConditionalGetAdapter
+from rollups import update_rollups
+from sources import cdec_csv_url, cdec_query_url, plan_fallbacks, plan_fetches, source_names
+from storage import get_store
+from parsers import (
+    iter_cdec_csv, merge_cdec_sensors, parse_cdec_query_table, parse_cdec_timestamp, parse_usbr_reservoirs,
+)
 import config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BREAKER_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
 
 class ReservoirCollector:
     """Collects reservoir data from various sources"""
     
-    def __init__(self):
+    def __init__(self, max_workers=None, per_host_limit=None, deadline_seconds=None):
+        self.max_workers = max_workers or config.COLLECTION_MAX_WORKERS
+        self.per_host_limit = per_host_limit or config.COLLECTION_PER_HOST_LIMIT
+        self.deadline_seconds = deadline_seconds or config.COLLECTION_DEADLINE_SECONDS
+        
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         })
+        # Keep enough pooled connections per host for the concurrency limit (and never more).
+        # Failed requests are retried with backoff, and a host that keeps failing is cut off
+        # by its circuit breaker. Plain GETs are revalidated with ETag/Last-Modified, so
+        # unchanged pages cost a 304.
+        self.breakers = CircuitBreakers()
+        pool = dict(breakers=self.breakers, pool_connections=config.HTTP_POOL_HOSTS,
+                    pool_maxsize=self.per_host_limit, pool_block=True)
+        if config.HTTP_CACHE_ENABLED:
+            self.http_cache = HTTPCache(config.HTTP_CACHE_MAX_ENTRIES)
+            adapter = ResilientConditionalGetAdapter(self.http_cache, **pool)
+        else:
+            self.http_cache = None
+            adapter = ResilientAdapter(**pool)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # url -> (body sha256, parsed result) of the last page parsed from that URL
+        self._parse_memo = {}
+        self.parses_skipped = 0
+        
+        self._host_semaphores = {}
+        self._host_lock = threading.Lock()
+        self._deadline = None
+    
+    def export_metrics(self, registry=REGISTRY):
+        """Expose this collector's HTTP cache, parse memo and circuit breakers through registry"""
+        if self.http_cache is not None:
+            registry.callback(
+                'rdog_http_cache_responses_total', 'Collector responses by cache outcome',
+                lambda: [({'result': name}, value) for name, value in self.http_cache.stats().items() if name != 'entries'],
+                kind='counter', labelnames=('result',),
+            )
+        registry.callback('rdog_collector_parses_skipped_total', 'Parses skipped because the body was unchanged',
+                          lambda: [({}, self.parses_skipped)], kind='counter')
+        registry.callback(
+            'rdog_circuit_breaker_state', 'Upstream circuit breaker state (0 closed, 1 half open, 2 open)',
+            lambda: [({'host': host}, BREAKER_STATE_VALUES[breaker['state']])
+                     for host, breaker in self.breakers.stats().items()],
+            labelnames=('host',),
+        )
+        registry.callback(
+            'rdog_circuit_breaker_rejected_total', 'Requests failed fast by an open circuit breaker',
+            lambda: [({'host': host}, breaker['rejected']) for host, breaker in self.breakers.stats().items()],
+            kind='counter', labelnames=('host',),
+        )
+    
+    def _host_semaphore(self, url):
+        """Get the semaphore limiting in-flight requests to the host of url"""
+        host = urlparse(url).netloc
+        with self._host_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_semaphores[host] = semaphore
+            return semaphore
+    
+    def _remaining_time(self):
+        """Seconds left before the current run's deadline (None if no deadline is set)"""
+        if self._deadline is None:
+            return None
+        return self._deadline - time.monotonic()
+    
+    def _get(self, url, **kwargs):
+        """
+        GET a URL, honouring the per-host concurrency limit and the run deadline
+        Extra keyword arguments are passed to requests (e.g. stream=True)
+        Returns: requests.Response, or None if the deadline passed first or the host's circuit is open
+        """
+        timeout = config.REQUEST_TIMEOUT_SECONDS
+        remaining = self._remaining_time()
+        if remaining is not None:
+            if remaining <= 0:
+                logger.warning(f"Collection deadline reached, skipping {url}")
+                return None
+            timeout = min(timeout, remaining)
+        
+        semaphore = self._host_semaphore(url)
+        if not semaphore.acquire(timeout=timeout):
+            logger.warning(f"Timed out waiting for a connection slot for {url}")
+            return None
+        try:
+            remaining = self._remaining_time()
+            if remaining is not None:
+                timeout = min(timeout, max(remaining, 0.1))
+            return self.session.get(url, timeout=(min(config.REQUEST_CONNECT_TIMEOUT_SECONDS, timeout), timeout),
+                                    **kwargs)
+        except CircuitOpenError as e:
+            logger.warning(f"{e}, skipping {url}")
+            return None
+        finally:
+            semaphore.release()
+    
+    def _timed_get(self, target, url, **kwargs):
+        """_get, recording the fetch time and outcome for target (a station code or source name)"""
+        result = 'error'
+        try:
+            with collector_stage_duration.time(stage='fetch', target=target):
+                response = self._get(url, **kwargs)
+            if response is None:
+                result = 'skipped'
+            elif response.status_code == 200:
+                result = 'not_modified' if getattr(response, 'from_cache', False) else 'ok'
+            return response
+        finally:
+            collector_fetches.inc(target=target, result=result)
+    
+    def _parse_cached(self, url, response, parse, target):
+        """
+        parse(response.content), reusing the previous result for url when the body is unchanged
+        The body digest comes from the HTTP cache adapter, or is computed here without it.
+        """
+        digest = getattr(response, 'content_sha256', None) or hashlib.sha256(response.content).hexdigest()
+        memo = self._parse_memo.get(url)
+        if memo is not None and memo[0] == digest:
+            self.parses_skipped += 1
+            logger.debug(f"Unchanged body for {url}, reusing parsed result")
+            return memo[1]
+        
+        with collector_stage_duration.time(stage='parse', target=target):
+            result = parse(response.content)
+        self._parse_memo[url] = (digest, result)
+        return result
     
     def collect_cdec_query(self, reservoir_code):
         """
@@ -33,176 +174,296 @@ class ReservoirCollector:
                 logger.error(f"Unknown reservoir code: {reservoir_code}")
                 return None
             
-            url = reservoir_config['cdec_query_url']
-            response = self.session.get(url, timeout=30)
+            url = cdec_query_url(reservoir_code)
+            response = self._timed_get(reservoir_code, url)
+            if response is None:
+                return None
             
             if response.status_code != 200:
                 logger.error(f"Failed to fetch CDEC data for {reservoir_code}: {response.status_code}")
                 return None
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Find all tables - the data is typically in the last table
-            tables = soup.find_all('table')
-            if not tables:
-                logger.warning(f"No tables found in HTML for {reservoir_code}")
+            data = self._parse_cached(url, response, parse_cdec_query_table, reservoir_code)
+            if data is None:
+                logger.warning(f"No valid data rows found for {reservoir_code}")
                 return None
             
-            # Get the last table (most recent data)
-            data_table = tables[-1]
-            rows = data_table.find_all('tr')
-            
-            if not rows:
-                logger.warning(f"No rows found in table for {reservoir_code}")
-                return None
-            
-            # Find the last row with valid data (not '--')
-            for row in reversed(rows):
-                cells = row.find_all('td')
-                if len(cells) >= 3:
-                    timestamp_str = cells[0].get_text(strip=True)
-                    elevation_str = cells[1].get_text(strip=True)
-                    storage_str = cells[2].get_text(strip=True)
-                    
-                    # Skip rows with missing data
-                    if elevation_str == '--' or storage_str == '--':
-                        continue
-                    
-                    try:
-                        # Parse timestamp
-                        timestamp = self._parse_timestamp(timestamp_str)
-                        
-                        # Parse numeric values
-                        res_ele = float(elevation_str.replace(',', ''))
-                        storage = float(storage_str.replace(',', ''))
-                        
-                        logger.info(f"Successfully parsed data for {reservoir_code}: {timestamp_str}, elevation={res_ele}, storage={storage}")
-                        return (timestamp, res_ele, storage)
-                    except (ValueError, Exception) as e:
-                        logger.debug(f"Skipping row due to parse error: {e}")
-                        continue
-            
-            logger.warning(f"No valid data rows found for {reservoir_code}")
-            return None
-            
+            timestamp, res_ele, storage = data
+            logger.info(f"Successfully parsed data for {reservoir_code}: {timestamp}, elevation={res_ele}, storage={storage}")
+            return data
+        
         except Exception as e:
             logger.error(f"Error collecting CDEC query data for {reservoir_code}: {e}")
             import traceback
             logger.debug(traceback.format_exc())
             return None
     
-    def collect_cdec_historical(self, reservoir_code):
+    def cdec_csv_url(self, station_ids, start, end, duration='D'):
+        """Build a CDEC CSV data service URL for stations over [start, end]"""
+        return cdec_csv_url(station_ids, start, end, duration)
+    
+    def collect_cdec_historical(self, reservoir_code, start=None, end=None):
         """
-        Collect historical data from CDEC DataPlotter
-        This returns a plot page, so we'd need to parse the data differently
-        For now, we'll focus on the QueryF endpoint for current data
+        Collect daily historical data from the CDEC CSV data service
+        The response is parsed as it streams, so memory is bounded by the date range requested;
+        callers backfilling decades should go window by window (see backfill.py).
+        Returns: list of (timestamp, reservoir_elevation, storage), or None on failure
         """
-        # TODO: Implement historical data collection if needed
-        pass
+        try:
+            reservoir_config = config.RESERVOIRS.get(reservoir_code)
+            if not reservoir_config:
+                logger.error(f"Unknown reservoir code: {reservoir_code}")
+                return None
+            
+            start = start or datetime.strptime(config.BACKFILL_START_DATE, '%Y-%m-%d')
+            end = end or datetime.utcnow()
+            station_id = reservoir_config.get('station_id', reservoir_code)
+            url = self.cdec_csv_url([station_id], start, end)
+            
+            response = self._timed_get(reservoir_code, url, stream=True)
+            if response is None:
+                return None
+            try:
+                if response.status_code != 200:
+                    logger.error(f"Failed to fetch CDEC history for {reservoir_code}: {response.status_code}")
+                    return None
+                response.encoding = response.encoding or 'utf-8'
+                records = iter_cdec_csv(response.iter_lines(decode_unicode=True))
+                readings = merge_cdec_sensors(records, config.CDEC_SENSORS)
+            finally:
+                response.close()
+            
+            return readings.get(station_id.upper(), [])
+        
+        except Exception as e:
+            logger.error(f"Error collecting CDEC historical data for {reservoir_code}: {e}")
+            return None
     
     def collect_usbr_data(self):
         """
-        Collect data from US Bureau of Reclamation
-        Returns: dict mapping reservoir codes to data
+        Collect current readings for every configured reservoir on the USBR CVO page (one fetch)
+        Returns: dict mapping reservoir codes to (timestamp, reservoir_elevation, storage)
         """
         try:
-            response = self.session.get(config.USBR_URL, timeout=30)
+            response = self._timed_get('USBR', config.USBR_URL)
+            if response is None:
+                return {}
             if response.status_code != 200:
                 logger.error(f"Failed to fetch USBR data: {response.status_code}")
                 return {}
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # USBR page structure needs to be analyzed
-            # For now, return empty dict - will need to implement based on actual page structure
-            logger.info("USBR data collection not yet implemented - page structure analysis needed")
-            return {}
-            
+            return self._parse_cached(config.USBR_URL, response, self._parse_usbr_page, 'USBR')
+        
         except Exception as e:
             logger.error(f"Error collecting USBR data: {e}")
             return {}
     
+    def _parse_usbr_page(self, content):
+        """Extract readings from the USBR CVO page for reservoirs configured with a usbr_name"""
+        names = {reservoir['usbr_name']: code for code, reservoir in config.RESERVOIRS.items()
+                 if reservoir.get('usbr_name')}
+        return parse_usbr_reservoirs(content, names)
+    
     def _parse_timestamp(self, timestamp_str):
         """Parse various timestamp formats from CDEC"""
-        # Try multiple date formats
-        formats = [
-            '%m/%d/%Y %H:%M',
-            '%m/%d/%Y %H:%M:%S',
-            '%Y-%m-%d %H:%M:%S',
-            '%m/%d/%Y',
-        ]
-        
-        for fmt in formats:
-            try:
-                return datetime.strptime(timestamp_str, fmt)
-            except ValueError:
-                continue
-        
-        # If all fail, return current time
-        logger.warning(f"Could not parse timestamp: {timestamp_str}, using current time")
-        return datetime.utcnow()
+        return parse_cdec_timestamp(timestamp_str)
     
-    def save_data(self, reservoir_code, timestamp, reservoir_elevation, storage, data_source='CDEC'):
-        """Save collected data to database"""
+    def _reading_row(self, reservoir_code, timestamp, reservoir_elevation, storage, data_source):
+        """Build a reservoir_data row for the bulk writer"""
+        return {
+            'reservoir_code': reservoir_code,
+            'timestamp': timestamp,
+            'reservoir_elevation': reservoir_elevation,
+            'storage': storage,
+            # From the in-memory capacity map, so no query per row
+            'storage_percent': storage_percent(reservoir_code, storage),
+            'data_source': data_source,
+        }
+    
+    def save_batch(self, readings, data_source='CDEC'):
+        """
+        Save many readings in a single transaction, skipping ones already stored
+        readings: iterable of (reservoir_code, timestamp, reservoir_elevation, storage)
+        Returns: number of new rows stored, or None on error
+        """
+        rows = [self._reading_row(code, timestamp, res_ele, storage, data_source)
+                for code, timestamp, res_ele, storage in readings]
+        if not rows:
+            return 0
+        
         db = SessionLocal()
         try:
-            # Calculate storage percentage if we have capacity data
-            storage_percent = None
-            # TODO: Get capacity from metadata table
-            
-            # Check if data already exists for this timestamp
-            existing = db.query(ReservoirData).filter(
-                ReservoirData.reservoir_code == reservoir_code,
-                ReservoirData.timestamp == timestamp
-            ).first()
-            
-            if existing:
-                logger.debug(f"Data already exists for {reservoir_code} at {timestamp}")
-                return existing
-            
-            data = ReservoirData(
-                reservoir_code=reservoir_code,
-                timestamp=timestamp,
-                reservoir_elevation=reservoir_elevation,
-                storage=storage,
-                storage_percent=storage_percent,
-                data_source=data_source
-            )
-            
-            db.add(data)
-            db.commit()
-            db.refresh(data)
-            logger.info(f"Saved data for {reservoir_code}: elevation={reservoir_elevation}, storage={storage}")
-            return data
-            
+            with collector_stage_duration.time(stage='save', target=data_source):
+                store = get_store()
+                keys = list(dict.fromkeys((row['reservoir_code'], row['timestamp']) for row in rows))
+                # Bulk sources return readings already stored; only new ones touch the rollups
+                stored = store.load(db, keys)
+                inserted = store.write(db, rows)
+                if inserted:
+                    update_rollups(db, [key for key in keys if key not in stored])
+                    # Invalidates cached API responses in the web process
+                    bump_data_version(db)
+                db.commit()
+            logger.info(f"Saved {inserted} new reading(s) of {len(rows)} ({data_source})")
+            return inserted
         except Exception as e:
             db.rollback()
-            logger.error(f"Error saving data for {reservoir_code}: {e}")
+            logger.error(f"Error saving batch of {len(rows)} reading(s): {e}")
             return None
         finally:
             db.close()
     
-    def collect_all(self):
-        """Collect data for all configured reservoirs"""
-        results = {}
-        for code in config.RESERVOIRS.keys():
+    def load_saved(self, keys):
+        """
+        Load stored rows for (reservoir_code, timestamp) pairs
+        Returns: dict mapping (reservoir_code, timestamp) to storage.Reading
+        """
+        db = SessionLocal()
+        try:
+            return get_store().load(db, keys)
+        finally:
+            db.close()
+    
+    def save_data(self, reservoir_code, timestamp, reservoir_elevation, storage, data_source='CDEC'):
+        """Save collected data to database"""
+        if self.save_batch([(reservoir_code, timestamp, reservoir_elevation, storage)], data_source) is None:
+            return None
+        return self.load_saved([(reservoir_code, timestamp)]).get((reservoir_code, timestamp))
+    
+    def collect_readings(self, codes):
+        """
+        Fetch current readings for several reservoirs sequentially
+        Returns: dict mapping reservoir codes to (timestamp, elevation, storage) or None
+        """
+        readings = {}
+        for code in codes:
             logger.info(f"Collecting data for {code}...")
-            data = self.collect_cdec_query(code)
-            if data:
-                timestamp, res_ele, storage = data
-                saved = self.save_data(code, timestamp, res_ele, storage)
-                results[code] = saved
-            else:
-                logger.warning(f"No data collected for {code}")
-                results[code] = None
+            readings[code] = self.collect_cdec_query(code)
+        return readings
+    
+    def collect_readings_concurrent(self, codes):
+        """
+        Fetch current readings for several reservoirs on a bounded worker pool
+        Requests to any single host are capped at per_host_limit, and stations
+        still outstanding when the run deadline passes are reported as None.
+        Returns: dict mapping reservoir codes to (timestamp, elevation, storage) or None
+        """
+        return self._run_concurrent({code: (self.collect_cdec_query, code) for code in codes})
+    
+    def _run_concurrent(self, tasks):
+        """
+        Run tasks (key -> (function, *args)) on the worker pool under the run deadline
+        (the caller's, if one is already set, e.g. by collect_all for its fallback fetches)
+        Returns: dict mapping each key to its result, or None if it failed or didn't finish
+        """
+        results = {key: None for key in tasks}
+        if not tasks:
+            return results
         
-        # Also try USBR data
-        usbr_data = self.collect_usbr_data()
-        if usbr_data:
-            for code, data in usbr_data.items():
-                # Save USBR data if available
-                pass
+        owns_deadline = self._deadline is None
+        if owns_deadline:
+            self._deadline = time.monotonic() + self.deadline_seconds
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks)),
+                                      thread_name_prefix='collector')
+        try:
+            futures = {executor.submit(*task): key for key, task in tasks.items()}
+            done, not_done = wait(futures, timeout=max(self._remaining_time(), 0))
+            
+            for future in done:
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    logger.error(f"Error collecting data for {key}: {e}")
+            
+            if not_done:
+                logger.warning(f"Collection deadline of {self.deadline_seconds}s reached; "
+                               f"{len(not_done)} fetch(es) did not finish: "
+                               f"{sorted(str(futures[f]) for f in not_done)}")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if owns_deadline:
+                self._deadline = None
         
         return results
+    
+    def _run_fetch(self, fetch):
+        """Execute one planned fetch, logging (rather than raising) source errors"""
+        try:
+            return fetch.source.fetch(self, fetch.url, fetch.codes)
+        except Exception as e:
+            logger.error(f"Error fetching {fetch.source.name} {fetch.url}: {e}")
+            return {}
+    
+    def run_plan(self, fetches, concurrent=None):
+        """
+        Execute planned fetches (see sources.plan_fetches), on the worker pool when concurrent
+        Returns: dict mapping (source name, reservoir code) to a list of
+                 (timestamp, reservoir_elevation, storage); missing when the source had nothing
+        """
+        if concurrent is None:
+            concurrent = config.COLLECTION_CONCURRENT
+        if concurrent:
+            results = self._run_concurrent({fetch: (self._run_fetch, fetch) for fetch in fetches})
+        else:
+            results = {fetch: self._run_fetch(fetch) for fetch in fetches}
+        
+        readings = {}
+        for fetch, fetched in results.items():
+            for code, points in (fetched or {}).items():
+                readings.setdefault((fetch.source.name, code), []).extend(points)
+        return readings
+    
+    def collect_all(self, concurrent=None, codes=None):
+        """
+        Collect data for all configured reservoirs from their sources (see sources.py)
+        concurrent: run fetches on a worker pool (defaults to config.COLLECTION_CONCURRENT)
+        codes: collect only these reservoirs (the adaptive scheduler polls the ones that are due)
+        Returns: dict mapping each code to the stored row of its newest reading from its
+                 highest-priority source that returned one, or None
+        """
+        if concurrent is None:
+            concurrent = config.COLLECTION_CONCURRENT
+        codes = list(codes or config.RESERVOIRS.keys())
+        fetches = plan_fetches(codes)
+        # One deadline for the whole run: fallback fetches get only what the primary ones left
+        if concurrent:
+            self._deadline = time.monotonic() + self.deadline_seconds
+        try:
+            readings = self.run_plan(fetches, concurrent)
+            fallbacks = plan_fallbacks(fetches, readings)
+            if fallbacks:
+                readings.update(self.run_plan(fallbacks, concurrent))
+                fetches += fallbacks
+        finally:
+            self._deadline = None
+        
+        # One batch per data_source, saved in plan order so when two sources report the
+        # same timestamp the higher-priority one is stored (later duplicates are skipped)
+        batches = {}
+        seen = set()
+        for fetch in fetches:
+            batch = batches.setdefault(fetch.source.data_source, [])
+            for code in fetch.codes:
+                for timestamp, res_ele, storage in readings.get((fetch.source.name, code), []):
+                    if (code, timestamp) not in seen:
+                        seen.add((code, timestamp))
+                        batch.append((code, timestamp, res_ele, storage))
+        
+        newest = {}
+        for code in codes:
+            names = [*source_names(code), *(fetch.source.name for fetch in fallbacks if code in fetch.codes)]
+            points = next((readings[(name, code)] for name in names if readings.get((name, code))), None)
+            if points:
+                newest[code] = max(points)[0]
+            else:
+                logger.warning(f"No data collected for {code}")
+        
+        stored = True
+        for data_source, batch in batches.items():
+            stored = self.save_batch(batch, data_source=data_source) is not None and stored
+        saved = self.load_saved(list(newest.items())) if newest and stored else {}
+        return {code: saved.get((code, newest[code])) if code in newest else None for code in codes}
 
 
 if __name__ == '__main__':
@@ -12,6 +12,51 @@ DATABASE_URL = os.getenv('DATABASE_URL', f'sqlite:///{BASE_DIR}/data/reservoir_d
 
 # Data collection settings
 COLLECTION_INTERVAL_MINUTES = 15  # Collect data every 15 minutes
+REQUEST_TIMEOUT_SECONDS = 30  # Per-request HTTP timeout
+REQUEST_CONNECT_TIMEOUT_SECONDS = 5  # Give up connecting to an unreachable host sooner
+
+# Concurrent collection settings
+COLLECTION_CONCURRENT = os.getenv('COLLECTION_CONCURRENT', 'True').lower() == 'true'
+COLLECTION_MAX_WORKERS = int(os.getenv('COLLECTION_MAX_WORKERS', 16))  # Worker threads per run
+COLLECTION_PER_HOST_LIMIT = int(os.getenv('COLLECTION_PER_HOST_LIMIT', 4))  # Max in-flight requests per host
+COLLECTION_DEADLINE_SECONDS = int(os.getenv('COLLECTION_DEADLINE_SECONDS', 600))  # Hard stop for one run
+
+# Data sources covering each reservoir, in priority order (see sources.py); a reservoir's
+# own 'sources' list overrides this
+COLLECTION_SOURCES = [name.strip() for name in os.getenv('COLLECTION_SOURCES', 'cdec_query,usbr').split(',') if name.strip()]
+REPLAY_FILE = os.getenv('REPLAY_FILE')  # CSV of readings for the 'replay' source
+
+# Scheduler mode: 'fixed' polls every station each COLLECTION_INTERVAL_MINUTES;
+# 'adaptive' learns each station's publish cadence and lag and polls just after
+# its next reading is due (see polling.py)
+SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'fixed')
+POLLING_HISTORY_DAYS = 30  # Stored history used to learn each station's cadence
+POLLING_HISTORY_READINGS = 48  # Most recent readings the cadence is the median spacing of
+POLLING_RETRY_MINUTES = 5  # Minimum spacing of polls, and the first retry after a stale poll (then doubles)
+POLLING_MAX_BACKOFF_MINUTES = 360  # Longest wait between polls of a stale station
+POLLING_JITTER_SECONDS = 60  # Random delay added to each scheduled poll
+
+# Reservoir metadata (capacity, max elevation) older than this is refetched from CDEC
+METADATA_MAX_AGE_DAYS = int(os.getenv('METADATA_MAX_AGE_DAYS', 30))
+METADATA_RELOAD_SECONDS = int(os.getenv('METADATA_RELOAD_SECONDS', 600))  # How often each process rereads stored capacities
+
+# Conditional GET cache for collector fetches (ETag / Last-Modified revalidation)
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'True').lower() == 'true'
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv('HTTP_CACHE_MAX_ENTRIES', 256))  # URLs remembered
+
+# Instrumentation (see metrics.py): /metrics on the web app, and a small HTTP
+# server in the collector process (COLLECTOR_METRICS_PORT=0 disables it)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+COLLECTOR_METRICS_HOST = os.getenv('COLLECTOR_METRICS_HOST', '127.0.0.1')
+COLLECTOR_METRICS_PORT = int(os.getenv('COLLECTOR_METRICS_PORT', 9108))
+
+# Upstream resilience for collector fetches (see resilience.py)
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))  # Retries after a connect error, timeout or 502/503/504
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', 0.5))  # Retry n waits factor * 2**(n-1) seconds
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv('HTTP_BACKOFF_MAX_SECONDS', 10))  # Longest wait between retries
+HTTP_BREAKER_FAILURE_THRESHOLD = int(os.getenv('HTTP_BREAKER_FAILURE_THRESHOLD', 5))  # Consecutive failures that open a host's breaker
+HTTP_BREAKER_RESET_SECONDS = float(os.getenv('HTTP_BREAKER_RESET_SECONDS', 120))  # Fail fast this long before a trial request
+HTTP_POOL_HOSTS = int(os.getenv('HTTP_POOL_HOSTS', 10))  # Hosts with a pooled connection set
 
 # Reservoir configurations
 RESERVOIRS = {
@@ -22,6 +67,9 @@ RESERVOIRS = {
         'cdec_metadata_url': 'https://cdec.water.ca.gov/dynamicapp/staMeta?station_id=BER',
         'cdec_storage_url': 'https://cdec.water.ca.gov/histPlot/DataPlotter.jsp?staid=ber&sensor_no=15&duration=D&start=01%2F01%2F1985+07%3A29&end=now&geom=Large',
         'cdec_query_url': 'https://cdec.water.ca.gov/dynamicapp/QueryF?s=BER',
+        'usbr_name': 'Berryessa',  # Row name on the USBR CVO page
+        'capacity_acre_feet': 1602000,  # Fallbacks until the staMeta page has been read (see metadata.py)
+        'max_elevation': 440.0,
     },
     'ORO': {
         'name': 'Lake Oroville',
@@ -31,11 +79,54 @@ RESERVOIRS = {
         'cdec_storage_url': 'https://cdec.water.ca.gov/histPlot/DataPlotter.jsp?staid=ORO&sensor_no=15&duration=D&start=01%2F01%2F1985+07%3A29&end=now&geom=Large',
         'cdec_query_url': 'https://cdec.water.ca.gov/dynamicapp/QueryF?s=ORO',
         'cdec_resapp_url': 'https://cdec.water.ca.gov/resapp/ResDetail?resid=ORO',
+        'usbr_name': 'Oroville',
+        'capacity_acre_feet': 3537577,
+        'max_elevation': 900.0,
     }
 }
 
-# USBR data source
-USBR_URL = 'https://www.usbr.gov/mp/cvo/current.html'
+# CDEC machine-readable data service (historical and bulk queries)
+CDEC_CSV_URL = 'https://cdec.water.ca.gov/dynamicapp/req/CSVDataServlet'
+CDEC_JSON_URL = 'https://cdec.water.ca.gov/dynamicapp/req/JSONDataServlet'
+CDEC_SENSORS = {
+    'reservoir_elevation': 6,  # RES ELE, feet
+    'storage': 15,  # STORAGE, acre-feet
+}
+CDEC_QUERY_URL = 'https://cdec.water.ca.gov/dynamicapp/QueryF?s={station_id}'  # For reservoirs without a cdec_query_url
+CDEC_BULK_MAX_STATIONS = int(os.getenv('CDEC_BULK_MAX_STATIONS', 50))  # Stations per multi-station CDEC request
+CDEC_BULK_LOOKBACK_DAYS = int(os.getenv('CDEC_BULK_LOOKBACK_DAYS', 2))  # Days of readings per bulk request
+CDEC_BULK_DURATION = os.getenv('CDEC_BULK_DURATION', 'H')  # Sensor duration code: H hourly, D daily
+
+# Historical backfill settings
+BACKFILL_START_DATE = os.getenv('BACKFILL_START_DATE', '1985-01-01')
+BACKFILL_WINDOW_DAYS = int(os.getenv('BACKFILL_WINDOW_DAYS', 365))  # Days fetched per request
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 4))  # Windows fetched in parallel
+
+# USBR data source: one page covering the Central Valley reservoirs, matched to
+# RESERVOIRS by their 'usbr_name'
+USBR_URL = os.getenv('USBR_URL', 'https://www.usbr.gov/mp/cvo/current.html')
+
+# API response cache (invalidated whenever the collector stores new readings)
+API_CACHE_TTL_SECONDS = int(os.getenv('API_CACHE_TTL_SECONDS', COLLECTION_INTERVAL_MINUTES * 60))
+API_CACHE_MAX_ENTRIES = int(os.getenv('API_CACHE_MAX_ENTRIES', 512))
+
+# Rollup resolution selection for /data: the finest resolution whose
+# maximum range covers the request is used; longer ranges fall back to monthly
+ROLLUP_MAX_RANGE_DAYS = {
+    'raw': 7,  # ~700 points at 15-minute collection
+    'hour': 90,  # ~2,200 points
+    'day': 3650,  # ~3,650 points
+}
+
+# Raw reading storage (see storage.py): 'sql' keeps every reading in the reservoir_data
+# table, 'partitioned' keeps one table per reservoir and month
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sql')
+# Drop raw months older than this many days (whole partitions; rollups are kept). Unset keeps everything.
+RAW_RETENTION_DAYS = int(os.environ['RAW_RETENTION_DAYS']) if os.getenv('RAW_RETENTION_DAYS') else None
+STORAGE_ARCHIVE_DIR = os.getenv('STORAGE_ARCHIVE_DIR')  # Write dropped months here as CSV first
+
+# Compress JSON/binary API responses at least this large (gzip, or brotli if installed)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
 
 # Environment detection
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'local')  # local, dev, prod
@@ -54,6 +145,58 @@ else:
     FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
     FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
 
+# Production WSGI server (gunicorn) settings, see gunicorn.conf.py
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', (os.cpu_count() or 1) * 2 + 1))  # Worker processes
+WEB_THREADS = int(os.getenv('WEB_THREADS', 4))  # Threads per worker
+WEB_KEEPALIVE_SECONDS = int(os.getenv('WEB_KEEPALIVE_SECONDS', 5))  # Idle keep-alive behind nginx
+WEB_TIMEOUT_SECONDS = int(os.getenv('WEB_TIMEOUT_SECONDS', 30))  # Kill workers stuck longer than this
+WEB_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv('WEB_GRACEFUL_TIMEOUT_SECONDS', 30))  # Drain time on reload/stop
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 5000))  # Recycle workers after this many requests
+
+# Live reading push (/api/stream, see stream.py). Each open stream holds a web server thread.
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', max(WEB_THREADS // 2, 1)))  # Open streams per process
+STREAM_POLL_SECONDS = float(os.getenv('STREAM_POLL_SECONDS', 2))  # How often the data version is checked
+STREAM_KEEPALIVE_SECONDS = 15  # Comment frame sent on idle streams
+STREAM_MAX_SECONDS = int(os.getenv('STREAM_MAX_SECONDS', 1800))  # Streams end after this; browsers reconnect
+STREAM_RETRY_MS = 5000  # Reconnect delay advertised to EventSource
+STREAM_QUEUE_SIZE = 100  # Events buffered per client before it is dropped
+
+# Database engine profile
+# Each process declares its role (scheduler.py: collector, backfill/rollup CLIs: cli);
+# the role picks the connection pool sizing below.
+DATABASE_ROLE = os.getenv('DATABASE_ROLE', 'web')  # web, collector or cli
+
+# PRAGMAs applied to every new SQLite connection. WAL lets the web process read
+# while the collector writes; synchronous=NORMAL is durable across application
+# crashes under WAL (a power loss can only lose the last commits).
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 10000)),  # Wait this long for a lock instead of failing
+    'cache_size': -int(os.getenv('SQLITE_CACHE_KB', 65536)),  # Negative = KiB of page cache per connection
+    'mmap_size': int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 * 1024)),  # Memory-map reads of the file
+    'temp_store': 'MEMORY',
+}
+
+# Connection pool sizing per process role (ignored for in-memory SQLite)
+DATABASE_POOL_PROFILES = {
+    'web': {  # One connection per request thread, a little headroom for bursts
+        'pool_size': WEB_THREADS,
+        'max_overflow': WEB_THREADS,
+        'pool_timeout': 10,
+    },
+    'collector': {  # A single writer plus the occasional reader (metrics, checks)
+        'pool_size': 2,
+        'max_overflow': 2,
+        'pool_timeout': 60,
+    },
+    'cli': {  # Batch jobs: one long-lived writer
+        'pool_size': 1,
+        'max_overflow': 4,
+        'pool_timeout': 60,
+    },
+}
+
 # Grafana settings (if using embedded Grafana)
 GRAFANA_URL = os.getenv('GRAFANA_URL', 'http://localhost:3000')
 GRAFANA_API_KEY = os.getenv('GRAFANA_API_KEY', '')
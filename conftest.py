@@ -0,0 +1,47 @@
+"""
+Shared pytest setup for Reservoir Dog
+Points the database at a throwaway SQLite file before any app module is imported
+"""
+import os
+import tempfile
+
+os.environ.setdefault(
+    'DATABASE_URL',
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='reservoirdog-test-'), 'reservoir_data.db')}"
+)
+
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    """A session on a freshly created schema, emptied after the test"""
+    from sqlalchemy import inspect, text
+    from database import Base, SessionLocal, engine, init_db
+    from storage import PARTITION_PREFIX
+    
+    init_db()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+            for name in inspect(conn).get_table_names():
+                if name.startswith(PARTITION_PREFIX):
+                    conn.execute(text(f'DROP TABLE {name}'))
+
+
+@pytest.fixture
+def client(db):
+    """Flask test client on a fresh app with empty response and stats caches"""
+    from app import api_cache, create_app
+    import stats
+    
+    api_cache.invalidate()
+    api_cache.hits = api_cache.misses = 0
+    stats.clear_cache()
+    return create_app().test_client()
@@ -1,12 +1,17 @@
 """
 Database models and setup for Reservoir Dog
 """
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Index
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, DateTime, Index, inspect, text, tuple_
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+import logging
+from metrics import instrument_engine
 import config
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 
@@ -23,9 +28,10 @@ class ReservoirData(Base):
     data_source = Column(String(50))  # 'CDEC', 'USBR', etc.
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    # Composite index for efficient time-series queries
+    # Composite unique index: one reading per reservoir per timestamp.
+    # Also serves time-series range queries and the ON CONFLICT target for bulk upserts.
     __table_args__ = (
-        Index('idx_reservoir_timestamp', 'reservoir_code', 'timestamp'),
+        Index('uq_reservoir_timestamp', 'reservoir_code', 'timestamp', unique=True),
     )
 
 
@@ -42,6 +48,89 @@ class ReservoirMetadata(Base):
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class RollupMixin:
+    """Columns shared by the hourly/daily/monthly rollup tables"""
+    id = Column(Integer, primary_key=True)
+    reservoir_code = Column(String(10), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    last_timestamp = Column(DateTime)  # newest reading folded into this bucket
+    sample_count = Column(Integer, nullable=False, default=0)  # raw readings in this bucket
+    storage_min = Column(Float)
+    storage_max = Column(Float)
+    storage_sum = Column(Float)
+    storage_count = Column(Integer, nullable=False, default=0)
+    storage_last = Column(Float)
+    elevation_min = Column(Float)
+    elevation_max = Column(Float)
+    elevation_sum = Column(Float)
+    elevation_count = Column(Integer, nullable=False, default=0)
+    elevation_last = Column(Float)
+
+
+class ReservoirRollupHourly(RollupMixin, Base):
+    """Hourly min/max/avg/last per reservoir"""
+    __tablename__ = 'reservoir_rollup_hourly'
+    __table_args__ = (
+        Index('uq_rollup_hourly', 'reservoir_code', 'bucket_start', unique=True),
+    )
+
+
+class ReservoirRollupDaily(RollupMixin, Base):
+    """Daily min/max/avg/last per reservoir"""
+    __tablename__ = 'reservoir_rollup_daily'
+    __table_args__ = (
+        Index('uq_rollup_daily', 'reservoir_code', 'bucket_start', unique=True),
+    )
+
+
+class ReservoirRollupMonthly(RollupMixin, Base):
+    """Monthly min/max/avg/last per reservoir"""
+    __tablename__ = 'reservoir_rollup_monthly'
+    __table_args__ = (
+        Index('uq_rollup_monthly', 'reservoir_code', 'bucket_start', unique=True),
+    )
+
+
+class DataVersion(Base):
+    """Single-row counter bumped whenever new readings are stored (used to invalidate caches)"""
+    __tablename__ = 'data_version'
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ReadingPartition(Base):
+    """Catalog of per-reservoir, per-month reading tables (partitioned storage backend)"""
+    __tablename__ = 'reading_partitions'
+    
+    id = Column(Integer, primary_key=True)
+    reservoir_code = Column(String(10), nullable=False)
+    month_start = Column(DateTime, nullable=False)
+    table_name = Column(String(64), nullable=False, unique=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('idx_partition_code_month', 'reservoir_code', 'month_start'),
+    )
+
+
+class BackfillCheckpoint(Base):
+    """Historical backfill windows that have been fetched and stored"""
+    __tablename__ = 'backfill_checkpoints'
+    
+    id = Column(Integer, primary_key=True)
+    reservoir_code = Column(String(10), nullable=False)
+    window_start = Column(DateTime, nullable=False)
+    window_end = Column(DateTime, nullable=False)
+    rows_fetched = Column(Integer)
+    completed_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index('uq_backfill_window', 'reservoir_code', 'window_start', 'window_end', unique=True),
+    )
+
+
 class Deployment(Base):
     """Deployment tracking"""
     __tablename__ = 'deployments'
@@ -56,14 +145,201 @@ class Deployment(Base):
     version = Column(String(50))  # Optional version tag
 
 
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def _apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def create_database_engine(url=None, role=None, pragmas=None):
+    """
+    Build an engine tuned for a process role ('web', 'collector' or 'cli')
+    SQLite connections get `pragmas` (default config.SQLITE_PRAGMAS) as they are opened;
+    pool sizing comes from config.DATABASE_POOL_PROFILES[role].
+    """
+    url = make_url(url or config.DATABASE_URL)
+    role = role or config.DATABASE_ROLE
+    pragmas = config.SQLITE_PRAGMAS if pragmas is None else pragmas
+    
+    options = {'echo': False}
+    if not _is_memory_sqlite(url):
+        options.update(config.DATABASE_POOL_PROFILES[role])
+        options['pool_pre_ping'] = url.get_backend_name() != 'sqlite'
+    new_engine = create_engine(url, **options)
+    
+    if url.get_backend_name() == 'sqlite' and pragmas:
+        @event.listens_for(new_engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            _apply_sqlite_pragmas(dbapi_connection, pragmas)
+    if config.METRICS_ENABLED:
+        instrument_engine(new_engine)
+    return new_engine
+
+
 # Database setup
-engine = create_engine(config.DATABASE_URL, echo=False)
+engine = create_database_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def configure_engine(role):
+    """
+    Rebuild the shared engine for this process's role and rebind SessionLocal to it.
+    Call once at process start, before any session is opened.
+    """
+    global engine
+    engine.dispose()
+    engine = create_database_engine(role=role)
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+# Rows per executemany call inside one bulk upsert transaction
+UPSERT_CHUNK_SIZE = 5000
+
+
+def dispose_engine():
+    """
+    Drop pooled connections inherited from a parent process without closing them.
+    Call in a freshly forked worker so it never reuses the parent's sockets.
+    """
+    engine.dispose(close=False)
+
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(engine)
+    _migrate_reservoir_data_unique_index()
+    _migrate_rollups()
+
+
+def _migrate_reservoir_data_unique_index():
+    """
+    Bring databases created before the unique (reservoir_code, timestamp) index up to date.
+    Removes duplicate readings (keeping the first stored) and replaces the old
+    non-unique composite index. Does nothing once the unique index exists.
+    """
+    index_names = {index['name'] for index in inspect(engine).get_indexes('reservoir_data')}
+    if 'uq_reservoir_timestamp' in index_names:
+        return
+    
+    with engine.begin() as conn:
+        conn.execute(text(
+            "DELETE FROM reservoir_data WHERE id NOT IN ("
+            "SELECT MIN(id) FROM reservoir_data GROUP BY reservoir_code, timestamp)"
+        ))
+        conn.execute(text("DROP INDEX IF EXISTS idx_reservoir_timestamp"))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_reservoir_timestamp "
+            "ON reservoir_data (reservoir_code, timestamp)"
+        ))
+
+
+def _migrate_rollups():
+    """
+    Fill the rollup tables for readings stored before they existed (or loaded around them).
+    Rebuilds a reservoir's rollups when the hour of its first stored reading has no hourly
+    bucket; does nothing once every reservoir's history is rolled up.
+    """
+    # Imported here: rollups and storage import this module
+    from rollups import rebuild_rollups, truncate
+    from storage import get_store
+    
+    store = get_store()
+    db = SessionLocal()
+    try:
+        missing = []
+        for code in store.codes(db):
+            first, _ = store.bounds(db, code)
+            if first is not None and db.query(ReservoirRollupHourly.id).filter(
+                ReservoirRollupHourly.reservoir_code == code,
+                ReservoirRollupHourly.bucket_start == truncate('hour', first),
+            ).first() is None:
+                missing.append(code)
+    finally:
+        db.close()
+    
+    if missing:
+        logger.warning(f"Rollups missing for {missing}; rebuilding from raw readings")
+        rebuild_rollups(missing)
+
+
+def insert_ignore_duplicates(bind, table, index_elements=('reservoir_code', 'timestamp')):
+    """Build an INSERT for table that skips rows conflicting on index_elements (its unique key)"""
+    dialect = bind.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing(index_elements=list(index_elements))
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing(index_elements=list(index_elements))
+    if dialect in ('mysql', 'mariadb'):
+        return table.insert().prefix_with('IGNORE')
+    raise NotImplementedError(f"Bulk upsert is not supported for the {dialect} dialect")
+
+
+def upsert_reservoir_data(db, rows):
+    """
+    Insert readings in bulk, skipping any (reservoir_code, timestamp) already stored.
+    Runs inside the caller's transaction; the caller commits.
+    rows: list of dicts keyed by ReservoirData column names
+    Returns: number of rows actually inserted
+    """
+    if not rows:
+        return 0
+    
+    table = ReservoirData.__table__
+    stmt = insert_ignore_duplicates(db.get_bind(), table)
+    inserted = 0
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        result = db.execute(stmt, rows[start:start + UPSERT_CHUNK_SIZE])
+        inserted += max(result.rowcount, 0)
+    return inserted
+
+
+def bump_data_version(db):
+    """
+    Increment the data version inside the caller's transaction.
+    Call from any write path that stores readings so readers drop cached responses.
+    """
+    updated = db.query(DataVersion).filter(DataVersion.id == 1).update(
+        {DataVersion.version: DataVersion.version + 1, DataVersion.updated_at: datetime.utcnow()},
+        synchronize_session=False,
+    )
+    if not updated:
+        db.add(DataVersion(id=1, version=1))
+
+
+def get_data_version(db=None):
+    """Current data version (0 before anything has been stored)"""
+    session = db or SessionLocal()
+    try:
+        version = session.query(DataVersion.version).filter(DataVersion.id == 1).scalar()
+        return version or 0
+    finally:
+        if db is None:
+            session.close()
+
+
+def load_reservoir_data(db, keys):
+    """
+    Load stored readings for many (reservoir_code, timestamp) pairs, UPSERT_CHUNK_SIZE pairs per query
+    Returns: dict mapping (reservoir_code, timestamp) to ReservoirData
+    """
+    keys = list(keys)
+    loaded = {}
+    for start in range(0, len(keys), UPSERT_CHUNK_SIZE):
+        rows = db.query(ReservoirData).filter(
+            tuple_(ReservoirData.reservoir_code, ReservoirData.timestamp).in_(keys[start:start + UPSERT_CHUNK_SIZE])
+        ).all()
+        loaded.update({(row.reservoir_code, row.timestamp): row for row in rows})
+    return loaded
 
 
 def get_db():
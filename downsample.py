@@ -0,0 +1,87 @@
+"""
+Shape-preserving downsampling for time-series responses
+"""
+import numpy as np
+import pandas as pd
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: pick `threshold` points that keep the visual shape of (x, y)
+    The first and last points are always kept. Each bucket keeps the point forming the largest
+    triangle with the previously kept point and the average of the next bucket; the per-bucket
+    search is vectorized, so the Python loop runs once per output point, not per input point.
+    Returns: sorted numpy array of indices into x/y
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    # Bucket boundaries over the interior points [1, n - 1)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    
+    # Average of every bucket, computed once; the last point acts as a final bucket
+    sums_x = np.add.reduceat(x[1:n - 1], starts - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], starts - 1)
+    counts = ends - starts
+    avg_x = np.append(sums_x / counts, x[n - 1])
+    avg_y = np.append(sums_y / counts, y[n - 1])
+    
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket, (start, end) in enumerate(zip(starts, ends)):
+        ax, ay = x[previous], y[previous]
+        cx, cy = avg_x[bucket + 1], avg_y[bucket + 1]
+        bx, by = x[start:end], y[start:end]
+        areas = np.abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(x, y, threshold):
+    """
+    Min/max bucketing: split the series into buckets and keep each bucket's extremes plus the endpoints
+    Returns: sorted numpy array of indices into x/y
+    """
+    n = len(x)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+    
+    # Two points per bucket plus both endpoints stays within threshold
+    bucket_count = (threshold - 2) // 2
+    buckets = np.arange(n) * bucket_count // n
+    grouped = pd.Series(y).groupby(buckets)
+    indices = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return np.union1d(indices, [0, n - 1])
+
+
+def downsample_series(series, max_points, method='lttb'):
+    """
+    Reduce a series of (timestamp, reservoir_elevation, storage, storage_percent) to at most max_points
+    Points are chosen on storage (elevation when no storage is recorded). Elevation is a monotonic
+    function of storage for a reservoir, so the same points preserve the shape of both curves.
+    Points without a value for the chosen metric are dropped.
+    """
+    if max_points is None or len(series) <= max_points:
+        return series
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    
+    frame = pd.DataFrame.from_records(
+        series, columns=['timestamp', 'reservoir_elevation', 'storage', 'storage_percent']
+    )
+    metric = 'storage' if frame['storage'].notna().any() else 'reservoir_elevation'
+    frame = frame[frame[metric].notna()]
+    if len(frame) <= max_points:
+        return [series[position] for position in frame.index]
+    
+    x = frame['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(np.float64)
+    y = frame[metric].to_numpy(dtype=np.float64)
+    pick = lttb_indices if method == 'lttb' else minmax_indices
+    positions = frame.index.to_numpy()[pick(x, y, max_points)]
+    return [series[position] for position in positions]
@@ -0,0 +1,39 @@
+"""
+Gunicorn configuration for Reservoir Dog
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Sizing comes from config.py (WEB_* settings, overridable via environment).
+Send SIGHUP for a graceful reload: new workers start before old ones finish
+their in-flight requests.
+"""
+# Imported under a private name: gunicorn treats module-level names as settings
+import config as _config
+
+bind = f'{_config.FLASK_HOST}:{_config.FLASK_PORT}'
+workers = _config.WEB_WORKERS
+threads = _config.WEB_THREADS
+worker_class = 'gthread' if _config.WEB_THREADS > 1 else 'sync'
+keepalive = _config.WEB_KEEPALIVE_SECONDS
+timeout = _config.WEB_TIMEOUT_SECONDS
+graceful_timeout = _config.WEB_GRACEFUL_TIMEOUT_SECONDS
+max_requests = _config.WEB_MAX_REQUESTS
+max_requests_jitter = _config.WEB_MAX_REQUESTS // 10
+
+# Workers import the app themselves, so each builds its own engine and pool
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Create tables once in the master before any worker starts"""
+    from database import init_db
+    init_db()
+
+
+def post_fork(server, worker):
+    """Never reuse database connections opened before the fork"""
+    from database import dispose_engine
+    dispose_engine()
@@ -0,0 +1,132 @@
+"""
+Conditional-GET caching for the collector's HTTP session
+
+ConditionalGetAdapter remembers the ETag / Last-Modified validators and body of
+each plain GET and revalidates on the next request for the same URL. A 304 is
+turned back into the cached 200 response, so callers never see it. Every
+response it handles carries two extra attributes:
+
+    response.from_cache      True when the body came from the cache (server said 304)
+    response.content_sha256  hex digest of the body, for skipping re-parses
+"""
+from collections import OrderedDict, namedtuple
+import hashlib
+import threading
+
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+# Headers describing the (empty) 304 body rather than the cached representation
+BODY_HEADERS = ('content-length', 'content-encoding', 'transfer-encoding', 'content-type')
+
+CacheEntry = namedtuple('CacheEntry', ['etag', 'last_modified', 'sha256', 'body', 'headers', 'encoding'])
+
+
+class HTTPCache:
+    """Thread-safe LRU of CacheEntry by URL, with hit counters"""
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.not_modified = 0  # 304s answered from the cache
+        self.downloads = 0  # full 200 bodies received
+        self.unchanged_downloads = 0  # 200s whose body matched the cached one
+    
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+    
+    def set(self, url, entry):
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'not_modified': self.not_modified,
+                'downloads': self.downloads,
+                'unchanged_downloads': self.unchanged_downloads,
+            }
+
+
+class ConditionalGetAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that sends If-None-Match / If-Modified-Since for URLs it has seen
+    Only non-streamed GETs are cached; streamed downloads pass straight through.
+    """
+    
+    def __init__(self, cache=None, **kwargs):
+        self.cache = cache if cache is not None else HTTPCache()
+        super().__init__(**kwargs)
+    
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET' or stream:
+            return super().send(request, stream=stream, **kwargs)
+        
+        entry = self.cache.get(request.url)
+        if entry is not None and entry.body is not None:
+            if entry.etag:
+                request.headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                request.headers['If-Modified-Since'] = entry.last_modified
+        
+        response = super().send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and entry is not None and entry.body is not None:
+            self.cache.count('not_modified')
+            cached = self._cached_response(request, response, entry)
+            if (cached.headers.get('ETag'), cached.headers.get('Last-Modified')) != entry[:2]:
+                self.cache.set(request.url, entry._replace(
+                    etag=cached.headers.get('ETag'), last_modified=cached.headers.get('Last-Modified'),
+                    headers=dict(cached.headers),
+                ))
+            return cached
+        
+        response.from_cache = False
+        response.content_sha256 = hashlib.sha256(response.content).hexdigest()
+        if response.status_code == 200:
+            self.cache.count('downloads')
+            if entry is not None and entry.sha256 == response.content_sha256:
+                self.cache.count('unchanged_downloads')
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            # Without validators the server can't answer 304, so only the digest is worth keeping
+            body = response.content if etag or last_modified else None
+            self.cache.set(request.url, CacheEntry(
+                etag, last_modified, response.content_sha256, body, dict(response.headers), response.encoding,
+            ))
+        return response
+    
+    @staticmethod
+    def _cached_response(request, not_modified, entry):
+        """The cached 200 response, refreshed with the headers of the 304"""
+        not_modified.close()
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.headers.update({
+            name: value for name, value in not_modified.headers.items()
+            if name.lower() not in BODY_HEADERS
+        })
+        response.encoding = entry.encoding
+        response.elapsed = not_modified.elapsed
+        response.connection = not_modified.connection
+        response._content = entry.body
+        response.from_cache = True
+        response.content_sha256 = entry.sha256
+        return response
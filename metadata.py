@@ -0,0 +1,168 @@
+"""
+Reservoir metadata: capacity and maximum pool elevation
+
+Values come from each station's CDEC staMeta page (config cdec_metadata_url) and
+are persisted in the reservoir_metadata table. Rows older than
+METADATA_MAX_AGE_DAYS are refetched by refresh_metadata(), which the scheduler
+runs daily; a station whose page can't be fetched or parsed keeps its stored row,
+or falls back to the capacity configured in config.RESERVOIRS.
+
+Capacities are also held in memory (reloaded from the table at most every
+METADATA_RELOAD_SECONDS), so storage_percent() costs no query on the write path
+or in rollup queries, and web workers pick up the scheduler's refreshes.
+
+Usage:
+    python metadata.py            # refresh stale rows
+    python metadata.py --force    # refetch every station
+"""
+import argparse
+from datetime import datetime, timedelta
+import logging
+import threading
+import time
+
+from database import ReservoirMetadata, SessionLocal, bump_data_version, configure_engine, init_db
+from parsers import parse_station_metadata
+import config
+
+logger = logging.getLogger(__name__)
+
+_capacities = None
+_loaded_at = None  # time.monotonic() of the last load
+_lock = threading.Lock()
+
+
+def _fallback(code):
+    """Capacity / max elevation configured for a reservoir (used until CDEC has been read)"""
+    reservoir = config.RESERVOIRS.get(code, {})
+    return {'capacity_acre_feet': reservoir.get('capacity_acre_feet'), 'max_elevation': reservoir.get('max_elevation')}
+
+
+def load_capacities(db=None):
+    """
+    (Re)load the in-memory capacity map from the reservoir_metadata table
+    Returns: dict mapping reservoir code to capacity in acre-feet
+    """
+    global _capacities, _loaded_at
+    session = db or SessionLocal()
+    try:
+        stored = dict(session.query(ReservoirMetadata.reservoir_code, ReservoirMetadata.capacity_acre_feet))
+    except Exception as e:
+        logger.warning(f"Could not read reservoir metadata, using configured capacities: {e}")
+        stored = {}
+    finally:
+        if db is None:
+            session.close()
+    
+    capacities = {code: _fallback(code)['capacity_acre_feet'] for code in config.RESERVOIRS}
+    capacities.update({code: capacity for code, capacity in stored.items() if capacity})
+    with _lock:
+        _capacities = capacities
+        _loaded_at = time.monotonic()
+    return capacities
+
+
+def capacities():
+    """In-memory capacity map, loaded on first use and reloaded once METADATA_RELOAD_SECONDS old"""
+    if _capacities is None or time.monotonic() - _loaded_at >= config.METADATA_RELOAD_SECONDS:
+        load_capacities()
+    return _capacities
+
+
+def storage_percent(code, storage):
+    """Storage as a percentage of the reservoir's capacity, or None when either is unknown"""
+    capacity = capacities().get(code)
+    if storage is None or not capacity:
+        return None
+    return round(storage / capacity * 100, 2)
+
+
+def fetch_station_metadata(session, code):
+    """
+    Fetch and parse one station's staMeta page
+    Returns: dict with capacity_acre_feet and max_elevation, or None if the fetch failed
+    """
+    url = config.RESERVOIRS[code].get('cdec_metadata_url')
+    if not url:
+        return None
+    try:
+        response = session.get(url, timeout=config.REQUEST_TIMEOUT_SECONDS)
+        if response.status_code != 200:
+            logger.error(f"Failed to fetch metadata for {code}: {response.status_code}")
+            return None
+        return parse_station_metadata(response.content)
+    except Exception as e:
+        logger.error(f"Error fetching metadata for {code}: {e}")
+        return None
+
+
+def refresh_metadata(session=None, force=False, now=None):
+    """
+    Refetch metadata for reservoirs whose row is missing or older than METADATA_MAX_AGE_DAYS
+    session: requests-like session to fetch with (the collector passes its own)
+    Returns: list of codes whose row was written
+    """
+    if session is None:
+        from collector import ReservoirCollector
+        session = ReservoirCollector().session
+    now = now or datetime.utcnow()
+    stale_before = now - timedelta(days=config.METADATA_MAX_AGE_DAYS)
+    
+    db = SessionLocal()
+    try:
+        rows = {row.reservoir_code: row for row in db.query(ReservoirMetadata)}
+        refreshed = []
+        for code, reservoir in config.RESERVOIRS.items():
+            row = rows.get(code)
+            if row is not None and not force and row.last_updated and row.last_updated >= stale_before:
+                continue
+            
+            fetched = fetch_station_metadata(session, code)
+            if fetched is None:
+                continue  # keep what we have (or the configured fallback) and try again next time
+            values = _fallback(code)
+            if row is not None:
+                values.update({'capacity_acre_feet': row.capacity_acre_feet, 'max_elevation': row.max_elevation})
+            values.update({field: value for field, value in fetched.items() if value is not None})
+            
+            if row is None:
+                row = ReservoirMetadata(reservoir_code=code)
+                db.add(row)
+            row.name = reservoir.get('name')
+            row.dam_name = reservoir.get('dam_name')
+            row.capacity_acre_feet = values['capacity_acre_feet']
+            row.max_elevation = values['max_elevation']
+            row.last_updated = now
+            refreshed.append(code)
+        if refreshed:
+            # Cached API responses carry storage_percent computed from the old capacities
+            bump_data_version(db)
+        db.commit()
+        load_capacities(db)
+        if refreshed:
+            logger.info(f"Refreshed metadata for {refreshed}: {capacities()}")
+        return refreshed
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='Refresh reservoir capacity metadata from CDEC')
+    parser.add_argument('--force', action='store_true', help='Refetch every station, not just stale ones')
+    args = parser.parse_args(argv)
+    
+    configure_engine('cli')
+    init_db()
+    refreshed = refresh_metadata(force=args.force)
+    print(f"Refreshed: {', '.join(refreshed) or 'nothing (all fresh)'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+In-process instrumentation exported in the Prometheus text format
+
+A small registry of counters, gauges and histograms (no client library needed).
+The web app serves it from /metrics (see app.py). The collector process serves it
+from a background HTTP server (start_metrics_server, started by scheduler.py).
+Hot paths record into the module-level metrics below:
+
+    http_request_duration   Flask request latency by route, method and status
+    db_query_duration       SQL statement count/latency by operation (SQLAlchemy events)
+    collector_stage_duration  fetch/parse time per station, save time per batch
+    collector_fetches       fetch outcomes per station (ok, not_modified, error, skipped)
+
+State that already lives elsewhere (API response cache, HTTP cache, circuit
+breakers) is exported through callbacks that are read at scrape time.
+
+Every process keeps its own registry; under gunicorn each worker reports the
+requests it served itself.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import math
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; wide enough for both sub-millisecond SQL and 30 s upstream timeouts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """Base for labelled metrics: one child value per distinct label tuple"""
+    kind = 'untyped'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+    
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values
+        ]
+    
+    def value(self, **labels):
+        """Current value for a label set (for tests and ad-hoc inspection)"""
+        with self._lock:
+            return self._values.get(self._key(labels))
+    
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+    
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; each child is [bucket counts..., sum, count]"""
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._values.get(key)
+            if child is None:
+                child = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            child[index] += 1  # the last slot is the +Inf bucket
+            child[-2] += value
+            child[-1] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def value(self, **labels):
+        """(sum, count) for a label set, or None"""
+        child = super().value(**labels)
+        return None if child is None else (child[-2], child[-1])
+    
+    def total(self, **labels):
+        """(sum, count) over every label set matching the given labels (e.g. stage='parse')"""
+        positions = {self.labelnames.index(name): str(value) for name, value in labels.items()}
+        with self._lock:
+            children = [child for key, child in self._values.items()
+                        if all(key[i] == value for i, value in positions.items())]
+        return sum(child[-2] for child in children), sum(child[-1] for child in children)
+    
+    def render(self):
+        with self._lock:
+            values = sorted((key, list(child)) for key, child in self._values.items())
+        lines = self.header()
+        for key, child in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(child[-2])}')
+            lines.append(f'{self.name}_count{labels} {child[-1]}')
+        return lines
+
+
+class CallbackMetric(Metric):
+    """Metric whose samples are read at scrape time: fn() returns [(labels dict, value), ...]"""
+    
+    def __init__(self, name, documentation, fn, kind='gauge', labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.fn = fn
+    
+    def render(self):
+        try:
+            samples = list(self.fn())
+        except Exception as e:
+            logger.error(f"Metrics callback {self.name} failed: {e}")
+            return []
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, [labels[name] for name in self.labelnames])} '
+            f'{_format_value(value)}'
+            for labels, value in samples
+        ]
+
+
+class Registry:
+    """Named metrics rendered together; registering a name again replaces the old metric"""
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def callback(self, name, documentation, fn, kind='gauge', labelnames=()):
+        return self.register(CallbackMetric(name, documentation, fn, kind, labelnames))
+    
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+http_request_duration = REGISTRY.histogram(
+    'rdog_http_request_duration_seconds', 'Flask request latency', ('method', 'route', 'status'))
+db_query_duration = REGISTRY.histogram(
+    'rdog_db_query_duration_seconds', 'SQL statement latency', ('operation',))
+collector_stage_duration = REGISTRY.histogram(
+    'rdog_collector_stage_duration_seconds', 'Collector fetch/parse time per station and save time per batch',
+    ('stage', 'target'))  # target: station code, or the data source for saves
+collector_fetches = REGISTRY.counter(
+    'rdog_collector_fetches_total', 'Collector fetches by target and outcome', ('target', 'result'))
+
+
+def instrument_engine(engine):
+    """Record every statement run on engine into db_query_duration"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+    
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        db_query_duration.observe(time.perf_counter() - started, operation=operation)
+    
+    @event.listens_for(engine, 'handle_error')
+    def drop_query_timer(context):
+        if context.connection is not None and context.connection.info.get('query_started'):
+            context.connection.info['query_started'].pop()
+    return engine
+
+
+def instrument_app(app):
+    """Time every request into http_request_duration, labelled by URL rule rather than path"""
+    from flask import g, request
+    
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+    
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+            http_request_duration.observe(time.perf_counter() - started, method=request.method,
+                                          route=route, status=response.status_code)
+        return response
+    return app
+
+
+def start_metrics_server(host, port, registry=REGISTRY):
+    """
+    Serve registry.render() at /metrics from a daemon thread (for processes without Flask)
+    Returns: the ThreadingHTTPServer (call shutdown() to stop it)
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
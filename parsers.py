@@ -0,0 +1,316 @@
+"""
+Parsers for the pages and data services used by the collector
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime
+import logging
+
+import lxml.etree
+import lxml.html
+
+logger = logging.getLogger(__name__)
+
+# Values CDEC uses for missing readings
+CDEC_MISSING_VALUES = {'', '--', '---', 'N/A'}
+
+
+# Timestamp formats seen on CDEC pages
+CDEC_TIMESTAMP_FORMATS = [
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S',
+    '%m/%d/%Y',
+]
+
+
+def parse_cdec_timestamp(timestamp_str):
+    """Parse various timestamp formats from CDEC"""
+    for fmt in CDEC_TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(timestamp_str, fmt)
+        except ValueError:
+            continue
+    
+    # If all fail, return current time
+    logger.warning(f"Could not parse timestamp: {timestamp_str}, using current time")
+    return datetime.utcnow()
+
+
+def _parse_cdec_number(value):
+    """Parse a CDEC numeric cell, returning None for missing values"""
+    value = value.strip()
+    if value in CDEC_MISSING_VALUES:
+        return None
+    return float(value.replace(',', ''))
+
+
+def iter_cdec_csv(lines):
+    """
+    Stream records out of a CDEC CSVDataServlet response
+    lines: iterable of decoded text lines (e.g. response.iter_lines(decode_unicode=True))
+    Yields: (station_id, sensor_number, timestamp, value) with value None when missing
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        return
+    
+    columns = {name.strip().upper(): index for index, name in enumerate(header)}
+    try:
+        station_col = columns['STATION_ID']
+        sensor_col = columns['SENSOR_NUMBER']
+        time_col = columns['OBS DATE'] if 'OBS DATE' in columns else columns['DATE TIME']
+        value_col = columns['VALUE']
+    except KeyError:
+        logger.warning(f"Unexpected CDEC CSV header: {header}")
+        return
+    
+    for row in reader:
+        if len(row) <= max(station_col, sensor_col, time_col, value_col):
+            continue
+        try:
+            timestamp = datetime.strptime(row[time_col].strip(), '%Y%m%d %H%M')
+            value = _parse_cdec_number(row[value_col])
+            sensor = int(row[sensor_col])
+        except ValueError:
+            logger.debug(f"Skipping malformed CDEC CSV row: {row}")
+            continue
+        yield row[station_col].strip().upper(), sensor, timestamp, value
+
+
+# Value the CDEC JSON data service uses for missing readings
+CDEC_JSON_MISSING = -9999
+
+
+def iter_cdec_json(content):
+    """
+    Records from a CDEC JSONDataServlet response (a list of one object per sensor reading)
+    content: response body as bytes or str
+    Yields: (station_id, sensor_number, timestamp, value) with value None when missing
+    """
+    try:
+        records = json.loads(content)
+    except ValueError as e:
+        logger.warning(f"Unreadable CDEC JSON response: {e}")
+        return
+    
+    for record in records:
+        try:
+            timestamp = datetime.strptime(record.get('obsDate') or record['date'], '%Y-%m-%d %H:%M')
+            value = record.get('value')
+            value = None if value is None or value == CDEC_JSON_MISSING else float(value)
+            yield record['stationId'].strip().upper(), int(record['SENS_NO']), timestamp, value
+        except (KeyError, TypeError, ValueError):
+            logger.debug(f"Skipping malformed CDEC JSON record: {record}")
+
+
+def merge_cdec_sensors(records, sensors):
+    """
+    Combine per-sensor CDEC records into reservoir readings
+    records: iterable of (station_id, sensor_number, timestamp, value)
+    sensors: mapping of reading field ('reservoir_elevation', 'storage') to sensor number
+    Returns: dict mapping station_id to a timestamp-ordered list of
+             (timestamp, reservoir_elevation, storage); rows with no values are dropped
+    """
+    fields = {number: field for field, number in sensors.items()}
+    merged = {}
+    for station, sensor, timestamp, value in records:
+        field = fields.get(sensor)
+        if field is None or value is None:
+            continue
+        reading = merged.setdefault(station, {}).setdefault(timestamp, {})
+        reading[field] = value
+    
+    return {
+        station: [(timestamp, values.get('reservoir_elevation'), values.get('storage'))
+                  for timestamp, values in sorted(readings.items())]
+        for station, readings in merged.items()
+    }
+
+
+def _iter_rows_backwards(content, table_start):
+    """
+    Yield raw <tr> segments of the table starting at table_start, last row first
+    Only byte searches are used to locate rows; nothing is parsed here.
+    """
+    lowered = content[table_start:].lower()
+    row_end = lowered.rfind(b'</table')
+    if row_end == -1:
+        row_end = len(lowered)
+    
+    while row_end > 0:
+        row_start = lowered.rfind(b'<tr', 0, row_end)
+        if row_start == -1:
+            return
+        # Skip tags that merely start with "tr" (e.g. <track>)
+        if lowered[row_start + 3:row_start + 4] in (b'>', b' ', b'\t', b'\n', b'\r', b'/'):
+            yield content[table_start + row_start:table_start + row_end]
+        row_end = row_start
+
+
+def parse_cdec_query_table(content):
+    """
+    Extract the latest valid reading from a CDEC QueryF page
+    The readings live in the last table on the page, newest row last. Rather than
+    building a tree for the whole document, jump to the last <table> and parse
+    rows one at a time from the end until one has both elevation and storage.
+    content: page body as bytes (or str)
+    Returns: (timestamp, reservoir_elevation, storage) or None
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    
+    table_start = max(content.rfind(b'<table'), content.rfind(b'<TABLE'))
+    if table_start == -1:
+        # Mixed-case tag names are rare enough to pay for a full lowercase copy
+        table_start = content.lower().rfind(b'<table')
+    if table_start == -1:
+        logger.warning("No tables found in CDEC page")
+        return None
+    
+    for segment in _iter_rows_backwards(content, table_start):
+        row = lxml.html.fragment_fromstring(b'<table>' + segment + b'</table>')
+        cells = list(row.iter('td'))
+        if len(cells) < 3:
+            continue
+        
+        timestamp_str = cells[0].text_content().strip()
+        elevation_str = cells[1].text_content().strip()
+        storage_str = cells[2].text_content().strip()
+        
+        # Skip rows with missing data
+        if elevation_str == '--' or storage_str == '--':
+            continue
+        
+        try:
+            return (
+                parse_cdec_timestamp(timestamp_str),
+                float(elevation_str.replace(',', '')),
+                float(storage_str.replace(',', '')),
+            )
+        except ValueError as e:
+            logger.debug(f"Skipping row due to parse error: {e}")
+            continue
+    
+    logger.warning("No valid data rows found in CDEC page")
+    return None
+
+
+# Label cells on a CDEC staMeta page, matched case-insensitively (the station's own
+# "Elevation" is the gauge site, not the reservoir's maximum pool)
+STATION_METADATA_LABELS = {
+    'capacity_acre_feet': ('capacity',),
+    'max_elevation': ('maximum pool elevation', 'max pool elevation', 'maximum elevation', 'spillway elevation'),
+}
+
+
+def parse_station_metadata(content):
+    """
+    Extract reservoir capacity and maximum pool elevation from a CDEC staMeta page
+    The page lays out label/value cell pairs in several tables; values may carry units.
+    content: page body as bytes or str
+    Returns: dict with capacity_acre_feet and max_elevation (None when not on the page)
+    """
+    metadata = {field: None for field in STATION_METADATA_LABELS}
+    try:
+        document = lxml.html.fromstring(content)
+    except Exception as e:
+        logger.warning(f"Could not parse station metadata page: {e}")
+        return metadata
+    
+    for row in document.iter('tr'):
+        cells = [cell.text_content().strip() for cell in row.iter('td')]
+        for label, value in zip(cells[::2], cells[1::2]):
+            label = label.lower()
+            for field, patterns in STATION_METADATA_LABELS.items():
+                if metadata[field] is None and any(pattern in label for pattern in patterns):
+                    match = re.search(r'-?[\d,]+(?:\.\d+)?', value)
+                    if match:
+                        metadata[field] = float(match.group().replace(',', ''))
+    return metadata
+
+
+# Column headings on the USBR CVO reservoir table, matched case-insensitively
+# (the first matching column wins, so "Storage" is taken before "Avg Storage")
+USBR_COLUMN_LABELS = {
+    'name': ('reservoir',),
+    'date': ('date',),
+    'reservoir_elevation': ('elev',),
+    'storage': ('storage',),
+}
+USBR_NAME_NOISE = re.compile(r'\b(LAKE|RESERVOIR|RES)\b|\(.*?\)|[^A-Z]')
+USBR_DATE = re.compile(rb'\b(\d{1,2}/\d{1,2}/\d{4})\b')
+
+
+def usbr_name_key(name):
+    """Normalise a reservoir name as written on the CVO page ("Shasta Lake*" -> "SHASTA")"""
+    return USBR_NAME_NOISE.sub('', name.upper())
+
+
+def _usbr_columns(cells):
+    """Map reading fields to column indexes for a header row, or None if it isn't one"""
+    columns = {}
+    for index, cell in enumerate(cells):
+        label = cell.lower()
+        for field, patterns in USBR_COLUMN_LABELS.items():
+            if field not in columns and any(pattern in label for pattern in patterns):
+                columns[field] = index
+                break
+    return columns if 'name' in columns and 'storage' in columns else None
+
+
+def parse_usbr_reservoirs(content, names):
+    """
+    Extract current readings for many reservoirs from the USBR CVO page in one pass
+    Rows are streamed through lxml's parser and discarded as they are read, so the
+    document is never held as a tree. Columns are located from each table's header
+    row; rows without a date cell use the first date on the page before the table.
+    content: page body as bytes or str
+    names: mapping of reservoir name (as on the page, any case) to reservoir code
+    Returns: dict mapping reservoir code to (timestamp, reservoir_elevation, storage)
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    codes = {usbr_name_key(name): code for name, code in names.items()}
+    first_table = content.lower().find(b'<table')
+    page_date = USBR_DATE.search(content, 0, first_table if first_table != -1 else len(content))
+    page_date = parse_cdec_timestamp(page_date.group(1).decode()) if page_date else None
+    
+    readings = {}
+    columns = None
+    rows = lxml.etree.iterparse(io.BytesIO(content), events=('end',), tag='tr', html=True, recover=True)
+    for _, row in rows:
+        cells = [''.join(cell.itertext()).strip() for cell in row if cell.tag in ('td', 'th')]
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+        header = _usbr_columns(cells)
+        if header:
+            columns = header
+            continue
+        if columns is None or len(cells) <= max(columns.values()):
+            continue
+        
+        code = codes.get(usbr_name_key(cells[columns['name']]))
+        if code is None or code in readings:
+            continue
+        try:
+            storage = _parse_cdec_number(cells[columns['storage']])
+            elevation = _parse_cdec_number(cells[columns['reservoir_elevation']]) if 'reservoir_elevation' in columns else None
+        except ValueError:
+            logger.debug(f"Skipping malformed USBR row: {cells}")
+            continue
+        timestamp = page_date
+        row_date = USBR_DATE.search(cells[columns['date']].encode()) if 'date' in columns else None
+        if row_date:
+            timestamp = parse_cdec_timestamp(row_date.group(1).decode())
+        if storage is None or timestamp is None:
+            continue
+        readings[code] = (timestamp, elevation, storage)
+    
+    if not readings:
+        logger.warning("No configured reservoirs found on the USBR page")
+    return readings
@@ -0,0 +1,190 @@
+"""
+Adaptive per-station polling
+
+Each station's publish cadence is learned from the readings already stored for
+it (median spacing of recent timestamps), and its publication lag from which
+polls did and did not find the next reading (see StationState). The next fetch
+is scheduled just after the next reading should be available. A station that
+stays stale past its known lag is retried with exponential backoff, never
+waiting longer than one cadence (or POLLING_MAX_BACKOFF_MINUTES).
+
+Station timestamps are whatever CDEC reports (local station time); the learned
+lag absorbs any fixed offset from the collector's UTC clock.
+"""
+from collections import deque
+from datetime import datetime, timedelta
+import logging
+import random
+import statistics
+import threading
+
+from database import SessionLocal
+from storage import get_store
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def learn_cadence(timestamps, default):
+    """Median spacing of consecutive timestamps, or default with fewer than two"""
+    ordered = sorted(timestamps)
+    gaps = [later - earlier for earlier, later in zip(ordered, ordered[1:]) if later > earlier]
+    if not gaps:
+        return default
+    return statistics.median(gaps)
+
+
+class StationState:
+    """
+    What the poller knows about one station
+    The publication lag (time from a reading's timestamp until it can be fetched) is kept as
+    a bracket: polls that found nothing raise lag_low, polls that found a new reading lower
+    lag_high. Polls bisect the bracket until it is narrower than the retry interval, after
+    which each reading costs a single poll at lag_high.
+    """
+    
+    def __init__(self, code, timestamps, default_cadence):
+        self.code = code
+        self.default_cadence = default_cadence
+        self.timestamps = deque(sorted(timestamps)[-config.POLLING_HISTORY_READINGS:],
+                                maxlen=config.POLLING_HISTORY_READINGS)
+        self.cadence = learn_cadence(self.timestamps, default_cadence)
+        self.lag_low = timedelta(0)
+        self.lag_high = None  # None until a new reading has been seen (or the lag outgrew it)
+        self.misses = 0  # consecutive polls past lag_high (or with it unknown) that found nothing
+        self.next_poll = None
+    
+    @property
+    def last_timestamp(self):
+        return self.timestamps[-1] if self.timestamps else None
+    
+    def next_timestamp(self):
+        """Timestamp the next reading should carry"""
+        return self.last_timestamp + self.cadence if self.last_timestamp is not None else None
+    
+    def observe(self, timestamp, now):
+        """
+        Record the newest timestamp returned by a successful poll at `now`
+        Returns: True if it is a new reading
+        """
+        if self.last_timestamp is not None and (timestamp is None or timestamp <= self.last_timestamp):
+            offset = now - self.next_timestamp()
+            if offset > timedelta(0):
+                if self.lag_high is not None and offset >= self.lag_high:
+                    self.lag_high = None  # the lag has grown past what we knew
+                self.lag_low = max(self.lag_low, offset)
+                if self.lag_high is None:
+                    self.misses += 1
+            return False
+        if timestamp is None:
+            return False
+        
+        offset = max(now - timestamp, timedelta(0))
+        if self.lag_high is None or offset < self.lag_high:
+            self.lag_high = offset
+        if self.lag_low > self.lag_high:
+            self.lag_low = timedelta(0)
+        self.misses = 0
+        self.timestamps.append(timestamp)
+        self.cadence = learn_cadence(self.timestamps, self.default_cadence)
+        return True
+    
+    def plan(self, now, retry, max_backoff):
+        """Next poll time (before jitter and the minimum spacing)"""
+        if self.last_timestamp is None or self.lag_high is None:
+            # Lag unknown: back off from now, never waiting longer than one cadence
+            return now + min(retry * 2 ** self.misses, max_backoff, max(self.cadence, retry))
+        if self.lag_high - self.lag_low <= retry:
+            return self.next_timestamp() + self.lag_high
+        return self.next_timestamp() + (self.lag_low + self.lag_high) / 2
+
+
+class AdaptivePoller:
+    """Decides which stations are due and polls only those"""
+    
+    def __init__(self, collector, codes=None, rng=None):
+        self.collector = collector
+        self.codes = list(codes or config.RESERVOIRS.keys())
+        self.rng = rng or random.Random()
+        self.retry = timedelta(minutes=config.POLLING_RETRY_MINUTES)
+        self.max_backoff = timedelta(minutes=config.POLLING_MAX_BACKOFF_MINUTES)
+        self.stations = {}
+        self.polls = 0
+        self.new_readings = 0
+        self._lock = threading.Lock()
+    
+    def learn(self, now=None):
+        """Seed every station from stored history; all stations are polled on the next dispatch"""
+        now = now or datetime.utcnow()
+        default = timedelta(minutes=config.COLLECTION_INTERVAL_MINUTES)
+        db = SessionLocal()
+        try:
+            history = get_store().series(db, self.codes, now - timedelta(days=config.POLLING_HISTORY_DAYS))
+        finally:
+            db.close()
+        
+        for code in self.codes:
+            state = StationState(code, [point[0] for point in history[code]], default)
+            state.next_poll = now
+            self.stations[code] = state
+            logger.info(f"{code}: learned cadence {state.cadence} from {len(history[code])} stored reading(s)")
+    
+    def due(self, now):
+        """Codes whose next poll time has come"""
+        return [code for code, state in self.stations.items() if state.next_poll <= now]
+    
+    def _jitter(self):
+        return timedelta(seconds=self.rng.uniform(0, config.POLLING_JITTER_SECONDS))
+    
+    def schedule(self, code, timestamp, ok, now):
+        """
+        Plan a station's next poll after a poll at `now`
+        timestamp: newest reading timestamp the poll returned; ok: False if the fetch failed
+        Returns: the next poll time
+        """
+        state = self.stations[code]
+        if not ok:
+            state.misses += 1
+        elif state.observe(timestamp, now):
+            self.new_readings += 1
+        
+        next_poll = state.plan(now, self.retry, self.max_backoff)
+        state.next_poll = max(next_poll, now + self.retry) + self._jitter()
+        return state.next_poll
+    
+    def dispatch(self, now=None):
+        """
+        Poll the stations that are due (call every minute or so)
+        Returns: list of codes polled
+        """
+        with self._lock:
+            now = now or datetime.utcnow()
+            if not self.stations:
+                self.learn(now)
+            codes = self.due(now)
+            if not codes:
+                return []
+            
+            results = self.collector.collect_all(codes=codes)
+            self.polls += len(codes)
+            for code in codes:
+                reading = results.get(code)
+                next_poll = self.schedule(code, reading.timestamp if reading else None, reading is not None, now)
+                logger.debug(f"{code}: next poll at {next_poll:%Y-%m-%d %H:%M:%S}")
+            return codes
+    
+    def stats(self):
+        """Per-station cadence/lag/next poll plus poll counters"""
+        return {
+            'polls': self.polls,
+            'new_readings': self.new_readings,
+            'stations': {
+                code: {
+                    'cadence_minutes': state.cadence.total_seconds() / 60,
+                    'lag_minutes': state.lag_high.total_seconds() / 60 if state.lag_high is not None else None,
+                    'misses': state.misses,
+                    'next_poll': state.next_poll.isoformat() if state.next_poll else None,
+                }
+                for code, state in self.stations.items()
+            },
+        }
@@ -0,0 +1,226 @@
+"""
+Record upstream responses and replay them from a local stub server
+
+Recording hooks a requests session (normally ReservoirCollector.session) and
+writes every response it receives into a cassette directory: one body file per
+URL plus index.json with each URL's status and content type. Replaying serves a
+cassette from a local HTTP server keyed by path and query, so the collector can
+run offline against real page bodies by pointing its URLs at the server
+(redirect_config). The server can add latency and fail a share of requests,
+for testing retries and circuit breakers and for benchmarks (see
+benchmarks/bench_collector.py).
+
+Usage:
+    python replay.py record fixtures/replay            # collect once from the live sources, recording
+    python replay.py serve fixtures/replay --port 8765 --latency 0.05 --failure-rate 0.1
+"""
+import argparse
+from contextlib import contextmanager
+import copy
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+from pathlib import Path
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import config
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+SUFFIXES = {'text/html': '.html', 'text/csv': '.csv', 'application/json': '.json'}
+
+
+def request_key(url):
+    """Cassette key for a URL: its path and query (scheme and host are ignored)"""
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+class Cassette:
+    """Recorded responses: key -> (status, content type, body)"""
+    
+    def __init__(self, responses=None):
+        self.responses = dict(responses or {})
+    
+    @classmethod
+    def load(cls, directory):
+        """Read a cassette directory (body paths in index.json are relative to it)"""
+        directory = Path(directory)
+        index = json.loads((directory / INDEX_FILE).read_text())
+        return cls({
+            key: (entry['status'], entry['content_type'], (directory / entry['file']).read_bytes())
+            for key, entry in index.items()
+        })
+    
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        index = {}
+        for key, (status, content_type, body) in sorted(self.responses.items()):
+            name = hashlib.sha1(key.encode()).hexdigest()[:16] + SUFFIXES.get(content_type.split(';')[0], '.bin')
+            (directory / name).write_bytes(body)
+            index[key] = {'status': status, 'content_type': content_type, 'file': name}
+        (directory / INDEX_FILE).write_text(json.dumps(index, indent=2) + '\n')
+    
+    def add(self, url, status, content_type, body):
+        self.responses[request_key(url)] = (status, content_type, body)
+
+
+def record_session(session, cassette):
+    """Add a response hook to session that stores every response it receives in cassette"""
+    def hook(response, *args, **kwargs):
+        cassette.add(response.url, response.status_code,
+                     response.headers.get('Content-Type', 'application/octet-stream'), response.content)
+        return response
+    
+    session.hooks['response'].append(hook)
+    return hook
+
+
+class ReplayServer:
+    """
+    Local HTTP server answering from a cassette
+    resolver: optional fn(key) -> (status, content type, body) or None, for responses
+              generated on the fly (e.g. hundreds of simulated stations)
+    latency: seconds added to every response, or a (low, high) range drawn uniformly
+    failure_rate: share of requests answered with failure_status instead
+    """
+    
+    def __init__(self, cassette=None, resolver=None, latency=0, failure_rate=0.0, failure_status=503,
+                 seed=None, host='127.0.0.1', port=0):
+        self.cassette = cassette or Cassette()
+        self.resolver = resolver
+        self.latency = latency if isinstance(latency, (tuple, list)) else (latency, latency)
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+    
+    def url(self, url):
+        """The server's URL for a real upstream URL"""
+        return self.base_url + request_key(url)
+    
+    def respond(self, key):
+        """(status, content type, body) for a request key, after latency/failure injection"""
+        with self._lock:
+            self.requests += 1
+            delay = self._random.uniform(*self.latency)
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self.failure_status, 'text/plain', b'injected failure'
+        response = self.cassette.responses.get(key)
+        if response is None and self.resolver is not None:
+            response = self.resolver(key)
+        return response or (404, 'text/plain', b'not recorded')
+    
+    def _handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                status, content_type, body = server.respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        return Handler
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+
+
+@contextmanager
+def redirect_config(server):
+    """Point every upstream URL in config at server for the duration of the block"""
+    names = ('RESERVOIRS', 'CDEC_QUERY_URL', 'CDEC_CSV_URL', 'CDEC_JSON_URL', 'USBR_URL')
+    saved = {name: getattr(config, name) for name in names}
+    config.RESERVOIRS = copy.deepcopy(config.RESERVOIRS)
+    for reservoir in config.RESERVOIRS.values():
+        for field, value in reservoir.items():
+            if field.endswith('_url'):
+                reservoir[field] = server.url(value)
+    for name in ('CDEC_QUERY_URL', 'CDEC_CSV_URL', 'CDEC_JSON_URL', 'USBR_URL'):
+        setattr(config, name, server.url(getattr(config, name)))
+    try:
+        yield server
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='Record upstream responses, or replay them from a local server')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help='Run one collection against the live sources and save what it fetched')
+    record.add_argument('directory')
+    serve = commands.add_parser('serve', help='Serve a cassette')
+    serve.add_argument('directory')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--latency', type=float, default=0, help='Seconds added to each response')
+    serve.add_argument('--failure-rate', type=float, default=0, help='Share of requests answered with 503')
+    args = parser.parse_args(argv)
+    
+    if args.command == 'record':
+        from collector import ReservoirCollector
+        from sources import plan_fetches
+        collector = ReservoirCollector()
+        cassette = Cassette()
+        record_session(collector.session, cassette)
+        collector.run_plan(plan_fetches(list(config.RESERVOIRS)), concurrent=False)
+        cassette.save(args.directory)
+        print(f"Recorded {len(cassette.responses)} response(s) to {args.directory}")
+    else:
+        server = ReplayServer(Cassette.load(args.directory), latency=args.latency, failure_rate=args.failure_rate,
+                              port=args.port)
+        print(f"Serving {len(server.cassette.responses)} response(s) at {server.base_url}")
+        server.start()
+        try:
+            server._thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Retry, backoff and circuit breaking for the collector's HTTP session
+
+ResilientAdapter retries idempotent requests that fail to connect, time out or
+get a 502/503/504, with bounded exponential backoff (urllib3 Retry). Each host
+has a CircuitBreaker: after HTTP_BREAKER_FAILURE_THRESHOLD consecutive failed
+requests (retries included) it opens, and further requests to that host raise
+CircuitOpenError immediately instead of waiting out their timeouts. After
+HTTP_BREAKER_RESET_SECONDS one trial request is let through; its outcome closes
+the breaker or opens it again.
+
+ConditionalGetAdapter composes on top (see ResilientConditionalGetAdapter), so a
+304 counts as a healthy response and cached pages are never retried.
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, RetryError, Timeout
+from urllib3.util.retry import Retry
+
+from httpcache import ConditionalGetAdapter
+import config
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Upstream statuses that mean "try again later" rather than "bad request"
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending a request to a host whose breaker is open"""
+
+
+def retry_policy(retries=None, backoff_factor=None, backoff_max=None):
+    """
+    urllib3 Retry for idempotent requests: connect errors, read timeouts and RETRY_STATUSES
+    Retry-After is ignored so a misbehaving upstream can't stretch the wait past backoff_max.
+    """
+    retries = config.HTTP_RETRIES if retries is None else retries
+    return Retry(
+        total=retries,
+        connect=retries,
+        read=min(retries, 1),  # a read timeout already waited the full timeout; retry it (and resets) once
+        status=retries,
+        other=0,
+        backoff_factor=config.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor,
+        backoff_max=config.HTTP_BACKOFF_MAX_SECONDS if backoff_max is None else backoff_max,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one host (thread-safe)"""
+    
+    def __init__(self, failure_threshold=None, reset_seconds=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold or config.HTTP_BREAKER_FAILURE_THRESHOLD
+        self.reset_seconds = config.HTTP_BREAKER_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0  # consecutive
+        self.opened_at = None
+        self.trips = 0  # times the breaker has opened
+        self.rejected = 0  # requests failed fast while open
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """
+        Whether a request may be sent now
+        Once the reset timeout has passed, a single trial request is allowed (half-open).
+        """
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._trial_in_flight):
+                self._trial_in_flight = self.state == HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        """
+        Count a failed request
+        Returns: True if this failure opened the breaker
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self.trips += 1
+                return True
+            return False
+    
+    def release(self):
+        """Give up a half-open trial whose request never reached the host"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def snapshot(self):
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(self.reset_seconds - (self.clock() - self.opened_at), 0.0)
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'retry_in_seconds': retry_in,
+            }
+
+
+class CircuitBreakers:
+    """CircuitBreaker per host, created on first use"""
+    
+    def __init__(self, failure_threshold=None, reset_seconds=None, clock=time.monotonic):
+        self._settings = dict(failure_threshold=failure_threshold, reset_seconds=reset_seconds, clock=clock)
+        self._breakers = {}
+        self._lock = threading.Lock()
+    
+    def get(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(**self._settings)
+            return breaker
+    
+    def stats(self):
+        """Breaker state by host"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {host: breaker.snapshot() for host, breaker in sorted(breakers.items())}
+
+
+class ResilientAdapter(HTTPAdapter):
+    """HTTPAdapter with retry/backoff and a per-host circuit breaker"""
+    
+    def __init__(self, breakers=None, max_retries=None, **kwargs):
+        self.breakers = breakers if breakers is not None else CircuitBreakers()
+        super().__init__(max_retries=max_retries if max_retries is not None else retry_policy(), **kwargs)
+    
+    def send(self, request, **kwargs):
+        breaker = self.breakers.get(request.url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {urlparse(request.url).netloc}", request=request)
+        
+        try:
+            response = super().send(request, **kwargs)
+        except (ConnectionError, Timeout, RetryError):
+            self._record_failure(breaker, request)
+            raise
+        except Exception:
+            breaker.release()
+            raise
+        
+        if response.status_code in RETRY_STATUSES:
+            self._record_failure(breaker, request)
+        else:
+            breaker.record_success()
+        return response
+    
+    @staticmethod
+    def _record_failure(breaker, request):
+        if breaker.record_failure():
+            logger.warning(f"Circuit opened for {urlparse(request.url).netloc} after "
+                           f"{breaker.failures} consecutive failure(s); failing fast for {breaker.reset_seconds}s")
+
+
+class ResilientConditionalGetAdapter(ConditionalGetAdapter, ResilientAdapter):
+    """Conditional-GET caching on top of retries and circuit breaking"""
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Hourly, daily and monthly rollups of reservoir readings
+
+Rollups cascade: hourly buckets are rebuilt from raw readings, daily buckets from
+hourly ones and monthly buckets from daily ones. A write therefore only re-reads
+the handful of rows underneath the buckets it touched, and long-range queries
+read pre-aggregated rows instead of every 15-minute reading.
+
+Usage:
+    python rollups.py --rebuild [--codes BER ORO]   # rebuild from existing raw data
+"""
+import argparse
+from datetime import timedelta
+import logging
+import sys
+
+from sqlalchemy import func
+
+from database import (
+    ReservoirRollupHourly, ReservoirRollupDaily, ReservoirRollupMonthly, SessionLocal, configure_engine, init_db,
+)
+from metadata import storage_percent
+from storage import get_store
+import config
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_MODELS = {
+    'hour': ReservoirRollupHourly,
+    'day': ReservoirRollupDaily,
+    'month': ReservoirRollupMonthly,
+}
+
+# (resolution, resolution it is built from); None means raw readings
+ROLLUP_LEVELS = [('hour', None), ('day', 'hour'), ('month', 'day')]
+
+METRICS = ('storage', 'elevation')
+
+
+def truncate(resolution, timestamp):
+    """Start of the bucket containing timestamp"""
+    if resolution == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'month':
+        return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def next_bucket(resolution, bucket_start):
+    """Start of the bucket following bucket_start"""
+    if resolution == 'hour':
+        return bucket_start + timedelta(hours=1)
+    if resolution == 'day':
+        return bucket_start + timedelta(days=1)
+    if resolution == 'month':
+        if bucket_start.month == 12:
+            return bucket_start.replace(year=bucket_start.year + 1, month=1)
+        return bucket_start.replace(month=bucket_start.month + 1)
+    raise ValueError(f"Unknown rollup resolution: {resolution}")
+
+
+def _empty_bucket():
+    bucket = {'last_timestamp': None, 'sample_count': 0}
+    for metric in METRICS:
+        bucket.update({
+            f'{metric}_min': None, f'{metric}_max': None, f'{metric}_sum': None,
+            f'{metric}_count': 0, f'{metric}_last': None,
+        })
+    return bucket
+
+
+def _fold(bucket, last_timestamp, sample_count, parts):
+    """
+    Fold one source row into a bucket
+    parts: {metric: (min, max, sum, count, last)} for each metric with data
+    """
+    newest = bucket['last_timestamp'] is None or last_timestamp >= bucket['last_timestamp']
+    if newest:
+        bucket['last_timestamp'] = last_timestamp
+    bucket['sample_count'] += sample_count
+    
+    for metric, (low, high, total, count, last) in parts.items():
+        if not count:
+            continue
+        if bucket[f'{metric}_count'] == 0:
+            bucket[f'{metric}_min'], bucket[f'{metric}_max'], bucket[f'{metric}_sum'] = low, high, total
+        else:
+            bucket[f'{metric}_min'] = min(bucket[f'{metric}_min'], low)
+            bucket[f'{metric}_max'] = max(bucket[f'{metric}_max'], high)
+            bucket[f'{metric}_sum'] += total
+        bucket[f'{metric}_count'] += count
+        if newest or bucket[f'{metric}_last'] is None:
+            bucket[f'{metric}_last'] = last
+
+
+def _source_rows(db, code, source, start, end):
+    """
+    Read the rows a rollup level is built from, as (timestamp, last_timestamp, sample_count, parts)
+    """
+    if source is None:
+        for timestamp, elevation, storage, _ in get_store().series(db, [code], start, end)[code]:
+            parts = {}
+            if storage is not None:
+                parts['storage'] = (storage, storage, storage, 1, storage)
+            if elevation is not None:
+                parts['elevation'] = (elevation, elevation, elevation, 1, elevation)
+            yield timestamp, timestamp, 1, parts
+        return
+    
+    model = ROLLUP_MODELS[source]
+    rows = db.query(model).filter(
+        model.reservoir_code == code,
+        model.bucket_start >= start,
+        model.bucket_start < end,
+    )
+    for row in rows:
+        parts = {
+            metric: (getattr(row, f'{metric}_min'), getattr(row, f'{metric}_max'),
+                     getattr(row, f'{metric}_sum'), getattr(row, f'{metric}_count'),
+                     getattr(row, f'{metric}_last'))
+            for metric in METRICS
+        }
+        yield row.bucket_start, row.last_timestamp, row.sample_count, parts
+
+
+def update_rollups(db, keys):
+    """
+    Recompute every rollup bucket containing the given readings.
+    Runs inside the caller's transaction; the caller commits.
+    keys: iterable of (reservoir_code, timestamp) for readings just written
+    """
+    touched = {}
+    for code, timestamp in keys:
+        touched.setdefault(code, set()).add(timestamp)
+    
+    for resolution, source in ROLLUP_LEVELS:
+        model = ROLLUP_MODELS[resolution]
+        next_touched = {}
+        for code, timestamps in touched.items():
+            bucket_starts = {truncate(resolution, timestamp) for timestamp in timestamps}
+            start = min(bucket_starts)
+            end = next_bucket(resolution, max(bucket_starts))
+            
+            buckets = {}
+            for timestamp, last_timestamp, sample_count, parts in _source_rows(db, code, source, start, end):
+                bucket_start = truncate(resolution, timestamp)
+                if bucket_start in bucket_starts:
+                    bucket = buckets.setdefault(bucket_start, _empty_bucket())
+                    _fold(bucket, last_timestamp, sample_count, parts)
+            
+            db.query(model).filter(
+                model.reservoir_code == code,
+                model.bucket_start.in_(list(bucket_starts)),
+            ).delete(synchronize_session=False)
+            if buckets:
+                db.execute(model.__table__.insert(), [
+                    dict(bucket, reservoir_code=code, bucket_start=bucket_start)
+                    for bucket_start, bucket in buckets.items()
+                ])
+            next_touched[code] = bucket_starts
+        touched = next_touched
+
+
+def rebuild_rollups(codes=None, chunk_days=366):
+    """Rebuild all rollups from raw readings, one chunk of history per transaction"""
+    store = get_store()
+    db = SessionLocal()
+    try:
+        if codes is None:
+            codes = store.codes(db)
+        for code in codes:
+            first, last = store.bounds(db, code)
+            if first is None:
+                continue
+            
+            # Chunks start on month boundaries so no bucket straddles two chunks
+            chunk_start = truncate('month', first)
+            while chunk_start <= last:
+                chunk_end = truncate('month', chunk_start + timedelta(days=chunk_days))
+                series = store.series(db, [code], chunk_start, chunk_end)[code]
+                update_rollups(db, [(code, point[0]) for point in series])
+                db.commit()
+                chunk_start = chunk_end
+            logger.info(f"Rebuilt rollups for {code} ({first:%Y-%m-%d}..{last:%Y-%m-%d})")
+    finally:
+        db.close()
+
+
+def choose_resolution(days):
+    """Coarsest-needed resolution for a range of `days`: the finest one whose range limit covers it"""
+    for resolution, max_days in config.ROLLUP_MAX_RANGE_DAYS.items():
+        if days <= max_days:
+            return resolution
+    return 'month'
+
+
+def query_series_many(db, codes, start, resolution):
+    """
+    Time series for several reservoirs from `start` at the given resolution, in one query
+    Rollup points are bucket averages stamped with the bucket start; their storage_percent
+    is computed from the average storage and the in-memory capacity map. Reservoirs with no
+    rollup rows in the range (readings not rolled up yet) get their raw readings instead.
+    Returns: dict mapping each code to a list of (timestamp, reservoir_elevation, storage, storage_percent)
+    """
+    if resolution == 'raw':
+        return get_store().series(db, codes, start)
+    
+    series = {code: [] for code in codes}
+    model = ROLLUP_MODELS[resolution]
+    rows = db.query(
+        model.reservoir_code, model.bucket_start, model.elevation_sum, model.elevation_count,
+        model.storage_sum, model.storage_count,
+    ).filter(
+        model.reservoir_code.in_(codes),
+        model.bucket_start >= truncate(resolution, start),
+    ).order_by(model.reservoir_code, model.bucket_start)
+    for code, bucket_start, elevation_sum, elevation_count, storage_sum, storage_count in rows:
+        storage = storage_sum / storage_count if storage_count else None
+        series[code].append((
+            bucket_start,
+            elevation_sum / elevation_count if elevation_count else None,
+            storage,
+            storage_percent(code, storage),
+        ))
+    
+    missing = [code for code, points in series.items() if not points]
+    if missing:
+        series.update(get_store().series(db, missing, start))
+    return series
+
+
+def query_series(db, code, start, resolution):
+    """
+    Time series for one reservoir (see query_series_many)
+    Returns: list of (timestamp, reservoir_elevation, storage, storage_percent)
+    """
+    return query_series_many(db, [code], start, resolution)[code]
+
+
+def range_stats(db, code, start):
+    """
+    Min/max/avg storage and elevation since `start`, aggregated from daily rollups
+    Returns: dict of stats plus 'data_points' (raw readings covered)
+    """
+    model = ReservoirRollupDaily
+    row = db.query(
+        func.min(model.storage_min), func.max(model.storage_max),
+        func.sum(model.storage_sum), func.sum(model.storage_count),
+        func.min(model.elevation_min), func.max(model.elevation_max),
+        func.sum(model.elevation_sum), func.sum(model.elevation_count),
+        func.sum(model.sample_count),
+    ).filter(
+        model.reservoir_code == code,
+        model.bucket_start >= truncate('day', start),
+    ).one()
+    (storage_min, storage_max, storage_sum, storage_count,
+     elevation_min, elevation_max, elevation_sum, elevation_count, sample_count) = row
+    return {
+        'min_storage': storage_min,
+        'max_storage': storage_max,
+        'avg_storage': storage_sum / storage_count if storage_count else None,
+        'min_elevation': elevation_min,
+        'max_elevation': elevation_max,
+        'avg_elevation': elevation_sum / elevation_count if elevation_count else None,
+        'data_points': sample_count or 0,
+    }
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='Maintain reservoir rollup tables')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild rollups from raw readings')
+    parser.add_argument('--codes', nargs='+', help='Reservoir codes to rebuild (default: all with data)')
+    args = parser.parse_args(argv)
+    
+    if not args.rebuild:
+        parser.print_help()
+        return 1
+    
+    configure_engine('cli')
+    init_db()
+    rebuild_rollups(args.codes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
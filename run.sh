@@ -40,19 +40,29 @@ case "${1:-web}" in
         echo "Access the dashboard at: http://localhost:5000"
         python app.py
         ;;
+    serve)
+        echo -e "${GREEN}Starting production web server (gunicorn)...${NC}"
+        gunicorn -c gunicorn.conf.py wsgi:app
+        ;;
     collector)
         echo -e "${GREEN}Starting data collector scheduler...${NC}"
         python scheduler.py
         ;;
+    backfill)
+        echo -e "${GREEN}Backfilling historical data...${NC}"
+        python backfill.py "${@:2}"
+        ;;
     test)
-        echo -e "${GREEN}Testing data collection...${NC}"
-        python test_collector.py
+        echo -e "${GREEN}Running tests (offline, against recorded responses)...${NC}"
+        python -m pytest "${@:2}"
         ;;
     *)
-        echo "Usage: $0 [web|collector|test]"
+        echo "Usage: $0 [web|serve|collector|backfill|test]"
         echo "  web      - Start web server (default)"
+        echo "  serve    - Start production web server (gunicorn)"
         echo "  collector - Start data collection scheduler"
-        echo "  test     - Test data collection"
+        echo "  backfill - Backfill historical data from CDEC"
+        echo "  test     - Run the test suite (extra arguments go to pytest)"
         exit 1
         ;;
 esac
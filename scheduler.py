@@ -3,8 +3,14 @@ Scheduler service for periodic data collection
 """
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from datetime import datetime
 import logging
 from collector import ReservoirCollector
+from polling import AdaptivePoller
+from database import configure_engine
+from metadata import refresh_metadata
+from metrics import start_metrics_server
+from storage import enforce_retention
 import config
 
 logging.basicConfig(
@@ -14,29 +20,117 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# One collector for the life of the process, so its HTTP cache and parse memo
+# carry over from one tick to the next
+_collector = None
+
+
+def get_collector():
+    """The scheduler's shared ReservoirCollector"""
+    global _collector
+    if _collector is None:
+        _collector = ReservoirCollector()
+        _collector.export_metrics()
+    return _collector
+
+
 def collect_data_job():
     """Job function to collect reservoir data"""
     logger.info("Starting scheduled data collection...")
-    collector = ReservoirCollector()
+    collector = get_collector()
     results = collector.collect_all()
     logger.info(f"Data collection completed. Results: {results}")
+    if collector.http_cache is not None:
+        logger.info(f"HTTP cache: {collector.http_cache.stats()}, parses skipped: {collector.parses_skipped}")
+    log_breakers(collector)
+
+
+def log_breakers(collector):
+    """Log the state of any host circuit breaker that isn't closed"""
+    for host, breaker in collector.breakers.stats().items():
+        if breaker['state'] != 'closed':
+            logger.warning(f"Circuit breaker for {host}: {breaker}")
+
+
+_poller = None
+
+
+def dispatch_job():
+    """Job function for adaptive mode: poll the stations that are due"""
+    global _poller
+    if _poller is None:
+        _poller = AdaptivePoller(get_collector())
+    codes = _poller.dispatch()
+    if codes:
+        logger.info(f"Polled {codes}. Poller: {_poller.stats()}")
+        log_breakers(_poller.collector)
+
+
+def metadata_job():
+    """Job function to refetch reservoir capacity metadata that has gone stale"""
+    try:
+        refresh_metadata(get_collector().session)
+    except Exception as e:
+        logger.error(f"Metadata refresh failed: {e}")
+
+
+def retention_job():
+    """Job function to drop raw readings older than RAW_RETENTION_DAYS"""
+    try:
+        enforce_retention()
+    except Exception as e:
+        logger.error(f"Retention failed: {e}")
 
 
 def run_scheduler():
     """Run the scheduler"""
+    configure_engine('collector')
+    if config.METRICS_ENABLED and config.COLLECTOR_METRICS_PORT:
+        start_metrics_server(config.COLLECTOR_METRICS_HOST, config.COLLECTOR_METRICS_PORT)
     scheduler = BlockingScheduler()
     
     # Schedule data collection
-    trigger = IntervalTrigger(minutes=config.COLLECTION_INTERVAL_MINUTES)
+    if config.SCHEDULER_MODE == 'adaptive':
+        scheduler.add_job(
+            dispatch_job,
+            trigger=IntervalTrigger(minutes=1),
+            id='dispatch_reservoir_polls',
+            name='Poll Due Reservoirs',
+            replace_existing=True,
+            coalesce=True
+        )
+    else:
+        trigger = IntervalTrigger(minutes=config.COLLECTION_INTERVAL_MINUTES)
+        scheduler.add_job(
+            collect_data_job,
+            trigger=trigger,
+            id='collect_reservoir_data',
+            name='Collect Reservoir Data',
+            replace_existing=True
+        )
+    
     scheduler.add_job(
-        collect_data_job,
-        trigger=trigger,
-        id='collect_reservoir_data',
-        name='Collect Reservoir Data',
-        replace_existing=True
+        metadata_job,
+        IntervalTrigger(days=1),
+        id='refresh_metadata',
+        name='Refresh Reservoir Metadata',
+        replace_existing=True,
+        next_run_time=datetime.now()
     )
     
-    logger.info(f"Scheduler started. Collecting data every {config.COLLECTION_INTERVAL_MINUTES} minutes.")
+    if config.RAW_RETENTION_DAYS is not None:
+        scheduler.add_job(
+            retention_job,
+            IntervalTrigger(days=1),
+            id='raw_retention',
+            name='Drop Expired Raw Readings',
+            replace_existing=True
+        )
+    
+    if config.SCHEDULER_MODE == 'adaptive':
+        logger.info("Scheduler started. Polling each station when its next reading is due.")
+    else:
+        logger.info(f"Scheduler started. Collecting data every {config.COLLECTION_INTERVAL_MINUTES} minutes.")
     
     try:
         scheduler.start()
@@ -0,0 +1,111 @@
+"""
+Serialization and compression for time-series API responses
+"""
+import gzip
+
+import numpy as np
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+SERIES_FORMATS = ('rows', 'columnar', 'binary')
+
+# Binary series layout: magic, uint32 point count, then one little-endian float64 array
+# per field in this order. Timestamps are seconds since 1970-01-01 of the stored
+# (naive) timestamp; missing values are NaN.
+BINARY_MAGIC = b'RDS1'
+BINARY_FIELDS = ('timestamp', 'reservoir_elevation', 'storage', 'storage_percent')
+BINARY_MIMETYPE = 'application/octet-stream'
+
+COMPRESSIBLE_MIMETYPES = {'application/json', BINARY_MIMETYPE}
+
+
+def series_rows(series):
+    """Series as a list of per-point dicts (the original /data format)"""
+    return [{
+        'timestamp': timestamp.isoformat(),
+        'reservoir_elevation': elevation,
+        'storage': storage,
+        'storage_percent': storage_percent
+    } for timestamp, elevation, storage, storage_percent in series]
+
+
+def _epoch_seconds(timestamps):
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+def series_columns(series):
+    """Series as parallel arrays keyed by field, with timestamps as epoch seconds"""
+    if not series:
+        return {field: [] for field in BINARY_FIELDS}
+    timestamps, elevations, storages, percents = zip(*series)
+    return {
+        'timestamp': _epoch_seconds(timestamps).tolist(),
+        'reservoir_elevation': list(elevations),
+        'storage': list(storages),
+        'storage_percent': list(percents),
+    }
+
+
+def pack_series(series):
+    """Series as packed float64 arrays (see BINARY_MAGIC for the layout)"""
+    count = len(series)
+    columns = [np.empty(0, dtype='<f8')] * len(BINARY_FIELDS)
+    if series:
+        timestamps, elevations, storages, percents = zip(*series)
+        columns = [_epoch_seconds(timestamps).astype('<f8')] + [
+            np.array(values, dtype=np.float64).astype('<f8')  # None becomes NaN
+            for values in (elevations, storages, percents)
+        ]
+    return BINARY_MAGIC + np.uint32(count).astype('<u4').tobytes() + b''.join(c.tobytes() for c in columns)
+
+
+def unpack_series(payload):
+    """Inverse of pack_series, returning a dict of numpy arrays keyed by field"""
+    if payload[:4] != BINARY_MAGIC:
+        raise ValueError('Not a packed series payload')
+    count = int(np.frombuffer(payload, dtype='<u4', count=1, offset=4)[0])
+    values = np.frombuffer(payload, dtype='<f8', offset=8)
+    return {field: values[i * count:(i + 1) * count] for i, field in enumerate(BINARY_FIELDS)}
+
+
+def _accepted_encodings(accept_encoding):
+    encodings = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.lower()] = quality
+    return {name for name, quality in encodings.items() if quality > 0}
+
+
+def compress_response(response, accept_encoding, min_bytes):
+    """
+    Compress a Flask response body with brotli or gzip if the client accepts it
+    Only uncompressed JSON/binary 200 responses of at least min_bytes are touched.
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    
+    body = response.get_data()
+    if len(body) < min_bytes:
+        return response
+    
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accepted:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
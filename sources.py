@@ -0,0 +1,249 @@
+"""
+Data sources the collector can read, and the planner that turns stations into fetches
+
+Each source knows how to cover a set of stations with as few URLs as it can
+(plan) and how to turn one of those URLs into readings (fetch). Sources are
+registered by name; config.COLLECTION_SOURCES (or a reservoir's own 'sources'
+list) picks which ones cover each station, in priority order:
+
+    cdec_query   CDEC QueryF HTML page, one station per request
+    cdec_csv     CDEC CSV data service, up to CDEC_BULK_MAX_STATIONS stations per request
+    cdec_json    CDEC JSON data service, likewise
+    usbr         USBR CVO current conditions page, every station in one request
+    replay       readings from a local CSV file (REPLAY_FILE), for development and tests
+
+plan_fetches() asks every source for its URLs and merges duplicates, so two
+stations behind the same URL, or every USBR station, cost one request. The
+collector executes the plan (see ReservoirCollector.run_plan), then plans the
+fallback source of any station a bulk source returned nothing for.
+"""
+from collections import namedtuple
+import csv
+from datetime import datetime, timedelta
+import logging
+from urllib.parse import urlencode
+
+from metrics import collector_stage_duration
+from parsers import iter_cdec_csv, iter_cdec_json, merge_cdec_sensors
+import config
+
+logger = logging.getLogger(__name__)
+
+# One planned request: which source, which URL, and the reservoir codes it covers
+Fetch = namedtuple('Fetch', ['source', 'url', 'codes'])
+
+SOURCES = {}
+
+
+def register(source_class):
+    """Class decorator adding a source to the registry under its name"""
+    SOURCES[source_class.name] = source_class()
+    return source_class
+
+
+def get_source(name):
+    try:
+        return SOURCES[name]
+    except KeyError:
+        raise ValueError(f"Unknown data source: {name} (known: {', '.join(sorted(SOURCES))})") from None
+
+
+def station_id(code):
+    return config.RESERVOIRS.get(code, {}).get('station_id', code)
+
+
+def source_names(code):
+    """Sources covering a reservoir, in priority order"""
+    return config.RESERVOIRS.get(code, {}).get('sources') or config.COLLECTION_SOURCES
+
+
+class Source:
+    """Base class: subclasses set name/data_source and implement plan and fetch"""
+    name = None
+    data_source = 'CDEC'  # Stored with each reading
+    fallback = None  # Source to try for stations this one returned nothing for
+    
+    def __repr__(self):
+        return self.name
+    
+    def plan(self, codes):
+        """Yields: (url, codes) pairs covering codes"""
+        raise NotImplementedError
+    
+    def fetch(self, collector, url, codes):
+        """
+        Fetch one planned URL with the collector's session and limits
+        Returns: dict mapping reservoir code to a list of (timestamp, reservoir_elevation, storage)
+        """
+        raise NotImplementedError
+
+
+@register
+class CdecQuerySource(Source):
+    """CDEC QueryF page per station (latest reading scraped from HTML)"""
+    name = 'cdec_query'
+    
+    def plan(self, codes):
+        for code in codes:
+            yield cdec_query_url(code), [code]
+    
+    def fetch(self, collector, url, codes):
+        # Reservoirs sharing a page share its reading
+        data = collector.collect_cdec_query(codes[0])
+        return {code: [data] for code in codes} if data else {}
+
+
+class CdecBulkSource(Source):
+    """
+    CDEC data service, many stations and both sensors per request
+    Stations the service returns nothing for (or every station, if the request fails)
+    are collected from their QueryF page instead.
+    """
+    url_setting = None  # config name of the service URL
+    fallback = 'cdec_query'
+    
+    def plan(self, codes, now=None):
+        now = now or datetime.utcnow()
+        start = now - timedelta(days=config.CDEC_BULK_LOOKBACK_DAYS)
+        codes = list(codes)
+        for i in range(0, len(codes), config.CDEC_BULK_MAX_STATIONS):
+            chunk = codes[i:i + config.CDEC_BULK_MAX_STATIONS]
+            yield cdec_csv_url([station_id(code) for code in chunk], start, now, config.CDEC_BULK_DURATION,
+                               base_url=getattr(config, self.url_setting)), chunk
+    
+    def records(self, response):
+        """Yields: (station_id, sensor_number, timestamp, value) from the response"""
+        raise NotImplementedError
+    
+    def fetch(self, collector, url, codes):
+        response = collector._timed_get(self.name, url, stream=True)
+        if response is None:
+            return {}
+        try:
+            if response.status_code != 200:
+                logger.error(f"Failed to fetch CDEC bulk data for {list(codes)}: {response.status_code}")
+                return {}
+            response.encoding = response.encoding or 'utf-8'
+            with collector_stage_duration.time(stage='parse', target=self.name):
+                readings = merge_cdec_sensors(self.records(response), config.CDEC_SENSORS)
+        finally:
+            response.close()
+        return {code: readings[station_id(code).upper()] for code in codes if readings.get(station_id(code).upper())}
+
+
+@register
+class CdecCsvSource(CdecBulkSource):
+    """CDEC CSV data service, parsed line by line as the response streams in"""
+    name = 'cdec_csv'
+    url_setting = 'CDEC_CSV_URL'
+    
+    def records(self, response):
+        return iter_cdec_csv(response.iter_lines(decode_unicode=True))
+
+
+@register
+class CdecJsonSource(CdecBulkSource):
+    """CDEC JSON data service"""
+    name = 'cdec_json'
+    url_setting = 'CDEC_JSON_URL'
+    
+    def records(self, response):
+        return iter_cdec_json(response.content)
+
+
+@register
+class UsbrSource(Source):
+    """USBR CVO current conditions page, one request for every station it lists"""
+    name = 'usbr'
+    data_source = 'USBR'
+    
+    def plan(self, codes):
+        codes = [code for code in codes if config.RESERVOIRS.get(code, {}).get('usbr_name')]
+        if codes:
+            yield config.USBR_URL, codes
+    
+    def fetch(self, collector, url, codes):
+        readings = collector.collect_usbr_data()
+        return {code: [readings[code]] for code in codes if code in readings}
+
+
+@register
+class ReplaySource(Source):
+    """Readings replayed from a CSV file with reservoir_code, timestamp, reservoir_elevation, storage columns"""
+    name = 'replay'
+    data_source = 'REPLAY'
+    
+    def plan(self, codes):
+        if config.REPLAY_FILE:
+            yield config.REPLAY_FILE, list(codes)
+    
+    def fetch(self, collector, url, codes):
+        wanted = set(codes)
+        readings = {}
+        with open(url, newline='') as f:
+            for row in csv.DictReader(f):
+                if row['reservoir_code'] not in wanted:
+                    continue
+                readings.setdefault(row['reservoir_code'], []).append((
+                    datetime.fromisoformat(row['timestamp']),
+                    float(row['reservoir_elevation']) if row['reservoir_elevation'] else None,
+                    float(row['storage']) if row['storage'] else None,
+                ))
+        return {code: sorted(points) for code, points in readings.items()}
+
+
+def cdec_query_url(code):
+    """QueryF URL for a reservoir: its configured cdec_query_url, else built from its station id"""
+    return config.RESERVOIRS.get(code, {}).get('cdec_query_url') or config.CDEC_QUERY_URL.format(station_id=station_id(code))
+
+
+def cdec_csv_url(station_ids, start, end, duration='D', base_url=None):
+    """CDEC CSV (or, given its base_url, JSON) data service URL for stations over [start, end]"""
+    params = {
+        'Stations': ','.join(station_ids),
+        'SensorNums': ','.join(str(n) for n in config.CDEC_SENSORS.values()),
+        'dur_code': duration,
+        'Start': start.strftime('%Y-%m-%d'),
+        'End': end.strftime('%Y-%m-%d'),
+    }
+    return f"{base_url or config.CDEC_CSV_URL}?{urlencode(params, safe=',')}"
+
+
+def plan_fetches(codes, names=None):
+    """
+    Plan the requests covering codes: each station's sources (or the sources in names)
+    are asked for URLs, and identical (source, URL) pairs are merged so every URL is fetched once
+    Returns: list of Fetch in first-planned order
+    """
+    by_source = {}
+    for code in codes:
+        for name in names or source_names(code):
+            by_source.setdefault(name, []).append(code)
+    
+    planned = {}
+    for name, source_codes in by_source.items():
+        for url, fetch_codes in get_source(name).plan(source_codes):
+            merged = planned.setdefault((name, url), [])
+            merged.extend(code for code in fetch_codes if code not in merged)
+    
+    fetches = [Fetch(get_source(name), url, tuple(fetch_codes)) for (name, url), fetch_codes in planned.items()]
+    logger.debug(f"Planned {len(fetches)} fetch(es) for {len(codes)} station(s)")
+    return fetches
+
+
+def plan_fallbacks(fetches, readings):
+    """
+    Plan fallback fetches for stations a source with a fallback returned nothing for
+    (skipping stations already covered by that fallback source)
+    readings: result of ReservoirCollector.run_plan for fetches
+    Returns: list of Fetch
+    """
+    missing = {}
+    for fetch in fetches:
+        name = fetch.source.fallback
+        for code in fetch.codes if name else ():
+            if not readings.get((fetch.source.name, code)) and name not in source_names(code):
+                missing.setdefault(name, []).append(code)
+    if missing:
+        logger.warning(f"Falling back for stations missing from bulk responses: {missing}")
+    return [fetch for name, codes in missing.items() for fetch in plan_fetches(codes, [name])]
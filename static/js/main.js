@@ -6,22 +6,32 @@
 const GRAFANA_URL = 'http://localhost:3000'; // Update this to your Grafana URL
 const API_BASE = '/api';
 
-// Fetch and display latest data for all reservoirs
+// Charts that live updates append to, keyed by `${code}-${metric}`
+const liveCharts = {};
+// Server-Sent Events connection to /api/stream (null where EventSource is unsupported)
+let liveStream = null;
+
+// Fetch and display latest data for all reservoirs (one batch request)
 async function loadReservoirData() {
     const reservoirs = ['BER', 'ORO'];
     
-    for (const code of reservoirs) {
-        try {
-            const response = await fetch(`${API_BASE}/reservoir/${code}/latest`);
-            if (response.ok) {
-                const data = await response.json();
+    try {
+        const response = await fetch(`${API_BASE}/reservoirs/latest?codes=${reservoirs.join(',')}`);
+        if (!response.ok) {
+            console.error(`Failed to load latest data: ${response.status}`);
+            return;
+        }
+        const result = await response.json();
+        for (const code of reservoirs) {
+            const data = result.reservoirs[code];
+            if (data) {
                 updateReservoirStats(code, data);
             } else {
-                console.error(`Failed to load data for ${code}`);
+                console.error(`No latest data for ${code}`);
             }
-        } catch (error) {
-            console.error(`Error loading data for ${code}:`, error);
         }
+    } catch (error) {
+        console.error('Error loading latest data:', error);
     }
 }
 
@@ -71,47 +81,131 @@ function getTimeRange(reservoirCode) {
     return select ? parseInt(select.value) : 7; // Default to 1 week
 }
 
+// Number of points worth fetching for a chart panel: one per device pixel of its width
+function maxPointsFor(panelId) {
+    const panel = document.getElementById(panelId);
+    const width = panel && panel.clientWidth ? panel.clientWidth : 800;
+    return Math.max(Math.round(width * (window.devicePixelRatio || 1)), 100);
+}
+
+// Convert a /data response to per-point objects, whatever format it was requested in.
+// Columnar timestamps are epoch seconds of the stored wall-clock time, so they are turned
+// back into the same naive ISO strings the row format uses.
+function seriesPoints(result) {
+    if (result.format !== 'columnar') {
+        return result.data || [];
+    }
+    const columns = result.columns;
+    return columns.timestamp.map((t, i) => ({
+        timestamp: new Date(t * 1000).toISOString().slice(0, 19),
+        reservoir_elevation: columns.reservoir_elevation[i],
+        storage: columns.storage[i],
+        storage_percent: columns.storage_percent[i]
+    }));
+}
+
+// Series kept in localStorage between page loads, so later loads only fetch what is new.
+// Entries are keyed by reservoir, range and point budget: { cursor, points }.
+const SERIES_CACHE_PREFIX = 'rdog-series-v1';
+
+function seriesCacheKey(code, days, maxPoints) {
+    return `${SERIES_CACHE_PREFIX}:${code}:${days}:${maxPoints}`;
+}
+
+function readSeriesCache(code, days, maxPoints) {
+    try {
+        const entry = JSON.parse(localStorage.getItem(seriesCacheKey(code, days, maxPoints)));
+        return entry && entry.cursor && Array.isArray(entry.points) ? entry : null;
+    } catch (error) {
+        return null;
+    }
+}
+
+function writeSeriesCache(code, days, maxPoints, cursor, points) {
+    try {
+        localStorage.setItem(seriesCacheKey(code, days, maxPoints), JSON.stringify({ cursor, points }));
+    } catch (error) {
+        // Storage full or disabled: the next load just fetches the full window
+        console.warn(`Could not cache series for ${code}:`, error);
+    }
+}
+
+// Merge a delta into cached points: the delta replaces everything from its first timestamp
+// (the cursor point is resent in case its rollup bucket was still filling), then points older
+// than the window are dropped
+function mergeSeries(points, delta, days) {
+    const merged = delta.length ? points.filter(p => p.timestamp < delta[0].timestamp).concat(delta) : points.slice();
+    if (!merged.length) return merged;
+    const cutoff = new Date(merged[merged.length - 1].timestamp).getTime() - days * 24 * 60 * 60 * 1000;
+    return merged.filter(p => new Date(p.timestamp).getTime() >= cutoff);
+}
+
+// Draw both charts for a reservoir, or placeholders when there is no data
+function renderReservoirCharts(code, dataPoints, days) {
+    console.log(`Data points for ${code}:`, dataPoints.length, dataPoints);
+    
+    if (dataPoints.length > 0) {
+        // Create storage chart
+        createChart(code, 'storage', dataPoints, 'Storage (acre-feet)', days);
+        
+        // Create elevation chart
+        createChart(code, 'elevation', dataPoints, 'Elevation (feet)', days);
+    } else {
+        console.warn(`No data points for ${code} - showing placeholder`);
+        showChartPlaceholder(code, 'storage');
+        showChartPlaceholder(code, 'elevation');
+    }
+}
+
 // Create Chart.js charts
 async function createCharts(reservoirCode = null) {
     const reservoirs = reservoirCode ? [reservoirCode] : ['BER', 'ORO'];
     
+    // Reservoirs sharing a time range are fetched together in one batch request
+    const groups = new Map();
     for (const code of reservoirs) {
         const days = getTimeRange(code);
+        if (!groups.has(days)) {
+            groups.set(days, []);
+        }
+        groups.get(days).push(code);
+    }
+    
+    for (const [days, codes] of groups) {
         try {
-            const response = await fetch(`${API_BASE}/reservoir/${code}/data?days=${days}`);
+            const maxPoints = maxPointsFor(`grafana-storage-${codes[0]}`);
+            // With every reservoir cached, ask only for points from the oldest cursor on
+            const cached = codes.map(code => readSeriesCache(code, days, maxPoints));
+            const since = cached.every(entry => entry) ? cached.map(entry => entry.cursor).sort()[0] : null;
+            const sinceParam = since ? `&since=${encodeURIComponent(since)}` : '';
+            const response = await fetch(`${API_BASE}/reservoirs/data?codes=${codes.join(',')}&days=${days}&max_points=${maxPoints}&format=columnar${sinceParam}`);
             if (response.ok) {
                 const result = await response.json();
-                console.log(`API response for ${code}:`, result);
-                const dataPoints = result.data || [];
-                console.log(`Data points for ${code}:`, dataPoints.length, dataPoints);
-                
-                if (dataPoints.length > 0) {
-                    // Create storage chart
-                    createChart(code, 'storage', dataPoints, 'Storage (acre-feet)', days);
-                    
-                    // Create elevation chart
-                    createChart(code, 'elevation', dataPoints, 'Elevation (feet)', days);
-                } else {
-                    console.warn(`No data points for ${code} - showing placeholder`);
-                    showChartPlaceholder(code, 'storage');
-                    showChartPlaceholder(code, 'elevation');
-                }
+                console.log(`API response for ${codes.join(',')}:`, result);
+                codes.forEach((code, i) => {
+                    const series = result.reservoirs[code] || {};
+                    const fetched = seriesPoints(series);
+                    const points = since ? mergeSeries(cached[i].points, fetched, days) : fetched;
+                    if (series.next_cursor) {
+                        writeSeriesCache(code, days, maxPoints, series.next_cursor, points);
+                    }
+                    renderReservoirCharts(code, points, days);
+                });
             } else {
                 const errorText = await response.text();
-                console.error(`Failed to load data for ${code}: ${response.status} - ${errorText}`);
-                showChartPlaceholder(code, 'storage');
-                showChartPlaceholder(code, 'elevation');
+                console.error(`Failed to load data for ${codes.join(',')}: ${response.status} - ${errorText}`);
+                codes.forEach(code => renderReservoirCharts(code, [], days));
             }
         } catch (error) {
-            console.error(`Error loading chart data for ${code}:`, error);
-            showChartPlaceholder(code, 'storage');
-            showChartPlaceholder(code, 'elevation');
+            console.error(`Error loading chart data for ${codes.join(',')}:`, error);
+            codes.forEach(code => renderReservoirCharts(code, [], days));
         }
     }
 }
 
 // Show placeholder when no data
 function showChartPlaceholder(reservoirCode, metric) {
+    delete liveCharts[`${reservoirCode}-${metric}`];
     const panel = document.getElementById(`grafana-${metric}-${reservoirCode}`);
     if (panel) {
         panel.innerHTML = `
@@ -324,7 +418,7 @@ function createChart(reservoirCode, metric, dataPoints, label, days = 7) {
             stepSize = Math.max(50, Math.ceil((yMax - yMin) / 5 / 50) * 50); // Steps of 50 feet or larger
         }
         
-        new Chart(canvas, {
+        const chart = new Chart(canvas, {
         type: 'line',
         data: {
             labels: chartLabels,
@@ -417,12 +511,82 @@ function createChart(reservoirCode, metric, dataPoints, label, days = 7) {
             }
         }
         });
+        liveCharts[`${reservoirCode}-${metric}`] = { chart, days };
     } catch (error) {
         console.error(`Error creating chart for ${reservoirCode} ${metric}:`, error);
         showChartPlaceholder(reservoirCode, metric);
     }
 }
 
+// Append pushed readings to a reservoir's charts in place, dropping points that fall out of the window
+function appendLivePoints(code, points) {
+    for (const metric of ['storage', 'elevation']) {
+        const entry = liveCharts[`${code}-${metric}`];
+        if (!entry) continue;
+        const { chart, days } = entry;
+        const labels = chart.data.labels;
+        const data = chart.data.datasets[0].data;
+        const yScale = chart.options.scales.y;
+        const step = metric === 'storage' ? 100000 : 50;
+        
+        for (const point of points) {
+            const value = metric === 'storage' ? point.storage : point.reservoir_elevation;
+            const last = data.length ? data[data.length - 1].x : null;
+            if (value === null || value === undefined || (last && point.timestamp <= last)) continue;
+            
+            const date = new Date(point.timestamp);
+            labels.push(days <= 1 || days > 7 ? formatDateLabel(date, days) : '');
+            data.push({ x: point.timestamp, y: value });
+            // Widen the fixed y-axis if the new value falls outside it
+            yScale.min = Math.min(yScale.min, Math.floor(value / step) * step);
+            yScale.max = Math.max(yScale.max, Math.ceil(value / step) * step);
+        }
+        
+        if (!data.length) continue;
+        const cutoff = new Date(data[data.length - 1].x).getTime() - days * 24 * 60 * 60 * 1000;
+        while (data.length > 1 && new Date(data[0].x).getTime() < cutoff) {
+            data.shift();
+            labels.shift();
+        }
+        chart.update('none');
+    }
+}
+
+// Subscribe to newly stored readings; charts are appended to instead of refetched and redrawn
+function startLiveUpdates() {
+    if (!window.EventSource) return;
+    
+    let reconnecting = false;
+    liveStream = new EventSource(`${API_BASE}/stream?codes=BER,ORO`);
+    liveStream.addEventListener('readings', (event) => {
+        const readings = JSON.parse(event.data);
+        for (const [code, points] of Object.entries(readings)) {
+            if (!points.length) continue;
+            updateReservoirStats(code, points[points.length - 1]);
+            appendLivePoints(code, points);
+        }
+        // The overlay charts combine both reservoirs, so they are redrawn (only when data arrives)
+        createOverlayCharts();
+    });
+    liveStream.addEventListener('error', () => {
+        reconnecting = true;
+    });
+    liveStream.addEventListener('open', () => {
+        // Readings pushed while disconnected were missed: catch up with one full load
+        if (reconnecting) {
+            reconnecting = false;
+            loadReservoirData();
+            createCharts();
+            createOverlayCharts();
+        }
+    });
+}
+
+// Whether the stream is delivering updates (or reconnecting), so polling can be skipped
+function liveUpdatesActive() {
+    return liveStream !== null && liveStream.readyState !== EventSource.CLOSED;
+}
+
 // Embed Grafana panels (for future Grafana integration)
 function embedGrafanaPanels() {
     // This function is kept for future Grafana integration
@@ -709,27 +873,26 @@ async function createOverlayCharts() {
     
     // Get time range from first reservoir (they should be the same)
     const days = getTimeRange('BER');
+    const maxPoints = maxPointsFor('overlay-storage-chart');
     
     try {
-        // Fetch data for both reservoirs
-        const [berResponse, oroResponse] = await Promise.all([
-            fetch(`${API_BASE}/reservoir/BER/data?days=${days}`),
-            fetch(`${API_BASE}/reservoir/ORO/data?days=${days}`)
-        ]);
+        // Fetch data for both reservoirs in one batch request
+        const response = await fetch(`${API_BASE}/reservoirs/data?codes=BER,ORO&days=${days}&max_points=${maxPoints}&format=columnar`);
         
-        if (!berResponse.ok || !oroResponse.ok) {
+        if (!response.ok) {
             console.error('Failed to load data for overlay charts');
             return;
         }
         
-        const berData = await berResponse.json();
-        const oroData = await oroResponse.json();
+        const result = await response.json();
+        const berData = result.reservoirs.BER || {};
+        const oroData = result.reservoirs.ORO || {};
         
         // Create storage overlay chart
-        createOverlayChart('storage', berData.data || [], oroData.data || [], days, 'Storage (acre-feet)');
+        createOverlayChart('storage', seriesPoints(berData), seriesPoints(oroData), days, 'Storage (acre-feet)');
         
         // Create elevation overlay chart
-        createOverlayChart('elevation', berData.data || [], oroData.data || [], days, 'Elevation (feet)');
+        createOverlayChart('elevation', seriesPoints(berData), seriesPoints(oroData), days, 'Elevation (feet)');
     } catch (error) {
         console.error('Error creating overlay charts:', error);
     }
@@ -1042,6 +1205,7 @@ document.addEventListener('DOMContentLoaded', () => {
         createCharts();
         createOverlayCharts();
         setupChartModals();
+        startLiveUpdates();
         
         // Set up time range selectors
         const reservoirs = ['BER', 'ORO'];
@@ -1056,8 +1220,10 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
     
-    // Refresh data every 5 minutes
+    // Refresh data every 5 minutes, unless new readings are being pushed
+    // (the stream refuses connections when the server is at its limit, leaving it closed)
     setInterval(() => {
+        if (liveUpdatesActive()) return;
         loadReservoirData();
         if (typeof Chart !== 'undefined') {
             createCharts();
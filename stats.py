@@ -0,0 +1,144 @@
+"""
+Historical statistics for a reservoir (the /api/reservoir/<code>/stats endpoint)
+
+Daily average storage is read straight from the daily rollup table into a pandas
+Series (one row per day, ~15k rows for 40 years), and everything below runs
+vectorized over it:
+
+    percentiles        storage percentiles over the last 365 days
+    historical norms   median and mean storage for this calendar day (+/- NORMS_WINDOW_DAYS)
+                       over earlier years, each year weighted once
+    year over year     storage on the same date a year earlier
+
+The day-level results change only with the date or the stored data, so they are
+cached per (reservoir, date, data version); the current reading is applied on top
+on every call.
+"""
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from database import ReservoirRollupDaily, get_data_version
+
+# Days either side of the calendar day that count toward its historical norm
+NORMS_WINDOW_DAYS = 3
+PERCENTILES = (10, 25, 50, 75, 90)
+CACHE_MAX_ENTRIES = 64
+
+_cache = OrderedDict()  # (code, date, data version) -> day stats
+_lock = threading.Lock()
+
+
+def load_daily_storage(db, code):
+    """Daily average storage for a reservoir as a Series indexed by day"""
+    model = ReservoirRollupDaily
+    query = select(
+        model.bucket_start, (model.storage_sum / model.storage_count).label('storage'),
+    ).where(
+        model.reservoir_code == code, model.storage_count > 0,
+    ).order_by(model.bucket_start)
+    frame = pd.read_sql(query, db.connection(), index_col='bucket_start', parse_dates=['bucket_start'])
+    return frame['storage'].astype(float)
+
+
+def calendar_day(index):
+    """Day of year on a 365-day calendar (Feb 29 shares a slot with Mar 1)"""
+    return np.asarray(index.dayofyear - ((index.is_leap_year) & (index.month > 2)))
+
+
+def day_stats(storage, day):
+    """
+    Statistics for `day` that don't depend on the current reading
+    storage: Series from load_daily_storage; day: datetime.date
+    Returns: dict of percentiles, same-day values of earlier years, and the value a year ago
+    """
+    day = pd.Timestamp(day)
+    window = storage[(storage.index > day - pd.Timedelta(days=365)) & (storage.index <= day)].to_numpy()
+    percentiles = dict(zip(PERCENTILES, np.percentile(window, PERCENTILES))) if len(window) else {}
+    
+    # Signed calendar days from the target day, wrapped to [-182, 182]; a reading belongs
+    # to the year of the target day it is nearest to, so windows spanning New Year
+    # (e.g. Dec 30 for Jan 1) count toward the right year
+    target = calendar_day(pd.DatetimeIndex([day]))[0]
+    offset = (calendar_day(storage.index) - target + 182) % 365 - 182
+    season = (storage.index - pd.to_timedelta(offset, unit='D')).year
+    in_window = (np.abs(offset) <= NORMS_WINDOW_DAYS) & (season < day.year)
+    same_day = storage[in_window]
+    yearly = same_day.groupby(season[in_window]).mean()
+    
+    year_ago = None
+    if len(storage):
+        nearest = storage.reindex([day - pd.DateOffset(years=1)], method='nearest',
+                                  tolerance=pd.Timedelta(days=NORMS_WINDOW_DAYS))
+        year_ago = None if pd.isna(nearest.iloc[0]) else float(nearest.iloc[0])
+    
+    return {
+        'percentiles': {f'p{p}': float(value) for p, value in percentiles.items()},
+        'yearly': yearly.to_numpy(),
+        'year_ago': year_ago,
+        'first_year': int(storage.index[0].year) if len(storage) else None,
+    }
+
+
+def cached_day_stats(db, code, day):
+    """
+    day_stats for a reservoir, computed at most once per (code, day) per process until
+    stored data changes (backfills and corrections bump the data version)
+    """
+    key = (code, day, get_data_version(db))
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    
+    result = day_stats(load_daily_storage(db, code), day)
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return result
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def _percent(value, reference):
+    return round(value / reference * 100, 1) if value is not None and reference else None
+
+
+def reservoir_stats(db, code, current_storage, day):
+    """
+    Percentiles, historical norms and year-over-year change for the current storage on `day`
+    Returns: dict ready for JSON
+    """
+    stats = cached_day_stats(db, code, day)
+    yearly = stats['yearly']
+    median = float(np.median(yearly)) if len(yearly) else None
+    average = float(yearly.mean()) if len(yearly) else None
+    year_ago = stats['year_ago']
+    
+    return {
+        'percentiles': stats['percentiles'],
+        'historical': {
+            'years': len(yearly),
+            'since_year': stats['first_year'],
+            'day_of_year_median': median,
+            'day_of_year_average': average,
+            'percent_of_median': _percent(current_storage, median),
+            'percent_of_average': _percent(current_storage, average),
+            # Share of earlier years that had less water on this day
+            'percentile_rank': round(float((yearly < current_storage).mean() * 100), 1)
+            if len(yearly) and current_storage is not None else None,
+        },
+        'year_over_year': {
+            'storage_year_ago': year_ago,
+            'change': current_storage - year_ago if current_storage is not None and year_ago is not None else None,
+            'percent_change': _percent(current_storage - year_ago, year_ago)
+            if current_storage is not None and year_ago is not None else None,
+        },
+    }
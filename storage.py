@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Storage backends for raw reservoir readings
+
+Everything that reads or writes raw readings goes through a ReadingStore:
+collector and backfill writes, rollup rebuilds, and the API's raw series and
+latest-reading queries. config.STORAGE_BACKEND picks the backend:
+
+    sql          the single reservoir_data table (database.ReservoirData)
+    partitioned  one table per reservoir and month, listed in reading_partitions.
+                 Rows hold just the timestamp and values, range queries open only
+                 the months they cover, and retention drops whole tables.
+
+Usage:
+    python storage.py --apply-retention [--archive-dir DIR]   # drop raw months older than RAW_RETENTION_DAYS
+    python storage.py --drop-before 2020-01-01 [--archive-dir DIR]
+    python storage.py --migrate-from sql                       # copy readings into STORAGE_BACKEND
+"""
+import argparse
+from collections import namedtuple
+from datetime import datetime, timedelta
+import logging
+from pathlib import Path
+import re
+import sys
+import threading
+
+import pandas as pd
+from sqlalchemy import Column, DateTime, Float, MetaData, String, Table, desc, func, select
+from sqlalchemy.schema import CreateTable, DropTable
+
+from database import (
+    ReadingPartition, ReservoirData, SessionLocal, UPSERT_CHUNK_SIZE, bump_data_version, configure_engine,
+    init_db, insert_ignore_duplicates, load_reservoir_data, upsert_reservoir_data,
+)
+import config
+
+logger = logging.getLogger(__name__)
+
+# A stored raw reading, as returned by every backend
+Reading = namedtuple('Reading', [
+    'reservoir_code', 'timestamp', 'reservoir_elevation', 'storage', 'storage_percent', 'data_source',
+])
+
+VALUE_COLUMNS = ('reservoir_elevation', 'storage', 'storage_percent', 'data_source')
+
+PARTITION_PREFIX = 'readings_'
+
+
+def month_start(timestamp):
+    """First instant of the month containing timestamp"""
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    """First instant of the month after the one starting at start"""
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def iter_months(start, end):
+    """Month starts of every month overlapping [start, end)"""
+    month = month_start(start)
+    while month < end:
+        yield month
+        month = next_month(month)
+
+
+def archive_month(readings, archive_dir, code, month):
+    """
+    Write one reservoir-month of readings to archive_dir/<code>/<YYYY-MM>.csv.gz
+    Returns: path written, or None when there was nothing to archive
+    """
+    if not readings:
+        return None
+    path = Path(archive_dir) / code / f'{month:%Y-%m}.csv.gz'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame.from_records(readings, columns=Reading._fields).to_csv(path, index=False)
+    return path
+
+
+class ReadingStore:
+    """
+    Interface for raw reading storage
+    Methods run in the caller's session and transaction; the caller commits.
+    """
+    name = None
+    
+    def write(self, db, rows):
+        """
+        Insert readings, skipping any (reservoir_code, timestamp) already stored
+        rows: list of dicts keyed by reservoir_code, timestamp and VALUE_COLUMNS
+        Returns: number of rows actually inserted
+        """
+        raise NotImplementedError
+    
+    def load(self, db, keys):
+        """Returns: dict mapping stored (reservoir_code, timestamp) pairs from keys to Readings"""
+        raise NotImplementedError
+    
+    def series(self, db, codes, start, end=None):
+        """
+        Raw series for several reservoirs in [start, end), oldest first
+        Returns: dict mapping each code to a list of (timestamp, reservoir_elevation, storage, storage_percent)
+        """
+        raise NotImplementedError
+    
+    def readings(self, db, code, start, end):
+        """Full Readings for one reservoir in [start, end), oldest first"""
+        raise NotImplementedError
+    
+    def latest(self, db, codes):
+        """Returns: dict mapping each code to its newest Reading (or None)"""
+        raise NotImplementedError
+    
+    def bounds(self, db, code):
+        """(first, last) timestamps stored for a reservoir, or (None, None)"""
+        raise NotImplementedError
+    
+    def codes(self, db):
+        """Reservoir codes with stored readings"""
+        raise NotImplementedError
+    
+    def drop_month(self, db, code, month):
+        """Remove every reading of one reservoir-month"""
+        raise NotImplementedError
+    
+    def months_before(self, db, cutoff):
+        """(reservoir_code, month_start) for each stored month that ends on or before cutoff"""
+        months = []
+        for code in self.codes(db):
+            first, _ = self.bounds(db, code)
+            if first is not None:
+                months.extend((code, month) for month in iter_months(first, month_start(cutoff)))
+        return months
+    
+    def apply_retention(self, db, cutoff, archive_dir=None):
+        """
+        Drop raw readings in whole months ending on or before cutoff; rollups are kept.
+        With archive_dir, each month is written to a CSV (see archive_month) before it is dropped.
+        Returns: number of reservoir-months dropped
+        """
+        dropped = 0
+        for code, month in self.months_before(db, cutoff):
+            if archive_dir:
+                archive_month(self.readings(db, code, month, next_month(month)), archive_dir, code, month)
+            self.drop_month(db, code, month)
+            dropped += 1
+        return dropped
+
+
+class SQLReadingStore(ReadingStore):
+    """All readings in the reservoir_data table"""
+    name = 'sql'
+    
+    @staticmethod
+    def _reading(row):
+        return Reading(row.reservoir_code, row.timestamp, row.reservoir_elevation, row.storage,
+                       row.storage_percent, row.data_source)
+    
+    def write(self, db, rows):
+        return upsert_reservoir_data(db, rows)
+    
+    def load(self, db, keys):
+        return {key: self._reading(row) for key, row in load_reservoir_data(db, keys).items()}
+    
+    def series(self, db, codes, start, end=None):
+        series = {code: [] for code in codes}
+        query = db.query(
+            ReservoirData.reservoir_code, ReservoirData.timestamp, ReservoirData.reservoir_elevation,
+            ReservoirData.storage, ReservoirData.storage_percent,
+        ).filter(
+            ReservoirData.reservoir_code.in_(codes),
+            ReservoirData.timestamp >= start,
+        )
+        if end is not None:
+            query = query.filter(ReservoirData.timestamp < end)
+        for code, timestamp, elevation, storage, storage_percent in query.order_by(
+                ReservoirData.reservoir_code, ReservoirData.timestamp):
+            series[code].append((timestamp, elevation, storage, storage_percent))
+        return series
+    
+    def readings(self, db, code, start, end):
+        rows = db.query(ReservoirData).filter(
+            ReservoirData.reservoir_code == code,
+            ReservoirData.timestamp >= start,
+            ReservoirData.timestamp < end,
+        ).order_by(ReservoirData.timestamp)
+        return [self._reading(row) for row in rows]
+    
+    def latest(self, db, codes):
+        # One ORDER BY timestamp DESC LIMIT 1 subquery per code, each an index seek on
+        # (reservoir_code, timestamp), in a single statement; a window over every
+        # reading for the codes grows with the history
+        latest = {code: None for code in codes}
+        newest_ids = [
+            select(ReservoirData.id).where(ReservoirData.reservoir_code == code)
+            .order_by(desc(ReservoirData.timestamp)).limit(1).scalar_subquery()
+            for code in latest
+        ]
+        if newest_ids:
+            for row in db.query(ReservoirData).filter(ReservoirData.id.in_(newest_ids)):
+                latest[row.reservoir_code] = self._reading(row)
+        return latest
+    
+    def bounds(self, db, code):
+        return tuple(db.query(
+            func.min(ReservoirData.timestamp), func.max(ReservoirData.timestamp)
+        ).filter(ReservoirData.reservoir_code == code).one())
+    
+    def codes(self, db):
+        return [code for (code,) in db.query(ReservoirData.reservoir_code).distinct()]
+    
+    def drop_month(self, db, code, month):
+        db.query(ReservoirData).filter(
+            ReservoirData.reservoir_code == code,
+            ReservoirData.timestamp >= month,
+            ReservoirData.timestamp < next_month(month),
+        ).delete(synchronize_session=False)
+
+
+def partition_name(code, month):
+    """Table holding one reservoir-month, e.g. readings_ber_202501"""
+    if not re.fullmatch(r'[A-Za-z0-9]+', code):
+        raise ValueError(f"Reservoir code not usable in a table name: {code!r}")
+    return f'{PARTITION_PREFIX}{code.lower()}_{month:%Y%m}'
+
+
+class PartitionedReadingStore(ReadingStore):
+    """
+    One table per reservoir and month, keyed (and on SQLite clustered) by timestamp
+    reading_partitions lists the tables, so queries look up the months they need
+    instead of scanning one ever-growing table.
+    """
+    name = 'partitioned'
+    
+    def __init__(self):
+        self._metadata = MetaData()
+        self._lock = threading.Lock()
+    
+    def _table(self, name):
+        with self._lock:
+            table = self._metadata.tables.get(name)
+            if table is None:
+                table = Table(
+                    name, self._metadata,
+                    Column('timestamp', DateTime, primary_key=True),
+                    Column('reservoir_elevation', Float),
+                    Column('storage', Float),
+                    Column('storage_percent', Float),
+                    Column('data_source', String(50)),
+                    sqlite_with_rowid=False,
+                )
+            return table
+    
+    def _partitions(self, db, codes, start=None, end=None):
+        """(reservoir_code, month_start, table) for the partitions overlapping [start, end), oldest first"""
+        query = db.query(
+            ReadingPartition.reservoir_code, ReadingPartition.month_start, ReadingPartition.table_name
+        ).filter(ReadingPartition.reservoir_code.in_(codes))
+        if start is not None:
+            query = query.filter(ReadingPartition.month_start >= month_start(start))
+        if end is not None:
+            query = query.filter(ReadingPartition.month_start < end)
+        return [
+            (code, month, self._table(name))
+            for code, month, name in query.order_by(ReadingPartition.reservoir_code, ReadingPartition.month_start)
+        ]
+    
+    def _ensure_partition(self, db, code, month):
+        """Create a reservoir-month table and catalog it, if not done already"""
+        table = self._table(partition_name(code, month))
+        db.execute(CreateTable(table, if_not_exists=True))
+        db.execute(
+            insert_ignore_duplicates(db.get_bind(), ReadingPartition.__table__, index_elements=('table_name',)),
+            [{'reservoir_code': code, 'month_start': month, 'table_name': table.name,
+              'created_at': datetime.utcnow()}],
+        )
+        return table
+    
+    @staticmethod
+    def _reading(code, row):
+        return Reading(code, row.timestamp, row.reservoir_elevation, row.storage,
+                       row.storage_percent, row.data_source)
+    
+    def write(self, db, rows):
+        grouped = {}
+        for row in rows:
+            grouped.setdefault((row['reservoir_code'], month_start(row['timestamp'])), []).append(row)
+        
+        inserted = 0
+        for (code, month), group in sorted(grouped.items()):
+            table = self._ensure_partition(db, code, month)
+            stmt = insert_ignore_duplicates(db.get_bind(), table, index_elements=('timestamp',))
+            values = [
+                dict({column: row.get(column) for column in VALUE_COLUMNS}, timestamp=row['timestamp'])
+                for row in group
+            ]
+            for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+                result = db.execute(stmt, values[start:start + UPSERT_CHUNK_SIZE])
+                inserted += max(result.rowcount, 0)
+        return inserted
+    
+    def load(self, db, keys):
+        wanted = {}
+        for code, timestamp in keys:
+            wanted.setdefault(partition_name(code, month_start(timestamp)), (code, []))[1].append(timestamp)
+        
+        loaded = {}
+        for code, _, table in self._partitions(db, {code for code, _ in wanted.values()}):
+            if table.name not in wanted:
+                continue
+            for row in db.execute(select(table).where(table.c.timestamp.in_(wanted[table.name][1]))):
+                loaded[(code, row.timestamp)] = self._reading(code, row)
+        return loaded
+    
+    def _select_range(self, table, start, end, columns=None):
+        query = select(*(columns or table.c)).where(table.c.timestamp >= start)
+        if end is not None:
+            query = query.where(table.c.timestamp < end)
+        return query.order_by(table.c.timestamp)
+    
+    def series(self, db, codes, start, end=None):
+        series = {code: [] for code in codes}
+        for code, _, table in self._partitions(db, codes, start, end):
+            columns = [table.c.timestamp, table.c.reservoir_elevation, table.c.storage, table.c.storage_percent]
+            series[code].extend(tuple(row) for row in db.execute(self._select_range(table, start, end, columns)))
+        return series
+    
+    def readings(self, db, code, start, end):
+        return [
+            self._reading(code, row)
+            for _, _, table in self._partitions(db, [code], start, end)
+            for row in db.execute(self._select_range(table, start, end))
+        ]
+    
+    def latest(self, db, codes):
+        latest = {code: None for code in codes}
+        for code, _, table in reversed(self._partitions(db, codes)):
+            if latest[code] is None:
+                row = db.execute(select(table).order_by(desc(table.c.timestamp)).limit(1)).first()
+                if row is not None:
+                    latest[code] = self._reading(code, row)
+        return latest
+    
+    def bounds(self, db, code):
+        first = last = None
+        for _, _, table in self._partitions(db, [code]):
+            low, high = db.execute(select(func.min(table.c.timestamp), func.max(table.c.timestamp))).one()
+            if low is not None:
+                first = first or low
+                last = high
+        return first, last
+    
+    def codes(self, db):
+        return [code for (code,) in db.query(ReadingPartition.reservoir_code).distinct()]
+    
+    def months_before(self, db, cutoff):
+        return [
+            (code, month)
+            for code, month in db.query(ReadingPartition.reservoir_code, ReadingPartition.month_start).filter(
+                ReadingPartition.month_start < month_start(cutoff)
+            ).order_by(ReadingPartition.reservoir_code, ReadingPartition.month_start)
+        ]
+    
+    def drop_month(self, db, code, month):
+        name = partition_name(code, month)
+        db.execute(DropTable(self._table(name), if_exists=True))
+        db.query(ReadingPartition).filter(ReadingPartition.table_name == name).delete(synchronize_session=False)
+
+
+STORAGE_BACKENDS = {
+    'sql': SQLReadingStore,
+    'partitioned': PartitionedReadingStore,
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(name=None):
+    """The process-wide ReadingStore for a backend (default: config.STORAGE_BACKEND)"""
+    name = name or config.STORAGE_BACKEND
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = STORAGE_BACKENDS[name]()
+        return _stores[name]
+
+
+def enforce_retention(cutoff=None, archive_dir=None):
+    """
+    Drop raw readings in months ending before cutoff (default: RAW_RETENTION_DAYS ago)
+    Returns: number of reservoir-months dropped
+    """
+    if cutoff is None:
+        if config.RAW_RETENTION_DAYS is None:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(days=config.RAW_RETENTION_DAYS)
+    archive_dir = archive_dir or config.STORAGE_ARCHIVE_DIR
+    
+    db = SessionLocal()
+    try:
+        dropped = get_store().apply_retention(db, cutoff, archive_dir)
+        if dropped:
+            bump_data_version(db)
+        db.commit()
+        logger.info(f"Retention: dropped {dropped} reservoir-month(s) of raw readings before {cutoff:%Y-%m-%d}")
+        return dropped
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def copy_readings(source, target, codes=None):
+    """
+    Copy raw readings between backends one reservoir-month per transaction
+    Returns: number of rows inserted into target
+    """
+    db = SessionLocal()
+    try:
+        copied = 0
+        for code in codes or source.codes(db):
+            first, last = source.bounds(db, code)
+            if first is None:
+                continue
+            for month in iter_months(first, last + timedelta(microseconds=1)):
+                rows = [reading._asdict() for reading in source.readings(db, code, month, next_month(month))]
+                copied += target.write(db, rows)
+                db.commit()
+            logger.info(f"Copied {code} ({first:%Y-%m-%d}..{last:%Y-%m-%d}) from {source.name} to {target.name}")
+        return copied
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='Maintain raw reading storage')
+    parser.add_argument('--apply-retention', action='store_true',
+                        help=f'Drop raw months older than RAW_RETENTION_DAYS ({config.RAW_RETENTION_DAYS})')
+    parser.add_argument('--drop-before', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        help='Drop raw months ending on or before YYYY-MM-DD')
+    parser.add_argument('--archive-dir', help='Write dropped months here as CSV first')
+    parser.add_argument('--migrate-from', choices=sorted(STORAGE_BACKENDS),
+                        help=f'Copy readings from this backend into STORAGE_BACKEND ({config.STORAGE_BACKEND})')
+    args = parser.parse_args(argv)
+    
+    if not (args.apply_retention or args.drop_before or args.migrate_from):
+        parser.print_help()
+        return 1
+    
+    configure_engine('cli')
+    init_db()
+    if args.migrate_from:
+        if args.migrate_from == config.STORAGE_BACKEND:
+            parser.error('--migrate-from must differ from STORAGE_BACKEND')
+        copy_readings(get_store(args.migrate_from), get_store())
+    if args.drop_before or args.apply_retention:
+        enforce_retention(args.drop_before, args.archive_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Push newly stored readings to connected dashboards (Server-Sent Events)
+
+The collector already bumps the data version in every write transaction, so the
+web process uses it as its pub/sub channel: one ReadingBroadcaster thread per
+process polls the version every STREAM_POLL_SECONDS and, when it moves, reads
+each reservoir's readings newer than its high-water mark (the newest timestamp
+already pushed) and fans them out to every subscriber's queue. Backfilled rows
+older than the high-water mark are not pushed, and a reservoir that had no
+readings yet gets only its newest one (not a whole backfill); clients pick the
+rest up on their next full load.
+
+The thread only runs while someone is subscribed. Each open stream holds a web
+server thread, so streams per process are capped at STREAM_MAX_CLIENTS and end
+after STREAM_MAX_SECONDS (EventSource reconnects on its own).
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+from database import SessionLocal, get_data_version
+from storage import get_store
+import config
+
+logger = logging.getLogger(__name__)
+
+class Subscriber:
+    """One connected stream: its queue, the codes it wants, and whether it fell behind"""
+    
+    def __init__(self, codes, queue_size):
+        self.codes = set(codes)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class ReadingBroadcaster:
+    """Polls the data version and fans new readings out to subscribers"""
+    
+    def __init__(self, codes=None, poll_seconds=None, queue_size=None, max_clients=None):
+        self.codes = list(codes or config.RESERVOIRS.keys())
+        self.poll_seconds = poll_seconds or config.STREAM_POLL_SECONDS
+        self.queue_size = queue_size or config.STREAM_QUEUE_SIZE
+        self.max_clients = max_clients or config.STREAM_MAX_CLIENTS
+        self.version = None
+        self.high_water = {}
+        self.events = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def prime(self):
+        """Start from the current version and newest stored readings, so only later rows are pushed"""
+        db = SessionLocal()
+        try:
+            self.version = get_data_version(db)
+            latest = get_store().latest(db, self.codes)
+        finally:
+            db.close()
+        self.high_water = {code: reading.timestamp if reading else None for code, reading in latest.items()}
+    
+    def subscribe(self, codes=None):
+        """
+        Register a subscriber for codes (default: all), starting the poll thread if needed
+        Returns: Subscriber, or None if the process is already at STREAM_MAX_CLIENTS
+        """
+        subscriber = Subscriber(codes or self.codes, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            start = self._thread is None
+            if start:
+                self.prime()
+                self._thread = threading.Thread(target=self._run, name='reading-broadcaster', daemon=True)
+            self._subscribers.add(subscriber)
+        if start:
+            self._thread.start()
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+    
+    def poll_once(self):
+        """
+        Check the data version and publish readings stored since the last check
+        Returns: the published event, or None if nothing changed
+        """
+        db = SessionLocal()
+        try:
+            version = get_data_version(db)
+            if version == self.version:
+                return None
+            store = get_store()
+            readings = {}
+            # Reservoirs with no readings at priming: send just the newest, whatever was loaded
+            unmarked = [code for code in self.codes if self.high_water.get(code) is None]
+            for code, reading in (store.latest(db, unmarked) if unmarked else {}).items():
+                if reading is not None:
+                    readings[code] = [(reading.timestamp, reading.reservoir_elevation, reading.storage,
+                                       reading.storage_percent)]
+                    self.high_water[code] = reading.timestamp
+            for code in self.codes:
+                mark = self.high_water.get(code)
+                if mark is None or code in readings:
+                    continue
+                points = [point for point in store.series(db, [code], mark)[code] if point[0] > mark]
+                if points:
+                    readings[code] = points
+                    self.high_water[code] = points[-1][0]
+        finally:
+            db.close()
+        
+        self.version = version
+        if not readings:
+            return None
+        event = {'version': version, 'readings': readings}
+        self.publish(event)
+        return event
+    
+    def publish(self, event):
+        """Queue event for every subscriber wanting one of its codes; subscribers that fell behind are dropped"""
+        self.events += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.codes.isdisjoint(event['readings']):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                subscriber.dropped = True
+                self.unsubscribe(subscriber)
+    
+    def _run(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Reading broadcast poll failed: {e}")
+    
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'events': self.events, 'version': self.version}
+
+
+def format_event(event, codes):
+    """SSE frame for the part of event a subscriber asked for"""
+    payload = {
+        code: [{
+            'timestamp': timestamp.isoformat(),
+            'reservoir_elevation': elevation,
+            'storage': storage,
+            'storage_percent': storage_percent,
+        } for timestamp, elevation, storage, storage_percent in points]
+        for code, points in event['readings'].items() if code in codes
+    }
+    return f"id: {event['version']}\nevent: readings\ndata: {json.dumps(payload)}\n\n"
+
+
+def event_stream(broadcaster, subscriber, keepalive_seconds=None, max_seconds=None):
+    """
+    Generator of SSE frames for one subscriber; unsubscribes when the client goes away
+    A comment line is sent every keepalive_seconds so proxies keep the connection open.
+    """
+    keepalive_seconds = keepalive_seconds or config.STREAM_KEEPALIVE_SECONDS
+    deadline = time.monotonic() + (max_seconds or config.STREAM_MAX_SECONDS)
+    try:
+        yield f"retry: {config.STREAM_RETRY_MS}\n\n"
+        while time.monotonic() < deadline and not subscriber.dropped:
+            try:
+                event = subscriber.queue.get(timeout=min(keepalive_seconds, max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event, subscriber.codes)
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+# Shared by every stream in this process
+broadcaster = ReadingBroadcaster()
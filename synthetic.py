@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Synthetic reservoir history for development and benchmarks
+
+Fills the raw reading store with years of readings for N reservoirs and then
+rebuilds their rollups, so the API can be exercised against decades of data.
+Each reservoir's series is built with NumPy: a seasonal fill cycle peaking in
+late spring, wet and dry years that carry over (an AR(1) walk on the yearly
+mean), and a little hourly noise. Elevation follows storage on a concave
+curve up to the reservoir's max pool elevation. The same seed gives the same data.
+
+Reservoirs beyond those in config.RESERVOIRS get codes R003, R004, ... with a
+synthetic capacity. Readings go through storage.get_store().write in chunks,
+like the collector's batches.
+
+Usage:
+    python synthetic.py --reservoirs 10 --years 40                 # hourly readings
+    python synthetic.py --reservoirs 2 --years 5 --interval-hours 0.25 --deployments 200
+"""
+import argparse
+from datetime import datetime, timedelta
+import logging
+
+import numpy as np
+
+from database import Deployment, SessionLocal, bump_data_version, configure_engine, init_db
+from rollups import rebuild_rollups
+from storage import get_store
+import config
+
+logger = logging.getLogger(__name__)
+
+# Rows written per transaction
+CHUNK_ROWS = 50000
+# Day of year the seasonal cycle peaks (reservoirs fill through spring snowmelt)
+PEAK_DAY = 130
+
+
+def reservoir_codes(count):
+    """The first `count` configured reservoirs, then synthetic codes"""
+    codes = list(config.RESERVOIRS)[:count]
+    return codes + [f'R{i:03d}' for i in range(len(codes) + 1, count + 1)]
+
+
+def capacity(code, rng):
+    reservoir = config.RESERVOIRS.get(code, {})
+    return (reservoir.get('capacity_acre_feet') or float(rng.integers(50, 4500)) * 1000,
+            reservoir.get('max_elevation') or float(rng.integers(300, 1200)))
+
+
+def generate_series(code, start, end, interval, seed=0):
+    """
+    Synthetic readings for one reservoir over [start, end)
+    Returns: (timestamps as datetime64[s] array, elevation array, storage array, capacity)
+    """
+    rng = np.random.default_rng([seed, *code.encode()])
+    capacity_af, max_elevation = capacity(code, rng)
+    timestamps = np.arange(np.datetime64(start, 's'), np.datetime64(end, 's'),
+                           np.timedelta64(int(interval.total_seconds()), 's'))
+    days = (timestamps - timestamps[0]).astype('timedelta64[s]').astype(np.float64) / 86400
+    day_of_year = (timestamps - timestamps.astype('datetime64[Y]')).astype('timedelta64[D]').astype(np.float64)
+    
+    # Yearly mean fill: wet and dry years persist
+    years = timestamps.astype('datetime64[Y]').astype(int)
+    year_index = years - years[0]
+    wetness = np.zeros(year_index[-1] + 1)
+    for i in range(1, len(wetness)):
+        wetness[i] = 0.6 * wetness[i - 1] + rng.normal(0, 0.12)
+    mean_fill = np.clip(0.6 + wetness[year_index], 0.2, 0.85)
+    
+    seasonal = 0.15 * np.cos(2 * np.pi * (day_of_year - PEAK_DAY) / 365.25)
+    noise = np.cumsum(rng.normal(0, 0.0005, len(days)))
+    week = max(1, round(7 * 86400 / interval.total_seconds()))  # samples in a week at this interval
+    noise -= np.convolve(noise, np.ones(week) / week, mode='same')  # keep the drift local
+    fill = np.clip(mean_fill + seasonal + noise, 0.05, 1.0)
+    
+    storage = np.round(fill * capacity_af)
+    elevation = np.round(max_elevation * (0.55 + 0.45 * fill ** 0.6), 2)
+    return timestamps, elevation, storage, capacity_af
+
+
+def fill_history(codes, years, interval=timedelta(hours=1), end=None, seed=0):
+    """
+    Write `years` of synthetic readings for each code ending at `end`, then rebuild rollups
+    Returns: number of rows inserted
+    """
+    end = end or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=round(365.25 * years))
+    store = get_store()
+    inserted = 0
+    db = SessionLocal()
+    try:
+        for code in codes:
+            timestamps, elevation, storage, capacity_af = generate_series(code, start, end, interval, seed)
+            percent = np.round(storage / capacity_af * 100, 2)
+            for i in range(0, len(timestamps), CHUNK_ROWS):
+                rows = [{
+                    'reservoir_code': code,
+                    'timestamp': timestamp,
+                    'reservoir_elevation': float(elevation_value),
+                    'storage': float(storage_value),
+                    'storage_percent': float(percent_value),
+                    'data_source': 'SYNTHETIC',
+                } for timestamp, elevation_value, storage_value, percent_value in zip(
+                    timestamps[i:i + CHUNK_ROWS].tolist(), elevation[i:i + CHUNK_ROWS],
+                    storage[i:i + CHUNK_ROWS], percent[i:i + CHUNK_ROWS])]
+                inserted += store.write(db, rows)
+                db.commit()
+            logger.info(f"{code}: {len(timestamps)} synthetic readings from {start:%Y-%m-%d}")
+        bump_data_version(db)
+        db.commit()
+    finally:
+        db.close()
+    
+    rebuild_rollups(codes)
+    return inserted
+
+
+def add_deployments(count, end=None, seed=0):
+    """Insert `count` synthetic deployment records, alternating dev and prod, one a day back from end"""
+    end = end or datetime.utcnow()
+    rng = np.random.default_rng(seed)
+    db = SessionLocal()
+    try:
+        db.add_all([Deployment(
+            environment=('dev', 'prod')[i % 2],
+            deployed_at=end - timedelta(days=i // 2, hours=int(rng.integers(0, 12))),
+            commit_sha=rng.bytes(20).hex(),
+            commit_message=f'Synthetic deployment {i}',
+            branch='main',
+            deployed_by='synthetic',
+        ) for i in range(count)])
+        db.commit()
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='Fill the database with synthetic reservoir history')
+    parser.add_argument('--reservoirs', type=int, default=len(config.RESERVOIRS), help='Number of reservoirs')
+    parser.add_argument('--years', type=float, default=10, help='Years of history per reservoir')
+    parser.add_argument('--interval-hours', type=float, default=1, help='Hours between readings')
+    parser.add_argument('--deployments', type=int, default=0, help='Synthetic deployment records to add')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    
+    configure_engine('cli')
+    init_db()
+    codes = reservoir_codes(args.reservoirs)
+    inserted = fill_history(codes, args.years, timedelta(hours=args.interval_hours), seed=args.seed)
+    add_deployments(args.deployments, seed=args.seed)
+    print(f"Inserted {inserted} readings for {', '.join(codes)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Tests for the Flask API endpoints
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import database
+from collector import ReservoirCollector
+
+
+@contextmanager
+def count_queries():
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(database.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', record)
+
+
+def test_batch_latest_uses_one_query(client):
+    now = datetime.utcnow().replace(microsecond=0)
+    ReservoirCollector().save_batch([
+        ('BER', now - timedelta(hours=2), 437.0, 1480000.0),
+        ('BER', now - timedelta(hours=1), 438.0, 1486000.0),
+        ('ORO', now - timedelta(hours=3), 780.0, 2400000.0),
+    ])
+    
+    with count_queries() as statements:
+        result = client.get('/api/reservoirs/latest?codes=BER,ORO,SHA').get_json()['reservoirs']
+    
+    assert result['BER']['storage'] == 1486000.0
+    assert result['ORO']['storage'] == 2400000.0
+    assert result['SHA'] is None
+    assert len([s for s in statements if 'reservoir_data' in s]) == 1
+    assert client.get('/api/reservoirs/latest').get_json()['reservoirs'].keys() == {'BER', 'ORO'}
+
+
+def test_batch_data_matches_single_endpoints(client):
+    now = datetime.utcnow().replace(microsecond=0)
+    ReservoirCollector().save_batch(
+        [(code, now - timedelta(hours=i), 400.0 + i, 1000.0 + i) for code in ('BER', 'ORO') for i in range(48)]
+    )
+    
+    with count_queries() as statements:
+        batch = client.get('/api/reservoirs/data?codes=BER,ORO&days=3&resolution=raw').get_json()
+    assert len([s for s in statements if 'reservoir_data' in s]) == 1
+    
+    for code in ('BER', 'ORO'):
+        single = client.get(f'/api/reservoir/{code}/data?days=3&resolution=raw').get_json()
+        assert batch['reservoirs'][code]['data'] == single['data']
+    
+    columnar = client.get('/api/reservoirs/data?codes=BER&days=3&format=columnar&max_points=10').get_json()
+    assert len(columnar['reservoirs']['BER']['columns']['storage']) == 10
+    assert client.get('/api/reservoirs/data?format=binary').status_code == 400
+
+
+def test_pages_render(client):
+    assert client.get('/').status_code == 200
+    assert client.get('/deployments').status_code == 200
+
+
+def test_since_cursor_returns_only_new_points(client):
+    now = datetime.utcnow().replace(microsecond=0, second=0, minute=0)
+    collector = ReservoirCollector()
+    collector.save_batch([('BER', now - timedelta(hours=i), 400.0 + i, 1000.0 + i) for i in range(1, 6)])
+    
+    full = client.get('/api/reservoir/BER/data?days=1&resolution=raw').get_json()
+    assert len(full['data']) == 5 and full['next_cursor'] == (now - timedelta(hours=1)).isoformat()
+    
+    collector.save_batch([('BER', now, 400.0, 1000.0)])
+    delta = client.get(f"/api/reservoir/BER/data?days=1&resolution=raw&since={full['next_cursor']}").get_json()
+    assert [point['timestamp'] for point in delta['data']] == [full['next_cursor'], now.isoformat()]
+    assert delta['next_cursor'] == now.isoformat()
+    
+    # Epoch-second cursors (as in columnar timestamps) work too, and the batch endpoint takes them per reservoir
+    epoch = int((now - datetime(1970, 1, 1)).total_seconds())
+    batch = client.get(f'/api/reservoirs/data?codes=BER,ORO&days=1&resolution=raw&since={epoch}').get_json()
+    assert [point['timestamp'] for point in batch['reservoirs']['BER']['data']] == [now.isoformat()]
+    assert batch['reservoirs']['ORO'] == {'data': [], 'next_cursor': now.isoformat()}
+    for bad_cursor in ('yesterday', '1e18', 'inf', 'nan'):
+        assert client.get(f'/api/reservoir/BER/data?since={bad_cursor}').status_code == 400
+
+
+def test_unchanged_series_revalidates_with_304(client):
+    now = datetime.utcnow().replace(microsecond=0)
+    collector = ReservoirCollector()
+    collector.save_batch([('BER', now - timedelta(hours=1), 400.0, 1000.0)])
+    
+    first = client.get('/api/reservoir/BER/data?days=1&resolution=raw')
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    again = client.get('/api/reservoir/BER/data?days=1&resolution=raw', headers={'If-None-Match': etag})
+    assert (again.status_code, again.data) == (304, b'')
+    
+    collector.save_batch([('BER', now, 401.0, 1001.0)])
+    changed = client.get('/api/reservoir/BER/data?days=1&resolution=raw', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
@@ -0,0 +1,44 @@
+"""
+Tests for the resumable historical backfill
+"""
+from datetime import datetime, timedelta
+
+from backfill import plan_windows, run_backfill
+from collector import ReservoirCollector
+from database import BackfillCheckpoint, ReservoirData
+
+
+def test_plan_windows_covers_range_without_overlap():
+    windows = plan_windows(datetime(1985, 1, 1), datetime(1987, 3, 1), 365)
+    assert windows[0] == (datetime(1985, 1, 1), datetime(1985, 12, 31))
+    assert windows[-1][1] == datetime(1987, 3, 1)
+    for (_, previous_end), (next_start, _) in zip(windows, windows[1:]):
+        assert next_start == previous_end + timedelta(days=1)
+
+
+def test_backfill_resumes_from_checkpoints(db):
+    collector = ReservoirCollector()
+    fetched = []
+    outage = {'ORO': True}
+    
+    def fake_history(code, start, end):
+        fetched.append((code, start))
+        if start.year == 1986 and outage.get(code):
+            return None  # Simulate a failed window on the first run
+        days = (end - start).days + 1
+        return [(start + timedelta(days=i), 400.0, 1000.0 + i) for i in range(days)]
+    
+    collector.collect_cdec_historical = fake_history
+    
+    first = run_backfill(['BER', 'ORO'], datetime(1985, 1, 1), datetime(1986, 12, 31),
+                         window_days=365, workers=2, collector=collector)
+    assert first['planned'] == 4 and first['failed'] == 1
+    
+    fetched.clear()
+    outage.clear()
+    second = run_backfill(['BER', 'ORO'], datetime(1985, 1, 1), datetime(1986, 12, 31),
+                          window_days=365, workers=2, collector=collector)
+    assert second['skipped'] == 3
+    assert fetched == [('ORO', datetime(1986, 1, 1))]
+    assert db.query(BackfillCheckpoint).count() == 4
+    assert db.query(ReservoirData).count() == 2 * 730
@@ -0,0 +1,57 @@
+"""
+Tests for the API response cache
+"""
+from datetime import datetime, timedelta
+
+from cache import ResponseCache
+
+
+def test_lru_eviction_and_counters():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'a' is now most recently used
+    cache.set('c', 3)
+    
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 1)
+
+
+def test_ttl_expiry():
+    cache = ResponseCache(max_entries=10, ttl_seconds=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_version_change_invalidates():
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    cache.set('a', 1, version=3)
+    assert cache.get('a', version=3) == 1
+    assert cache.get('a', version=4) is None
+
+
+def test_api_cache_invalidated_by_collector_writes(client):
+    from collector import ReservoirCollector
+    
+    collector = ReservoirCollector()
+    now = datetime.utcnow().replace(microsecond=0)
+    collector.save_batch([('BER', now - timedelta(hours=1), 438.0, 1486000.0)])
+    
+    first = client.get('/api/reservoir/BER/latest')
+    second = client.get('/api/reservoir/BER/latest')
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json()['storage'] == 1486000.0
+    
+    collector.save_batch([('BER', now, 438.5, 1490000.0)])
+    third = client.get('/api/reservoir/BER/latest')
+    assert third.headers['X-Cache'] == 'MISS'
+    assert third.get_json()['storage'] == 1490000.0
+    
+    # Query arguments are part of the key
+    assert client.get('/api/reservoir/BER/data?days=1').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/reservoir/BER/data?days=2').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/reservoir/BER/data?days=1').headers['X-Cache'] == 'HIT'
+    assert client.get('/api/cache/stats').get_json()['hits'] == 2
@@ -0,0 +1,137 @@
+"""
+Tests for concurrent collection and the USBR page in ReservoirCollector.collect_all
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import config
+from collector import ReservoirCollector
+from sources import get_source
+
+USBR_FIXTURE = Path(__file__).parent / 'fixtures' / 'usbr' / 'current.html'
+
+
+def _fake_reservoirs(count):
+    return {
+        f'S{i:03d}': {'name': f'Station {i}', 'cdec_query_url': f'https://cdec.example/QueryF?s=S{i:03d}'}
+        for i in range(count)
+    }
+
+
+@pytest.fixture
+def offline_collector(monkeypatch):
+    """
+    Factory for a ReservoirCollector that stores nothing and finds nothing on the USBR page
+    collect_all then returns each collected code mapped to itself (None if nothing was collected)
+    """
+    def make(**kwargs):
+        collector = ReservoirCollector(**kwargs)
+        monkeypatch.setattr(collector, 'save_batch', lambda readings, data_source='CDEC': len(readings))
+        monkeypatch.setattr(collector, 'load_saved', lambda keys: {key: key[0] for key in keys})
+        monkeypatch.setattr(collector, 'collect_usbr_data', lambda: {})
+        return collector
+    
+    return make
+
+
+def test_concurrent_collection_respects_per_host_limit(offline_collector, monkeypatch):
+    monkeypatch.setattr(config, 'RESERVOIRS', _fake_reservoirs(12))
+    collector = offline_collector(max_workers=8, per_host_limit=3, deadline_seconds=10)
+    
+    lock = threading.Lock()
+    in_flight = {'now': 0, 'peak': 0}
+    
+    def fake_get(url, timeout=None):
+        with lock:
+            in_flight['now'] += 1
+            in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+        time.sleep(0.05)
+        with lock:
+            in_flight['now'] -= 1
+        return None
+    
+    monkeypatch.setattr(collector.session, 'get', fake_get)
+    monkeypatch.setattr(collector, 'collect_cdec_query',
+                        lambda code: collector._get(config.RESERVOIRS[code]['cdec_query_url']) or (datetime(2024, 1, 1), 400.0, 1000.0))
+    
+    results = collector.collect_all(concurrent=True)
+    
+    assert results == {code: code for code in config.RESERVOIRS}
+    assert in_flight['peak'] == 3
+
+
+def test_concurrent_collection_stops_at_deadline(offline_collector, monkeypatch):
+    monkeypatch.setattr(config, 'RESERVOIRS', _fake_reservoirs(4))
+    collector = offline_collector(max_workers=4, per_host_limit=4, deadline_seconds=0.2)
+    
+    def fake_query(code):
+        if code == 'S003':
+            time.sleep(1)
+        return (datetime(2024, 1, 1), 400.0, 1000.0)
+    
+    monkeypatch.setattr(collector, 'collect_cdec_query', fake_query)
+    
+    started = time.monotonic()
+    results = collector.collect_all(concurrent=True)
+    
+    assert time.monotonic() - started < 0.9
+    assert results == {'S000': 'S000', 'S001': 'S001', 'S002': 'S002', 'S003': None}
+
+
+def test_fallback_fetches_share_the_run_deadline(offline_collector, monkeypatch):
+    monkeypatch.setattr(config, 'RESERVOIRS', _fake_reservoirs(2))
+    monkeypatch.setattr(config, 'COLLECTION_SOURCES', ['cdec_csv'])
+    collector = offline_collector(max_workers=4, per_host_limit=4, deadline_seconds=0.3)
+    
+    def empty_bulk_response(collector, url, codes):
+        time.sleep(0.2)
+        return {}
+    
+    def slow_query(code):
+        time.sleep(0.5)
+        return (datetime(2024, 1, 1), 400.0, 1000.0)
+    
+    monkeypatch.setattr(get_source('cdec_csv'), 'fetch', empty_bulk_response)
+    monkeypatch.setattr(collector, 'collect_cdec_query', slow_query)
+    
+    started = time.monotonic()
+    results = collector.collect_all(concurrent=True)
+    
+    # The QueryF fallback starts with ~0.1s of the 0.3s deadline left, not a fresh 0.3s
+    assert time.monotonic() - started < 0.45
+    assert results == {'S000': None, 'S001': None}
+
+
+def test_usbr_page_feeds_every_configured_reservoir(db, monkeypatch):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = USBR_FIXTURE.read_bytes()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    monkeypatch.setattr(config, 'USBR_URL', f'http://127.0.0.1:{upstream.server_port}/mp/cvo/current.html')
+    collector = ReservoirCollector()
+    monkeypatch.setattr(collector, 'collect_cdec_query', lambda code: None)
+    try:
+        collector.collect_all(concurrent=False)
+    finally:
+        upstream.shutdown()
+        upstream.server_close()
+    
+    day = datetime(2025, 11, 15)
+    saved = collector.load_saved([('BER', day), ('ORO', day)])
+    assert saved[('BER', day)].storage == 1459511.0
+    assert saved[('ORO', day)].reservoir_elevation == 774.62
+    assert {reading.data_source for reading in saved.values()} == {'USBR'}
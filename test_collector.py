@@ -1,72 +1,52 @@
-#!/usr/bin/env python3
 """
-Test script for data collection
+Tests for data collection, run offline against recorded responses (see replay.py)
 """
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+import config
 from collector import ReservoirCollector
-from database import init_db
-import sys
+from replay import Cassette, ReplayServer, record_session, redirect_config
 
-def test_collection():
-    """Test data collection for all reservoirs"""
-    print("Initializing database...")
-    init_db()
-    
-    print("\nTesting data collection...")
+CASSETTE = Path(__file__).parent / 'fixtures' / 'replay'
+
+
+@pytest.fixture
+def replay_server():
+    with ReplayServer(Cassette.load(CASSETTE)) as server, redirect_config(server):
+        yield server
+
+
+def test_collection(db, replay_server):
     collector = ReservoirCollector()
+    assert collector.collect_cdec_query('BER') == (datetime(2025, 11, 15, 20), 435.12, 1460076.0)
+    assert collector.collect_cdec_query('ORO') == (datetime(2025, 11, 15, 20), 778.4, 2144242.0)
     
-    reservoirs = ['BER', 'ORO']
-    results = {}
-    
-    for code in reservoirs:
-        print(f"\n{'='*60}")
-        print(f"Testing {code}...")
-        print('='*60)
-        
-        try:
-            data = collector.collect_cdec_query(code)
-            if data:
-                timestamp, res_ele, storage = data
-                print(f"✓ Successfully collected data for {code}")
-                print(f"  Timestamp: {timestamp}")
-                print(f"  Elevation: {res_ele} feet")
-                print(f"  Storage: {storage:,} acre-feet")
-                
-                # Try to save
-                saved = collector.save_data(code, timestamp, res_ele, storage)
-                if saved:
-                    print(f"  ✓ Data saved to database (ID: {saved.id})")
-                else:
-                    print(f"  ✗ Failed to save data")
-                
-                results[code] = data
-            else:
-                print(f"✗ Failed to collect data for {code}")
-                results[code] = None
-        except Exception as e:
-            print(f"✗ Error collecting data for {code}: {e}")
-            results[code] = None
-    
-    print(f"\n{'='*60}")
-    print("Summary:")
-    print('='*60)
-    for code, result in results.items():
-        status = "✓ SUCCESS" if result else "✗ FAILED"
-        print(f"{code}: {status}")
+    results = collector.collect_all(concurrent=True)
+    assert (results['BER'].storage, results['BER'].data_source) == (1460076.0, 'CDEC')
+    assert results['ORO'].reservoir_elevation == 778.4
+    # The two direct fetches, then collect_all's two QueryF pages and the one USBR page
+    assert replay_server.requests == 2 + 3
+
+
+def test_recorded_responses_replay_identically(replay_server, tmp_path):
+    cassette = Cassette()
+    collector = ReservoirCollector()
+    record_session(collector.session, cassette)
+    collector.collect_usbr_data()
+    cassette.save(tmp_path)
     
-    return results
+    (key,) = Cassette.load(tmp_path).responses
+    assert key == '/mp/cvo/current.html'
+    assert Cassette.load(tmp_path).responses[key] == replay_server.cassette.responses[key]
 
-if __name__ == '__main__':
-    try:
-        results = test_collection()
-        # Exit with error code if any collection failed
-        if any(r is None for r in results.values()):
-            sys.exit(1)
-    except KeyboardInterrupt:
-        print("\n\nInterrupted by user")
-        sys.exit(1)
-    except Exception as e:
-        print(f"\n\nUnexpected error: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
 
+def test_injected_failures_are_survived(replay_server, monkeypatch):
+    monkeypatch.setattr(config, 'HTTP_RETRIES', 0)
+    replay_server.failure_rate = 1.0
+    replay_server.latency = (0.01, 0.01)
+    
+    assert ReservoirCollector().collect_cdec_query('BER') is None
+    assert replay_server.failures == replay_server.requests == 1
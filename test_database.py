@@ -0,0 +1,88 @@
+"""
+Tests for the bulk write path in database.py
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from database import (
+    ReservoirData, create_database_engine, engine, init_db, load_reservoir_data, upsert_reservoir_data,
+)
+import config
+
+
+def _rows(code, start, count):
+    return [{
+        'reservoir_code': code,
+        'timestamp': start + timedelta(days=i),
+        'reservoir_elevation': 400.0 + i,
+        'storage': 1000.0 + i,
+        'storage_percent': None,
+        'data_source': 'CDEC',
+    } for i in range(count)]
+
+
+def test_upsert_skips_existing_readings(db):
+    start = datetime(2020, 1, 1)
+    assert upsert_reservoir_data(db, _rows('BER', start, 10)) == 10
+    db.commit()
+    
+    # Overlapping batch: 5 already stored, 5 new
+    assert upsert_reservoir_data(db, _rows('BER', start + timedelta(days=5), 10)) == 5
+    db.commit()
+    
+    assert db.query(ReservoirData).count() == 15
+    assert db.query(ReservoirData).first().created_at is not None
+
+
+def test_upsert_handles_batches_larger_than_a_chunk(db):
+    rows = _rows('ORO', datetime(1985, 1, 1), 40 * 365)
+    assert upsert_reservoir_data(db, rows) == len(rows)
+    db.commit()
+    assert db.query(ReservoirData).filter(ReservoirData.reservoir_code == 'ORO').count() == len(rows)
+
+
+def test_load_reservoir_data_by_keys(db):
+    start = datetime(2020, 1, 1)
+    upsert_reservoir_data(db, _rows('BER', start, 3) + _rows('ORO', start, 3))
+    db.commit()
+    
+    loaded = load_reservoir_data(db, [('BER', start), ('ORO', start + timedelta(days=2)), ('ORO', datetime(1999, 1, 1))])
+    assert set(loaded) == {('BER', start), ('ORO', start + timedelta(days=2))}
+
+
+def test_init_db_migrates_duplicate_readings(db):
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_reservoir_timestamp"))
+        conn.execute(text("CREATE INDEX idx_reservoir_timestamp ON reservoir_data (reservoir_code, timestamp)"))
+        for _ in range(2):
+            conn.execute(text(
+                "INSERT INTO reservoir_data (reservoir_code, timestamp, storage) "
+                "VALUES ('BER', '2020-01-01 00:00:00.000000', 1.0)"
+            ))
+    
+    init_db()
+    
+    assert db.query(ReservoirData).count() == 1
+    assert upsert_reservoir_data(db, _rows('BER', datetime(2020, 1, 1), 1)) == 0
+
+
+def test_engine_profile_applies_sqlite_pragmas(tmp_path):
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    tuned = create_database_engine(url, role='collector')
+    try:
+        with tuned.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == config.SQLITE_PRAGMAS['busy_timeout']
+        assert tuned.pool.size() == config.DATABASE_POOL_PROFILES['collector']['pool_size']
+    finally:
+        tuned.dispose()
+    
+    plain = create_database_engine(url, role='web', pragmas={})
+    try:
+        with plain.connect() as conn:
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() != config.SQLITE_PRAGMAS['busy_timeout']
+        assert plain.pool.size() == config.DATABASE_POOL_PROFILES['web']['pool_size']
+    finally:
+        plain.dispose()
@@ -0,0 +1,55 @@
+"""
+Tests for server-side downsampling
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from downsample import downsample_series, lttb_indices, minmax_indices
+
+
+def _series(values, start=datetime(2024, 1, 1)):
+    return [(start + timedelta(hours=i), 400.0 + v / 1000, v, None) for i, v in enumerate(values)]
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50)
+    y[537] = 10.0  # spike
+    indices = lttb_indices(x, y, 100)
+    
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert 537 in indices
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_minmax_keeps_extremes_within_budget():
+    y = np.random.default_rng(1).normal(size=5000)
+    indices = minmax_indices(np.arange(5000, dtype=np.float64), y, 200)
+    assert len(indices) <= 200
+    assert y.argmax() in indices and y.argmin() in indices
+
+
+def test_downsample_series_skips_missing_values():
+    series = _series(range(1000))
+    series[10] = (series[10][0], 400.0, None, None)
+    reduced = downsample_series(series, 50)
+    
+    assert len(reduced) == 50
+    assert reduced[0] == series[0] and reduced[-1] == series[-1]
+    assert all(point[2] is not None for point in reduced)
+    assert downsample_series(series, 5000) is series
+
+
+def test_data_endpoint_honours_max_points(client):
+    from collector import ReservoirCollector
+    
+    now = datetime.utcnow().replace(microsecond=0)
+    ReservoirCollector().save_batch(
+        [('ORO', now - timedelta(minutes=15 * i), 780.0, 2400000.0 + i) for i in range(600)]
+    )
+    response = client.get('/api/reservoir/ORO/data?days=5&resolution=raw&max_points=120')
+    data = response.get_json()['data']
+    assert len(data) == 120
+    assert data == sorted(data, key=lambda point: point['timestamp'])
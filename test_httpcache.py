@@ -0,0 +1,82 @@
+"""
+Tests for conditional-GET caching of collector fetches
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+
+import pytest
+import requests
+
+import config
+from collector import ReservoirCollector
+from httpcache import ConditionalGetAdapter
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'cdec' / 'QueryF_BER.html'
+
+
+@pytest.fixture
+def page_server():
+    """Local server for one page; state controls the body and which validators are sent"""
+    state = {'body': FIXTURE.read_bytes(), 'etag': '"v1"', 'requests': [], 'not_modified': 0}
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['requests'].append(dict(self.headers))
+            if state['etag'] and self.headers.get('If-None-Match') == state['etag']:
+                state['not_modified'] += 1
+                self.send_response(304)
+                self.send_header('ETag', state['etag'])
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(state['body'])))
+            if state['etag']:
+                self.send_header('ETag', state['etag'])
+            self.end_headers()
+            self.wfile.write(state['body'])
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state['url'] = f'http://127.0.0.1:{server.server_port}/dynamicapp/QueryF?s=BER'
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def test_adapter_revalidates_and_serves_cached_body(page_server):
+    session = requests.Session()
+    adapter = ConditionalGetAdapter()
+    session.mount('http://', adapter)
+    
+    first = session.get(page_server['url'])
+    second = session.get(page_server['url'])
+    assert (first.status_code, first.from_cache) == (200, False)
+    assert (second.status_code, second.from_cache) == (200, True)
+    assert second.content == first.content and second.content_sha256 == first.content_sha256
+    assert second.headers['Content-Type'] == 'text/html'
+    assert page_server['requests'][1]['If-None-Match'] == '"v1"'
+    assert adapter.cache.stats()['not_modified'] == 1
+
+
+@pytest.mark.parametrize('etag', ['"v1"', None])
+def test_collector_skips_parsing_unchanged_pages(page_server, monkeypatch, etag):
+    page_server['etag'] = etag
+    monkeypatch.setitem(config.RESERVOIRS, 'BER', dict(config.RESERVOIRS['BER'], cdec_query_url=page_server['url']))
+    collector = ReservoirCollector()
+    
+    first = collector.collect_cdec_query('BER')
+    assert collector.collect_cdec_query('BER') == first
+    assert collector.parses_skipped == 1
+    assert page_server['not_modified'] == (1 if etag else 0)
+    
+    # A new publication is downloaded and parsed again
+    page_server['body'] = page_server['body'].replace(b'435.12', b'436.00')
+    page_server['etag'] = etag and '"v2"'
+    assert collector.collect_cdec_query('BER')[1] == 436.00
+    assert collector.parses_skipped == 1
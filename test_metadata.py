@@ -0,0 +1,85 @@
+"""
+Tests for reservoir metadata (capacity) and storage_percent
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+import config
+import metadata
+from collector import ReservoirCollector
+from database import ReservoirMetadata
+from parsers import parse_station_metadata
+from rollups import query_series
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'cdec' / 'staMeta_ORO.html'
+
+
+class StubSession:
+    """Answers every GET with the ORO staMeta page (or a status code) and counts requests"""
+    
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.urls = []
+    
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        response = type('Response', (), {})()
+        response.status_code = self.status_code
+        response.content = FIXTURE.read_bytes() if self.status_code == 200 else b''
+        return response
+
+
+@pytest.fixture(autouse=True)
+def fresh_capacities(monkeypatch):
+    monkeypatch.setattr(metadata, '_capacities', None)
+
+
+def test_parse_station_metadata():
+    assert parse_station_metadata(FIXTURE.read_bytes()) == {'capacity_acre_feet': 3537577.0, 'max_elevation': 900.0}
+    assert parse_station_metadata(b'<html><body><p>Not found</p></body></html>') == {
+        'capacity_acre_feet': None, 'max_elevation': None,
+    }
+
+
+def test_refresh_policy(db):
+    now = datetime(2025, 3, 1)
+    session = StubSession()
+    assert metadata.refresh_metadata(session, now=now) == ['BER', 'ORO']
+    row = db.query(ReservoirMetadata).filter_by(reservoir_code='ORO').one()
+    assert (row.capacity_acre_feet, row.max_elevation, row.last_updated) == (3537577.0, 900.0, now)
+    
+    # Fresh rows are not refetched; stale ones are, and a failed fetch keeps the stored row
+    assert metadata.refresh_metadata(session, now=now + timedelta(days=1)) == []
+    assert metadata.refresh_metadata(StubSession(503), now=now + timedelta(days=45)) == []
+    assert metadata.refresh_metadata(session, now=now + timedelta(days=45)) == ['BER', 'ORO']
+    assert len(session.urls) == 4
+
+
+def test_storage_percent_on_write_path_and_rollups(db):
+    db.add(ReservoirMetadata(reservoir_code='BER', capacity_acre_feet=2000000.0))
+    db.commit()
+    metadata.load_capacities()
+    
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    ReservoirCollector().save_batch([('BER', now - timedelta(minutes=30), 440.0, 1000000.0),
+                                     ('BER', now - timedelta(minutes=15), 440.0, 1100000.0),
+                                     ('ORO', now - timedelta(minutes=15), 780.0, 1768788.5)])
+    
+    raw = query_series(db, 'BER', now - timedelta(hours=2), 'raw')
+    assert [point[3] for point in raw] == [50.0, 55.0]
+    assert query_series(db, 'ORO', now - timedelta(hours=2), 'raw')[0][3] == 50.0  # configured fallback capacity
+    assert query_series(db, 'BER', now - timedelta(hours=2), 'hour')[0][3] == 52.5
+    assert metadata.storage_percent('XXX', 100.0) is None
+
+
+def test_capacities_reload_after_another_process_refreshes(db, monkeypatch):
+    assert metadata.storage_percent('BER', 1000000.0) == 62.42  # configured fallback
+    
+    # The scheduler stores new capacities; this process sees them once its copy is old enough
+    db.add(ReservoirMetadata(reservoir_code='BER', capacity_acre_feet=2000000.0))
+    db.commit()
+    assert metadata.storage_percent('BER', 1000000.0) == 62.42
+    monkeypatch.setattr(metadata, '_loaded_at', metadata._loaded_at - config.METADATA_RELOAD_SECONDS)
+    assert metadata.storage_percent('BER', 1000000.0) == 50.0
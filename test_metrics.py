@@ -0,0 +1,96 @@
+"""
+Tests for the Prometheus metrics registry and the /metrics endpoints
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+
+import requests
+
+import config
+from collector import ReservoirCollector
+from metrics import Registry, collector_fetches, collector_stage_duration, start_metrics_server
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'cdec' / 'QueryF_BER.html'
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    counter = registry.counter('jobs_total', 'Jobs run', ('queue',))
+    histogram = registry.histogram('job_seconds', 'Job time', buckets=(0.1, 1))
+    counter.inc(queue='a "quoted"\nname')
+    counter.inc(2, queue='b')
+    for value in (0.05, 0.5, 3):
+        histogram.observe(value)
+    
+    assert registry.render().splitlines() == [
+        '# HELP job_seconds Job time',
+        '# TYPE job_seconds histogram',
+        'job_seconds_bucket{le="0.1"} 1',
+        'job_seconds_bucket{le="1"} 2',
+        'job_seconds_bucket{le="+Inf"} 3',
+        'job_seconds_sum 3.55',
+        'job_seconds_count 3',
+        '# HELP jobs_total Jobs run',
+        '# TYPE jobs_total counter',
+        'jobs_total{queue="a \\"quoted\\"\\nname"} 1',
+        'jobs_total{queue="b"} 2',
+    ]
+
+
+def test_app_metrics_cover_routes_and_queries(client):
+    assert client.get('/api/reservoir/BER/latest').status_code == 404
+    client.get('/api/reservoir/BER/latest')
+    
+    body = client.get('/metrics').get_data(as_text=True)
+    assert ('rdog_http_request_duration_seconds_count'
+            '{method="GET",route="/api/reservoir/<reservoir_code>/latest",status="404"} 2') in body
+    assert 'rdog_api_cache_lookups_total{result="hit"}' in body
+    assert 'rdog_db_query_duration_seconds_count{operation="SELECT"}' in body
+
+
+def test_collector_process_metrics(monkeypatch):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = FIXTURE.read_bytes()
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    monkeypatch.setitem(config.RESERVOIRS, 'BER', dict(
+        config.RESERVOIRS['BER'], cdec_query_url=f'http://127.0.0.1:{upstream.server_port}/QueryF?s=BER'))
+    collector_fetches.clear()
+    collector_stage_duration.clear()
+    
+    collector = ReservoirCollector()
+    collector.export_metrics()
+    collector.collect_cdec_query('BER')
+    collector.collect_cdec_query('BER')
+    
+    server = start_metrics_server('127.0.0.1', 0)
+    try:
+        body = requests.get(f'http://127.0.0.1:{server.server_port}/metrics').text
+    finally:
+        server.shutdown()
+        server.server_close()
+        upstream.shutdown()
+        upstream.server_close()
+    
+    assert 'rdog_collector_fetches_total{target="BER",result="ok"} 1' in body
+    assert 'rdog_collector_fetches_total{target="BER",result="not_modified"} 1' in body
+    assert 'rdog_collector_stage_duration_seconds_count{stage="fetch",target="BER"} 2' in body
+    assert 'rdog_collector_stage_duration_seconds_count{stage="parse",target="BER"} 1' in body
+    assert 'rdog_http_cache_responses_total{result="not_modified"} 1' in body
+    assert 'rdog_collector_parses_skipped_total 1' in body
+    assert 'rdog_circuit_breaker_state{host="127.0.0.1:' in body
@@ -0,0 +1,96 @@
+"""
+Tests for the CDEC/USBR parsers
+"""
+import csv
+from datetime import datetime
+import io
+from pathlib import Path
+
+import config
+from parsers import iter_cdec_csv, iter_cdec_json, merge_cdec_sensors, parse_cdec_query_table, parse_usbr_reservoirs
+
+FIXTURE_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+CDEC_CSV = """STATION_ID,DURATION,SENSOR_NUMBER,SENSOR_TYPE,DATE TIME,OBS DATE,VALUE,DATA_FLAG,UNITS
+BER,D,6,RES ELE,19850101 0000,19850101 0000,415.12, ,FEET
+BER,D,6,RES ELE,19850102 0000,19850102 0000,---, ,FEET
+BER,D,15,STORAGE,19850101 0000,19850101 0000,"1,402,300", ,AF
+BER,D,15,STORAGE,19850102 0000,19850102 0000,1402100, ,AF
+BER,D,15,STORAGE,19850103 0000,19850103 0000,---, ,AF
+ORO,D,15,STORAGE,19850101 0000,19850101 0000,2900000, ,AF
+"""
+
+
+def test_iter_cdec_csv_streams_records():
+    records = list(iter_cdec_csv(CDEC_CSV.splitlines()))
+    assert records[0] == ('BER', 6, datetime(1985, 1, 1), 415.12)
+    assert records[1] == ('BER', 6, datetime(1985, 1, 2), None)
+    assert records[2] == ('BER', 15, datetime(1985, 1, 1), 1402300.0)
+    assert len(records) == 6
+    
+    # Either timestamp column alone is enough
+    rows = list(csv.reader(CDEC_CSV.splitlines()))
+    for dropped in ('DATE TIME', 'OBS DATE'):
+        index = rows[0].index(dropped)
+        out = io.StringIO()
+        csv.writer(out).writerows(row[:index] + row[index + 1:] for row in rows)
+        assert list(iter_cdec_csv(out.getvalue().splitlines())) == records
+
+
+def test_merge_cdec_sensors_pairs_elevation_and_storage():
+    merged = merge_cdec_sensors(iter_cdec_csv(CDEC_CSV.splitlines()), config.CDEC_SENSORS)
+    assert merged['BER'] == [
+        (datetime(1985, 1, 1), 415.12, 1402300.0),
+        (datetime(1985, 1, 2), None, 1402100.0),
+    ]
+    assert merged['ORO'] == [(datetime(1985, 1, 1), None, 2900000.0)]
+
+
+def test_parse_cdec_query_table_returns_last_valid_row():
+    content = (FIXTURE_DIR / 'cdec' / 'QueryF_BER.html').read_bytes()
+    assert parse_cdec_query_table(content) == (datetime(2025, 11, 15, 20, 0), 435.12, 1460076.0)
+
+
+def test_parse_cdec_query_table_only_reads_the_last_table():
+    page = """<HTML><BODY>
+    <TABLE><TR><TD>01/01/2020 00:00</TD><TD>1.0</TD><TD>2.0</TD></TR></TABLE>
+    <TABLE>
+    <TR><TH>DATE</TH><TH>RES ELE</TH><TH>STORAGE</TH></TR>
+    <TR><TD>11/15/2025 19:00</TD><TD><FONT>438.10</FONT></TD><TD><FONT>1,486,000</FONT></TD></TR>
+    <TR><TD>11/15/2025 20:00</TD><TD><FONT>--</FONT></TD><TD><FONT>--</FONT></TD></TR>
+    </TABLE></BODY></HTML>"""
+    assert parse_cdec_query_table(page) == (datetime(2025, 11, 15, 19, 0), 438.10, 1486000.0)
+
+
+def test_parse_cdec_query_table_without_data():
+    assert parse_cdec_query_table(b'<html><body><p>Station not found</p></body></html>') is None
+    assert parse_cdec_query_table(b'<table><tr><td>11/15/2025 20:00</td><td>--</td><td>--</td></tr></table>') is None
+
+
+def test_parse_usbr_reservoirs_maps_rows_to_codes():
+    content = (FIXTURE_DIR / 'usbr' / 'current.html').read_bytes()
+    names = {'Berryessa': 'BER', 'Oroville': 'ORO', 'Shasta': 'SHA', 'Folsom': 'FOL'}
+    assert parse_usbr_reservoirs(content, names) == {
+        'SHA': (datetime(2025, 11, 15), 1010.35, 2681200.0),
+        'ORO': (datetime(2025, 11, 15), 774.62, 2011634.0),
+        # No date column in this table: the page's date is used
+        'BER': (datetime(2025, 11, 15), 435.06, 1459511.0),
+    }
+    assert parse_usbr_reservoirs(b'<html><body><p>Maintenance</p></body></html>', names) == {}
+    
+    # Text around a row's date is ignored
+    table = (b'<html><body><p>Updated 11/15/2025</p><table>'
+             b'<tr><th>Reservoir</th><th>Date</th><th>Storage</th></tr>'
+             b'<tr><td>Shasta</td><td>Date: 10/15/2026</td><td>2,681,200</td></tr></table></body></html>')
+    assert parse_usbr_reservoirs(table, names) == {'SHA': (datetime(2026, 10, 15), None, 2681200.0)}
+
+
+def test_cdec_json_and_csv_services_agree():
+    csv_lines = (FIXTURE_DIR / 'cdec' / 'CSVDataServlet_BER_ORO.csv').read_text().splitlines()
+    from_csv = merge_cdec_sensors(iter_cdec_csv(csv_lines), config.CDEC_SENSORS)
+    json_content = (FIXTURE_DIR / 'cdec' / 'JSONDataServlet_BER_ORO.json').read_bytes()
+    from_json = merge_cdec_sensors(iter_cdec_json(json_content), config.CDEC_SENSORS)
+    
+    assert from_json == from_csv
+    assert from_csv['BER'][-2:] == [(datetime(2025, 11, 15, 19), None, 1460011.0), (datetime(2025, 11, 15, 20), 435.12, 1460076.0)]
+    assert list(iter_cdec_json(b'<html>Service unavailable</html>')) == []
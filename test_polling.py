@@ -0,0 +1,96 @@
+"""
+Tests for the adaptive polling scheduler, simulated against stations with known cadence and lag
+"""
+from datetime import datetime, timedelta
+import random
+
+from polling import AdaptivePoller, learn_cadence
+from storage import Reading, get_store
+
+START = datetime(2025, 3, 1)
+
+# code -> (observation cadence, publication lag)
+STATIONS = {
+    'BER': (timedelta(hours=1), timedelta(minutes=20)),
+    'ORO': (timedelta(days=1), timedelta(hours=8, minutes=30)),
+}
+
+
+class SimulatedSource:
+    """Stands in for ReservoirCollector: each station publishes on its own schedule"""
+    
+    def __init__(self):
+        self.now = START
+        self.fetches = 0
+    
+    @staticmethod
+    def newest(code, now):
+        cadence, lag = STATIONS[code]
+        return START + cadence * ((now - lag - START) // cadence)
+    
+    def collect_all(self, codes=None):
+        self.fetches += len(codes)
+        return {code: Reading(code, self.newest(code, self.now), 400.0, 1000.0, None, 'CDEC') for code in codes}
+
+
+def _seed_history(db):
+    rows = []
+    for code, (cadence, _) in STATIONS.items():
+        timestamp = START - timedelta(days=20)
+        while timestamp < START - timedelta(days=1):
+            rows.append({'reservoir_code': code, 'timestamp': timestamp, 'reservoir_elevation': 400.0,
+                         'storage': 1000.0, 'storage_percent': None, 'data_source': 'CDEC'})
+            timestamp += cadence
+    get_store().write(db, rows)
+    db.commit()
+
+
+def _simulate(poll, days):
+    """Step a clock minute by minute; returns (fetches, publication-to-first-seen delays on the last day)"""
+    source = SimulatedSource()
+    seen = {code: source.newest(code, START) for code in STATIONS}
+    delays = []
+    for minute in range(int(timedelta(days=days) / timedelta(minutes=1))):
+        source.now = START + timedelta(minutes=minute)
+        for code in poll(source):
+            newest = source.newest(code, source.now)
+            if newest > seen[code]:
+                seen[code] = newest
+                if source.now >= START + timedelta(days=days - 1):
+                    delays.append(source.now - (newest + STATIONS[code][1]))
+    return source.fetches, delays
+
+
+def test_learn_cadence_uses_median_spacing():
+    timestamps = [START + timedelta(hours=h) for h in (0, 1, 2, 3, 5, 6)]
+    assert learn_cadence(timestamps, timedelta(minutes=15)) == timedelta(hours=1)
+    assert learn_cadence(timestamps[:1], timedelta(minutes=15)) == timedelta(minutes=15)
+
+
+def test_adaptive_polling_fetches_less_and_sees_data_sooner(db):
+    _seed_history(db)
+    
+    def fixed(source):
+        if (source.now - START) % timedelta(minutes=15):
+            return []
+        source.collect_all(codes=list(STATIONS))
+        return list(STATIONS)
+    
+    poller = None
+    
+    def adaptive(source):
+        nonlocal poller
+        if poller is None:
+            poller = AdaptivePoller(source, codes=list(STATIONS), rng=random.Random(7))
+        return poller.dispatch(source.now)
+    
+    fixed_fetches, fixed_delays = _simulate(fixed, days=3)
+    adaptive_fetches, adaptive_delays = _simulate(adaptive, days=3)
+    
+    assert poller.stations['BER'].cadence == timedelta(hours=1)
+    assert poller.stations['ORO'].cadence == timedelta(days=1)
+    assert adaptive_fetches < fixed_fetches / 5
+    assert len(adaptive_delays) == len(fixed_delays) == 25  # 24 hourly + 1 daily reading on day 3
+    assert max(adaptive_delays) <= timedelta(minutes=15)  # the daily station's lag is still narrowing
+    assert sum(adaptive_delays, timedelta()) < sum(fixed_delays, timedelta()) / 2
+    assert poller.stations['BER'].lag_high - poller.stations['BER'].lag_low <= timedelta(minutes=5)
@@ -0,0 +1,100 @@
+"""
+Tests for retries and per-host circuit breaking of collector fetches
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+import time
+
+import pytest
+import requests
+
+import config
+from collector import ReservoirCollector
+from resilience import CircuitBreakers, CircuitOpenError, ResilientAdapter, retry_policy
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'cdec' / 'QueryF_BER.html'
+
+
+@pytest.fixture
+def flaky_server(monkeypatch):
+    """Local server that answers the queued statuses first, then 200 with the BER page"""
+    monkeypatch.setattr(config, 'HTTP_BACKOFF_FACTOR', 0)
+    state = {'statuses': [], 'requests': 0}
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['requests'] += 1
+            status = state['statuses'].pop(0) if state['statuses'] else 200
+            body = FIXTURE.read_bytes() if status == 200 else b'unavailable'
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state['url'] = f'http://127.0.0.1:{server.server_port}/dynamicapp/QueryF'
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_transient_errors_with_backoff(flaky_server):
+    flaky_server['statuses'] = [503, 502]
+    session = requests.Session()
+    adapter = ResilientAdapter(max_retries=retry_policy(retries=2))
+    session.mount('http://', adapter)
+    
+    response = session.get(flaky_server['url'])
+    assert response.status_code == 200 and flaky_server['requests'] == 3
+    assert adapter.breakers.get(flaky_server['url']).snapshot()['state'] == 'closed'
+
+
+def test_breaker_fails_fast_then_recovers_after_trial(flaky_server):
+    now = [0.0]
+    breakers = CircuitBreakers(failure_threshold=2, reset_seconds=30, clock=lambda: now[0])
+    session = requests.Session()
+    session.mount('http://', ResilientAdapter(breakers, max_retries=retry_policy(retries=0)))
+    flaky_server['statuses'] = [503] * 3
+    
+    assert [session.get(flaky_server['url']).status_code for _ in range(2)] == [503, 503]
+    with pytest.raises(CircuitOpenError):
+        session.get(flaky_server['url'])
+    assert flaky_server['requests'] == 2
+    host = next(iter(breakers.stats()))
+    assert breakers.stats()[host] == {'state': 'open', 'failures': 2, 'trips': 1, 'rejected': 1, 'retry_in_seconds': 30}
+    
+    # The trial request after the reset timeout fails, so the breaker opens again...
+    now[0] = 31
+    assert session.get(flaky_server['url']).status_code == 503
+    assert breakers.stats()[host]['state'] == 'open'
+    # ...and the next trial succeeds and closes it
+    now[0] = 62
+    assert session.get(flaky_server['url']).status_code == 200
+    assert breakers.stats()[host]['state'] == 'closed'
+
+
+def test_collection_fails_fast_while_host_is_down(flaky_server, monkeypatch):
+    monkeypatch.setattr(config, 'HTTP_RETRIES', 1)
+    monkeypatch.setattr(config, 'HTTP_BREAKER_FAILURE_THRESHOLD', 3)
+    monkeypatch.setattr(config, 'RESERVOIRS', {
+        f'S{i:02d}': {'name': f'Station {i}', 'cdec_query_url': f"{flaky_server['url']}?s=S{i:02d}"}
+        for i in range(20)
+    })
+    flaky_server['statuses'] = [503] * 1000
+    collector = ReservoirCollector()
+    monkeypatch.setattr(collector, 'collect_usbr_data', lambda: {})
+    
+    started = time.monotonic()
+    results = collector.collect_all(concurrent=False)
+    assert results == {code: None for code in config.RESERVOIRS}
+    assert time.monotonic() - started < 5
+    assert flaky_server['requests'] == 3 * 2  # three failed fetches of two attempts each, then no more traffic
+    (breaker,) = collector.breakers.stats().values()
+    assert (breaker['state'], breaker['rejected']) == ('open', 17)
@@ -0,0 +1,105 @@
+"""
+Tests for incremental rollup maintenance and rollup-backed queries
+"""
+from datetime import datetime, timedelta
+
+from collector import ReservoirCollector
+from database import ReservoirRollupDaily, ReservoirRollupHourly, ReservoirRollupMonthly, init_db
+from rollups import choose_resolution, query_series, range_stats, rebuild_rollups
+from storage import get_store
+
+
+def _readings(start, count, step):
+    return [('BER', start + step * i, 400.0 + i, 1000.0 + 10 * i) for i in range(count)]
+
+
+def test_rollups_maintained_incrementally(db):
+    collector = ReservoirCollector()
+    start = datetime(2024, 1, 30, 22, 0)
+    readings = _readings(start, 16, timedelta(minutes=15))  # 22:00 Jan 30 .. 01:45 Jan 31
+    for reading in readings:  # one save per collection tick
+        collector.save_batch([reading])
+    
+    hourly = db.query(ReservoirRollupHourly).order_by(ReservoirRollupHourly.bucket_start).all()
+    assert [row.bucket_start.hour for row in hourly] == [22, 23, 0, 1]
+    assert (hourly[0].storage_min, hourly[0].storage_max, hourly[0].storage_count) == (1000.0, 1030.0, 4)
+    assert hourly[0].storage_last == 1030.0
+    
+    daily = db.query(ReservoirRollupDaily).order_by(ReservoirRollupDaily.bucket_start).all()
+    assert [(row.bucket_start.day, row.sample_count) for row in daily] == [(30, 8), (31, 8)]
+    assert daily[1].storage_sum / daily[1].storage_count == sum(1000.0 + 10 * i for i in range(8, 16)) / 8
+    
+    monthly = db.query(ReservoirRollupMonthly).one()
+    assert (monthly.sample_count, monthly.storage_min, monthly.storage_max) == (16, 1000.0, 1150.0)
+    assert monthly.elevation_last == 415.0
+    
+    # A late reading for an earlier hour updates every level
+    collector.save_batch([('BER', datetime(2024, 1, 30, 22, 5), 390.0, 900.0)])
+    db.expire_all()
+    monthly = db.query(ReservoirRollupMonthly).one()
+    assert (monthly.sample_count, monthly.storage_min, monthly.storage_last) == (17, 900.0, 1150.0)
+
+
+def test_overlapping_batch_updates_only_new_buckets(db, monkeypatch):
+    collector = ReservoirCollector()
+    readings = _readings(datetime(2024, 1, 30, 20, 0), 3, timedelta(hours=1))
+    collector.save_batch(readings[:2])
+    
+    updated = []
+    monkeypatch.setattr('collector.update_rollups', lambda db, keys: updated.append(list(keys)))
+    assert collector.save_batch(readings) == 1
+    assert collector.save_batch(readings) == 0
+    assert updated == [[('BER', datetime(2024, 1, 30, 22, 0))]]
+
+
+def test_rebuild_matches_incremental(db):
+    collector = ReservoirCollector()
+    collector.save_batch(_readings(datetime(2023, 12, 20), 40, timedelta(days=1)))
+    
+    def snapshot():
+        return [(row.bucket_start, row.sample_count, row.storage_sum, row.elevation_last)
+                for row in db.query(ReservoirRollupDaily).order_by(ReservoirRollupDaily.bucket_start)]
+    
+    incremental = snapshot()
+    db.query(ReservoirRollupDaily).delete()
+    db.commit()
+    rebuild_rollups(['BER'])
+    assert snapshot() == incremental
+
+
+def test_queries_pick_rollup_resolution(db):
+    assert choose_resolution(1) == 'raw'
+    assert choose_resolution(30) == 'hour'
+    assert choose_resolution(365) == 'day'
+    assert choose_resolution(20 * 365) == 'month'
+    
+    collector = ReservoirCollector()
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    collector.save_batch(_readings(now - timedelta(days=400), 400, timedelta(days=1)))
+    
+    monthly = query_series(db, 'BER', now - timedelta(days=400), 'month')
+    assert 13 <= len(monthly) <= 15
+    assert query_series(db, 'BER', now - timedelta(days=10), 'day')[-1][2] == 1000.0 + 10 * 399
+    
+    stats = range_stats(db, 'BER', now - timedelta(days=365))
+    assert stats['max_storage'] == 1000.0 + 10 * 399
+    assert 365 <= stats['data_points'] <= 366
+
+
+def test_init_db_rolls_up_readings_stored_before_rollups(client, db):
+    # Raw readings only, as in a database from before the rollup tables
+    start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(days=2)
+    get_store().write(db, [{
+        'reservoir_code': code, 'timestamp': timestamp, 'reservoir_elevation': elevation,
+        'storage': storage, 'storage_percent': None, 'data_source': 'CDEC',
+    } for code, timestamp, elevation, storage in _readings(start, 8, timedelta(hours=1))])
+    db.commit()
+    
+    # Until they are rolled up, hourly queries read the raw readings
+    assert len(query_series(db, 'BER', start, 'hour')) == 8
+    
+    init_db()
+    assert db.query(ReservoirRollupHourly).count() == 8
+    body = client.get('/api/reservoir/BER/data').get_json()
+    assert body['resolution'] == 'hour'
+    assert [point['storage'] for point in body['data']] == [1000.0 + 10 * i for i in range(8)]
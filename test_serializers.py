@@ -0,0 +1,52 @@
+"""
+Tests for columnar/binary series serialization and response compression
+"""
+from datetime import datetime, timedelta
+import gzip
+import math
+
+from serializers import pack_series, series_columns, unpack_series
+
+SERIES = [
+    (datetime(2024, 1, 1, 0, 0), 438.1, 1486000.0, None),
+    (datetime(2024, 1, 1, 1, 0), None, 1486100.0, 92.8),
+]
+
+
+def test_columnar_uses_epoch_seconds():
+    columns = series_columns(SERIES)
+    assert columns['timestamp'] == [1704067200, 1704070800]
+    assert columns['reservoir_elevation'] == [438.1, None]
+    assert columns['storage_percent'] == [None, 92.8]
+    assert series_columns([])['storage'] == []
+
+
+def test_binary_round_trip():
+    unpacked = unpack_series(pack_series(SERIES))
+    assert unpacked['timestamp'].tolist() == [1704067200.0, 1704070800.0]
+    assert unpacked['storage'].tolist() == [1486000.0, 1486100.0]
+    assert math.isnan(unpacked['reservoir_elevation'][1])
+    assert len(unpack_series(pack_series([]))['storage']) == 0
+
+
+def test_data_formats_and_gzip(client):
+    from collector import ReservoirCollector
+    
+    now = datetime.utcnow().replace(microsecond=0)
+    ReservoirCollector().save_batch(
+        [('BER', now - timedelta(minutes=15 * i), 438.0, 1486000.0 + i) for i in range(200)]
+    )
+    rows = client.get('/api/reservoir/BER/data?days=3&resolution=raw').get_json()['data']
+    columnar = client.get('/api/reservoir/BER/data?days=3&resolution=raw&format=columnar').get_json()
+    binary = client.get('/api/reservoir/BER/data?days=3&resolution=raw&format=binary')
+    
+    assert columnar['columns']['storage'] == [row['storage'] for row in rows]
+    assert unpack_series(binary.get_data())['storage'].tolist() == [row['storage'] for row in rows]
+    assert binary.headers['X-Resolution'] == 'raw'
+    
+    compressed = client.get('/api/reservoir/BER/data?days=3&resolution=raw',
+                            headers={'Accept-Encoding': 'gzip, deflate'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.get_data()) == client.get('/api/reservoir/BER/data?days=3&resolution=raw').get_data()
+    assert client.get('/api/reservoir/BER/data?days=3&format=xml').status_code == 400
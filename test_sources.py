@@ -0,0 +1,121 @@
+"""
+Tests for the data source registry, fetch planner and CDEC bulk data services
+"""
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import config
+from collector import ReservoirCollector
+from sources import get_source, plan_fetches
+
+FIXTURE_DIR = Path(__file__).parent / 'fixtures' / 'cdec'
+
+
+def test_planner_groups_bulk_stations_and_dedupes_urls(monkeypatch):
+    reservoirs = {f'S{i:03d}': {'station_id': f'S{i:03d}'} for i in range(120)}
+    reservoirs['S000']['usbr_name'] = 'Shasta'
+    reservoirs['S001']['usbr_name'] = 'Folsom'
+    # Two codes for one station page, collected from the HTML page only
+    shared = 'https://cdec.example/QueryF?s=SHA'
+    reservoirs['A'] = {'cdec_query_url': shared, 'sources': ['cdec_query']}
+    reservoirs['B'] = {'cdec_query_url': shared, 'sources': ['cdec_query']}
+    monkeypatch.setattr(config, 'RESERVOIRS', reservoirs)
+    monkeypatch.setattr(config, 'COLLECTION_SOURCES', ['cdec_csv', 'usbr'])
+    monkeypatch.setattr(config, 'CDEC_BULK_MAX_STATIONS', 50)
+    
+    fetches = plan_fetches(list(reservoirs))
+    by_source = {}
+    for fetch in fetches:
+        by_source.setdefault(fetch.source.name, []).append(fetch)
+    
+    assert [len(fetch.codes) for fetch in by_source['cdec_csv']] == [50, 50, 20]
+    assert 'Stations=S000,S001,S002,' in by_source['cdec_csv'][0].url
+    assert [(fetch.url, fetch.codes) for fetch in by_source['usbr']] == [(config.USBR_URL, ('S000', 'S001'))]
+    assert [(fetch.url, fetch.codes) for fetch in by_source['cdec_query']] == [(shared, ('A', 'B'))]
+    
+    with pytest.raises(ValueError):
+        get_source('carrier_pigeon')
+
+
+def test_collect_all_from_replay_file(db, tmp_path, monkeypatch):
+    replay = tmp_path / 'readings.csv'
+    replay.write_text(
+        'reservoir_code,timestamp,reservoir_elevation,storage\n'
+        'BER,2025-01-01 01:00:00,401.0,1001.0\n'
+        'BER,2025-01-01 00:00:00,400.0,1000.0\n'
+        'XYZ,2025-01-01 00:00:00,1.0,2.0\n'
+        'ORO,2025-01-01 00:00:00,,2000.0\n'
+    )
+    monkeypatch.setattr(config, 'REPLAY_FILE', str(replay))
+    monkeypatch.setattr(config, 'COLLECTION_SOURCES', ['replay'])
+    collector = ReservoirCollector()
+    
+    results = collector.collect_all(codes=['BER', 'ORO'], concurrent=False)
+    assert results['BER'].timestamp == datetime(2025, 1, 1, 1)
+    assert (results['BER'].storage, results['BER'].data_source) == (1001.0, 'REPLAY')
+    assert (results['ORO'].reservoir_elevation, results['ORO'].storage) == (None, 2000.0)
+    assert collector.load_saved([('BER', datetime(2025, 1, 1))])
+
+
+@pytest.fixture
+def cdec_server():
+    """Local stand-in for CDEC serving the recorded data service responses and QueryF pages"""
+    requests_seen = []
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            url = urlparse(self.path)
+            if url.path.endswith('DataServlet'):
+                name = 'CSVDataServlet_BER_ORO.csv' if 'CSV' in url.path else 'JSONDataServlet_BER_ORO.json'
+            else:
+                name = f"QueryF_{parse_qs(url.query)['s'][0]}.html"
+            path = FIXTURE_DIR / name
+            if not path.exists():
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = path.read_bytes()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}', requests_seen
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('service', ['csv', 'json'])
+def test_bulk_collection_with_html_fallback(db, cdec_server, monkeypatch, service):
+    base, requests_seen = cdec_server
+    monkeypatch.setattr(config, 'CDEC_CSV_URL', f'{base}/dynamicapp/req/CSVDataServlet')
+    monkeypatch.setattr(config, 'CDEC_JSON_URL', f'{base}/dynamicapp/req/JSONDataServlet')
+    monkeypatch.setattr(config, 'COLLECTION_SOURCES', [f'cdec_{service}'])
+    # FOL is not in the recorded bulk response, so it is read from its QueryF page (the BER fixture)
+    monkeypatch.setattr(config, 'RESERVOIRS', {
+        'BER': {'station_id': 'BER'}, 'ORO': {'station_id': 'ORO'},
+        'FOL': {'station_id': 'FOL', 'cdec_query_url': f'{base}/dynamicapp/QueryF?s=BER'},
+    })
+    collector = ReservoirCollector()
+    
+    results = collector.collect_all()
+    assert (results['BER'].timestamp, results['BER'].storage) == (datetime(2025, 11, 15, 20), 1460076.0)
+    assert (results['ORO'].reservoir_elevation, results['ORO'].storage) == (778.4, 2144242.0)
+    assert results['FOL'].storage == 1460076.0
+    assert len(requests_seen) == 2
+    assert 'Stations=BER,ORO,FOL' in requests_seen[0] and requests_seen[1].endswith('QueryF?s=BER')
+    # Every hour in the response is stored, not only the newest
+    assert len(collector.load_saved([('BER', datetime(2025, 11, 15, hour)) for hour in range(17, 21)])) == 4
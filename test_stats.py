@@ -0,0 +1,94 @@
+"""
+Tests for the vectorized reservoir statistics engine
+"""
+from datetime import date, datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from collector import ReservoirCollector
+from database import ReservoirRollupDaily
+from stats import calendar_day, day_stats, load_daily_storage
+
+
+def _history(start, end):
+    """Daily storage that rises 1,000 AF per year on top of a seasonal cycle"""
+    index = pd.date_range(start, end, freq='D')
+    seasonal = 50000 * np.sin(2 * np.pi * calendar_day(index) / 365)
+    return pd.Series(100000 + 1000 * (index.year - index[0].year) + seasonal, index=index)
+
+
+def test_day_stats_over_forty_years():
+    storage = _history('1985-01-01', '2025-06-15')
+    
+    started = time.perf_counter()
+    stats = day_stats(storage, date(2025, 6, 15))
+    assert time.perf_counter() - started < 0.5
+    
+    # One same-day value per earlier year, each 1,000 AF above the year before
+    yearly = stats['yearly']
+    assert len(yearly) == 40
+    assert np.allclose(np.diff(yearly), 1000)
+    assert stats['year_ago'] == storage[pd.Timestamp('2024-06-15')]
+    assert stats['first_year'] == 1985
+    window = storage['2024-06-16':'2025-06-15']
+    assert stats['percentiles']['p50'] == np.percentile(window, 50)
+    
+    # Leap days share Mar 1's slot, so every year lines up on the same calendar day
+    assert calendar_day(pd.DatetimeIndex(['2024-03-01', '2023-03-01', '2024-02-29'])).tolist() == [60, 60, 60]
+
+
+def test_day_stats_norm_windows_across_new_year():
+    storage = pd.Series(100000.0, index=pd.date_range('2020-01-01', '2025-01-10', freq='D'))
+    storage['2024-12-29':'2025-01-03'] = 1e9  # the current season, around the target days
+    
+    # Dec 29-31 2024 are in Jan 1 2025's own window, not 2024's
+    yearly = day_stats(storage, date(2025, 1, 1))['yearly']
+    assert len(yearly) == 5 and np.allclose(yearly, 100000)
+    
+    # Jan 1-3 of the following year count toward each earlier Dec 31 (back to Dec 31 2019)
+    yearly = day_stats(storage, date(2024, 12, 31))['yearly']
+    assert len(yearly) == 5 and np.allclose(yearly, 100000)
+
+
+def test_stats_endpoint_reports_norms_and_year_over_year(client, db):
+    history = _history('2022-01-01', '2024-12-31')
+    db.bulk_insert_mappings(ReservoirRollupDaily, [{
+        'reservoir_code': 'BER', 'bucket_start': day.to_pydatetime(), 'sample_count': 1,
+        'storage_sum': value, 'storage_count': 1, 'elevation_count': 0,
+    } for day, value in history.items()])
+    db.commit()
+    assert load_daily_storage(db, 'BER').equals(history.rename_axis('bucket_start').rename('storage'))
+    
+    current = datetime(2025, 1, 1, 12)
+    ReservoirCollector().save_batch([('BER', current, 400.0, 200000.0)])
+    body = client.get('/api/reservoir/BER/stats').get_json()
+    
+    historical = body['historical']
+    assert historical['years'] == 3 and historical['since_year'] == 2022
+    assert historical['percentile_rank'] == 100.0
+    assert historical['day_of_year_median'] > 0
+    assert historical['percent_of_median'] == round(200000.0 / historical['day_of_year_median'] * 100, 1)
+    
+    year_ago = history[pd.Timestamp('2024-01-01')]
+    assert body['year_over_year'] == {
+        'storage_year_ago': year_ago,
+        'change': 200000.0 - year_ago,
+        'percent_change': round((200000.0 - year_ago) / year_ago * 100, 1),
+    }
+    assert set(body['percentiles']) == {'p10', 'p25', 'p50', 'p75', 'p90'}
+    assert body['current']['storage'] == 200000.0
+
+
+def test_stats_follow_newly_stored_readings(client):
+    collector = ReservoirCollector()
+    day = datetime(2025, 1, 1, 12)
+    collector.save_batch([('BER', day - pd.Timedelta(days=i), 400.0, 100000.0) for i in range(10, 0, -1)])
+    collector.save_batch([('BER', day, 400.0, 150000.0)])
+    before = client.get('/api/reservoir/BER/stats').get_json()['percentiles']
+    
+    # A backfill of the same period, same day
+    collector.save_batch([('BER', day - pd.Timedelta(days=i, hours=6), 400.0, 50000.0) for i in range(10, 0, -1)])
+    after = client.get('/api/reservoir/BER/stats').get_json()['percentiles']
+    assert after['p10'] < before['p10'] == 100000.0
@@ -0,0 +1,103 @@
+"""
+Tests for the raw reading storage backends in storage.py
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, inspect
+
+import config
+import database
+from collector import ReservoirCollector
+from storage import PARTITION_PREFIX, copy_readings, get_store
+
+
+def _rows(code, start, count, step=timedelta(hours=6)):
+    return [{
+        'reservoir_code': code,
+        'timestamp': start + step * i,
+        'reservoir_elevation': 400.0 + i,
+        'storage': 1000.0 + i,
+        'storage_percent': None,
+        'data_source': 'CDEC',
+    } for i in range(count)]
+
+
+@pytest.fixture(params=['sql', 'partitioned'])
+def store(request, db, monkeypatch):
+    monkeypatch.setattr(config, 'STORAGE_BACKEND', request.param)
+    return get_store()
+
+
+def test_store_round_trip(db, store):
+    start = datetime(2024, 1, 20)
+    rows = _rows('BER', start, 120) + _rows('ORO', start, 10)  # BER spans Jan..Feb
+    assert store.write(db, rows) == 130
+    assert store.write(db, _rows('BER', start + timedelta(days=29), 10)) == 6  # 4 already stored
+    db.commit()
+    
+    series = store.series(db, ['BER', 'ORO'], datetime(2024, 1, 31), datetime(2024, 2, 2))
+    assert [point[0] for point in series['BER']] == [datetime(2024, 1, 31) + timedelta(hours=6 * i) for i in range(8)]
+    assert series['ORO'] == []
+    
+    latest = store.latest(db, ['BER', 'ORO', 'XXX'])
+    assert latest['BER'].timestamp == start + timedelta(days=31, hours=6)
+    assert (latest['ORO'].storage, latest['ORO'].data_source) == (1009.0, 'CDEC')
+    assert latest['XXX'] is None
+    
+    keys = [('BER', start), ('BER', datetime(2024, 2, 1)), ('ORO', datetime(1999, 1, 1))]
+    assert set(store.load(db, keys)) == set(keys[:2])
+    assert store.bounds(db, 'ORO') == (start, start + timedelta(hours=54))
+    assert sorted(store.codes(db)) == ['BER', 'ORO']
+
+
+def test_partitioned_range_query_reads_only_covered_months(db, monkeypatch):
+    monkeypatch.setattr(config, 'STORAGE_BACKEND', 'partitioned')
+    store = get_store()
+    store.write(db, _rows('BER', datetime(2024, 1, 1), 4 * 91))  # Jan..Mar
+    db.commit()
+    assert sorted(name for name in inspect(database.engine).get_table_names() if name.startswith(PARTITION_PREFIX)) == [
+        'readings_ber_202401', 'readings_ber_202402', 'readings_ber_202403',
+    ]
+    
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(database.engine, 'before_cursor_execute', record)
+    try:
+        points = store.series(db, ['BER'], datetime(2024, 2, 10), datetime(2024, 2, 20))['BER']
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', record)
+    assert len(points) == 40
+    touched = {table for statement in statements for table in
+               ('readings_ber_202401', 'readings_ber_202402', 'readings_ber_202403') if table in statement}
+    assert touched == {'readings_ber_202402'}
+
+
+def test_retention_drops_whole_months(db, store, tmp_path):
+    store.write(db, _rows('BER', datetime(2024, 1, 1), 4 * 91))
+    db.commit()
+    
+    dropped = store.apply_retention(db, datetime(2024, 3, 15), archive_dir=tmp_path)
+    db.commit()
+    assert dropped == 2  # January and February; March is only partly past the cutoff
+    assert store.bounds(db, 'BER')[0] == datetime(2024, 3, 1)
+    assert (tmp_path / 'BER' / '2024-01.csv.gz').exists()
+    if store.name == 'partitioned':
+        assert 'readings_ber_202401' not in inspect(database.engine).get_table_names()
+
+
+def test_collector_and_api_use_configured_backend(client, db, monkeypatch):
+    monkeypatch.setattr(config, 'STORAGE_BACKEND', 'partitioned')
+    now = datetime.utcnow().replace(microsecond=0)
+    readings = [('BER', now - timedelta(hours=6 * i), 400.0 + i, 1000.0 + i) for i in range(8)]
+    assert ReservoirCollector().save_batch(readings) == 8
+    assert db.query(database.ReservoirData).count() == 0
+    
+    latest = client.get('/api/reservoir/BER/latest').get_json()
+    assert (latest['timestamp'], latest['storage']) == (now.isoformat(), 1000.0)
+    raw = client.get('/api/reservoir/BER/data?days=3&resolution=raw').get_json()['data']
+    assert len(raw) == 8
+    
+    # And the data can be moved back into the single table
+    assert copy_readings(get_store('partitioned'), get_store('sql')) == 8
+    assert db.query(database.ReservoirData).count() == 8
@@ -0,0 +1,81 @@
+"""
+Tests for pushing new readings to dashboards over Server-Sent Events
+"""
+from datetime import datetime, timedelta
+import json
+
+from collector import ReservoirCollector
+from metadata import storage_percent
+from stream import ReadingBroadcaster, broadcaster
+
+NOW = datetime(2025, 3, 1, 12)
+
+
+def _save(*readings):
+    assert ReservoirCollector().save_batch(list(readings)) == len(readings)
+
+
+def test_broadcaster_publishes_only_rows_past_the_high_water_mark(db):
+    _save(('BER', NOW, 400.0, 1000.0), ('ORO', NOW, 800.0, 2000.0))
+    hub = ReadingBroadcaster(['BER', 'ORO'], poll_seconds=60, queue_size=1)
+    everything, oro_only = hub.subscribe(), hub.subscribe(['ORO'])
+    assert hub.poll_once() is None
+    
+    _save(('BER', NOW + timedelta(hours=1), 401.0, 1001.0), ('BER', NOW + timedelta(hours=2), 402.0, 1002.0))
+    event = hub.poll_once()
+    assert event['readings'] == {'BER': [
+        (NOW + timedelta(hours=1), 401.0, 1001.0, storage_percent('BER', 1001.0)),
+        (NOW + timedelta(hours=2), 402.0, 1002.0, storage_percent('BER', 1002.0)),
+    ]}
+    assert everything.queue.get_nowait() is event
+    assert oro_only.queue.empty()
+    assert hub.poll_once() is None
+    
+    # A subscriber whose queue is full is dropped rather than slowing everyone down
+    for day in (1, 2):
+        _save(('ORO', NOW + timedelta(days=day), 800.0 + day, 2000.0 + day))
+        hub.poll_once()
+        everything.queue.get_nowait()
+    assert oro_only.dropped and hub.stats()['subscribers'] == 1
+
+
+def test_broadcaster_sends_only_newest_reading_for_a_reservoir_that_started_empty(db):
+    _save(('BER', NOW, 400.0, 1000.0))
+    hub = ReadingBroadcaster(['BER', 'ORO'], poll_seconds=60)
+    hub.subscribe()
+    
+    # A backfill into the empty reservoir is not replayed to every client
+    _save(*[('ORO', NOW - timedelta(days=day), 800.0 - day, 2000.0 - day) for day in range(30)])
+    event = hub.poll_once()
+    assert event['readings'] == {'ORO': [(NOW, 800.0, 2000.0, storage_percent('ORO', 2000.0))]}
+    
+    _save(('ORO', NOW + timedelta(hours=1), 801.0, 2001.0))
+    assert hub.poll_once()['readings'] == {'ORO': [
+        (NOW + timedelta(hours=1), 801.0, 2001.0, storage_percent('ORO', 2001.0)),
+    ]}
+
+
+def test_stream_endpoint_pushes_new_readings(client, monkeypatch):
+    monkeypatch.setattr(broadcaster, 'poll_seconds', 0.05)
+    _save(('BER', NOW, 400.0, 1000.0))
+    
+    response = client.get('/api/stream?codes=BER')
+    assert response.mimetype == 'text/event-stream'
+    frames = iter(response.response)
+    assert next(frames).startswith(b'retry:')
+    
+    _save(('BER', NOW + timedelta(hours=1), 401.0, 1001.0))
+    lines = next(frames).decode().splitlines()
+    assert lines[1] == 'event: readings'
+    assert json.loads(lines[2][len('data: '):]) == {'BER': [{
+        'timestamp': (NOW + timedelta(hours=1)).isoformat(),
+        'reservoir_elevation': 401.0, 'storage': 1001.0, 'storage_percent': storage_percent('BER', 1001.0),
+    }]}
+    
+    response.close()
+    assert broadcaster.stats()['subscribers'] == 0
+
+
+def test_stream_endpoint_refuses_past_client_limit(client, monkeypatch):
+    monkeypatch.setattr(broadcaster, 'max_clients', 0)
+    assert client.get('/api/stream').status_code == 503
@@ -0,0 +1,36 @@
+"""
+Tests for the synthetic history generator
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database import ReservoirRollupDaily
+from synthetic import fill_history, generate_series, reservoir_codes
+
+END = datetime(2025, 1, 1)
+
+
+def test_generated_series_is_seasonal_and_repeatable():
+    start = END - timedelta(days=365 * 10)
+    timestamps, elevation, storage, capacity = generate_series('BER', start, END, timedelta(hours=1))
+    assert len(timestamps) == 365 * 10 * 24
+    assert storage.max() <= capacity and storage.min() > 0
+    assert np.corrcoef(storage, elevation)[0, 1] > 0.99  # elevation follows storage
+    
+    months = timestamps.astype('datetime64[M]').astype(int) % 12 + 1
+    assert storage[months == 5].mean() > storage[months == 11].mean()
+    assert np.array_equal(generate_series('BER', start, END, timedelta(hours=1))[2], storage)
+    assert not np.array_equal(generate_series('ORO', start, END, timedelta(hours=1))[2], storage)
+
+
+def test_fill_history_writes_readings_and_rollups(client, db):
+    codes = reservoir_codes(3)
+    assert codes == ['BER', 'ORO', 'R003']
+    
+    assert fill_history(codes, years=2, interval=timedelta(hours=6), end=END) == 3 * 730 * 4
+    assert db.query(ReservoirRollupDaily).filter_by(reservoir_code='R003').count() == 730
+    body = client.get('/api/reservoir/R003/stats').get_json()
+    # Dec 31 2023 and, through Jan 2-3 2023, Dec 31 2022 are the earlier same days
+    assert (body['historical']['since_year'], body['historical']['years']) == (2023, 2)
+    assert body['current']['timestamp'] == (END - timedelta(hours=6)).isoformat()